@@ -0,0 +1,134 @@
+"""
+Benchmark the scaling of ``CFANetCDF.create`` with the number of files along the
+aggregated ``time`` dimension.
+
+The summary of each file is generated in memory in place of ``_scan_file``, so only the
+merge of the file summaries in the first pass and the arrangement of the fragments is
+timed, without the cost of opening the files. Each file was previously checked against
+every earlier fragment start, and placed in the fragment space by a search of the list
+of starts, so creation time grew with the square of the number of files. Both are now
+hash lookups, so the time per file should be close to constant and the fitted exponent
+of the time against the number of files close to 1.
+
+Run with ``python benchmarks/bench_create.py [max_files]``
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from cfapyx import CFANetCDF
+
+SIZES = (1000, 3000, 10000, 30000, 100000)
+
+# Time steps in each file.
+STEPS = 4
+
+class _Attributes:
+    """
+    Attributes of a generated dimension or variable, as given by ``_scan_file``.
+    """
+
+    def __init__(self, name, attrs):
+        self.name   = name
+        self._attrs = attrs
+
+    def ncattrs(self):
+        return list(self._attrs.keys())
+
+    def getncattr(self, attr):
+        return self._attrs[attr]
+
+def file_summary(index: int, step: int) -> dict:
+    """
+    The summary of the file at ``index`` in the file list, holding the ``STEPS`` time
+    steps from ``step`` on a fixed latitude axis, in the form returned by ``_scan_file``
+    with ``agg_dims=['time']``.
+    """
+    time_values = np.arange(step * STEPS, (step + 1) * STEPS, dtype=np.float64)
+
+    dim_info = [(
+        'time',
+        {'size': None, 'type': 'coord', 'dtype': time_values.dtype, 'f_size': None},
+        {'sizes': STEPS, 'starts': time_values[0], 'arrays': time_values},
+        _Attributes('time', {'units': 'days since 2000-01-01'}),
+    )]
+
+    latitude = None
+    if index == 0:
+        latitude = np.linspace(-90, 90, 4)
+        latitude = {'sizes': 4, 'starts': latitude[0], 'arrays': latitude}
+
+    dim_info.append((
+        'latitude',
+        {'size': None, 'type': 'coord', 'dtype': np.dtype(np.float64), 'f_size': None},
+        latitude,
+        _Attributes('latitude', {'units': 'degrees_north'}),
+    ))
+
+    var_info = [(
+        'p',
+        {
+            'dtype': np.dtype(np.float32),
+            'dims': ('time', 'latitude'),
+            'cdims': ['time', 'latitude'],
+            'identifiers': 'p',
+            '_FillValue': None,
+        },
+        _Attributes('p', {'units': 'K'}),
+    )]
+
+    return {
+        'is_aggregated': False,
+        'dims': ['time', 'latitude'],
+        'coord_variables': ['time', 'latitude'],
+        'pure_dimensions': [],
+        'variables': ['p'],
+        'ncattrs': {'title': 'Synthetic fragment'},
+        'dim_info': dim_info,
+        'var_info': var_info,
+        'statistics': None,
+        'values': {},
+    }
+
+class SyntheticCFANetCDF(CFANetCDF):
+    """
+    ``CFANetCDF`` over generated file summaries, given in reverse order so the
+    fragments must be sorted.
+    """
+
+    def _scan_files(self, **kwargs):
+        nfiles = len(self.files)
+        for index in range(nfiles):
+            yield file_summary(index, nfiles - 1 - index)
+
+def time_create(nfiles: int) -> float:
+    files = [f'/synthetic/fragment_{x:06d}.nc' for x in reversed(range(nfiles))]
+
+    cfa = SyntheticCFANetCDF(files)
+
+    t0 = time.perf_counter()
+    cfa.create(agg_dims=['time'])
+    elapsed = time.perf_counter() - t0
+
+    assert cfa.dim_info['time']['size'] == nfiles * STEPS
+    assert cfa.location[0] == files[-1]
+    return elapsed
+
+def main(max_files: int = SIZES[-1]):
+    sizes = [n for n in SIZES if n <= max_files]
+
+    print(f'{"files":>8} {"create (s)":>12} {"per file (us)":>14}')
+    timings = []
+    for nfiles in sizes:
+        elapsed = time_create(nfiles)
+        timings.append(elapsed)
+        print(f'{nfiles:>8} {elapsed:>12.3f} {1e6 * elapsed / nfiles:>14.1f}')
+
+    if len(sizes) > 1:
+        exponent = np.polyfit(np.log(sizes), np.log(timings), 1)[0]
+        print(f'Fitted exponent of time against files: {exponent:.2f}')
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:2]))
@@ -0,0 +1,106 @@
+"""
+Benchmark the decoding of fragment metadata when opening a CFA file.
+
+Compares the previous per-fragment construction of ``fragment_info`` (nested loops over 
+every fragment position building slice objects and dictionaries) against the vectorised 
+``get_fragment_extents`` and columnar ``FragmentTable``, for synthetic aggregations of 
+1e4, 1e5 and 1e6 fragments. The legacy decoding is skipped above 1e5 fragments.
+
+Run with ``python benchmarks/bench_decoding.py``
+"""
+
+import time
+from itertools import accumulate, product
+
+import numpy as np
+
+from cfapyx.decoder import (FragmentTable, get_fragment_bounds,
+                            get_fragment_extents, get_string_table)
+
+FRAGMENT_SIZE = 10
+LEGACY_LIMIT  = int(1e5)
+
+def legacy_fragment_info(fragment_size_per_dim, array_shape, location, address):
+    """
+    The previous decoding - descriptors built for every fragment position with nested
+    Python loops, followed by one dictionary per fragment.
+    """
+    fragmented_dims = [i for i in range(len(fragment_size_per_dim)) if len(fragment_size_per_dim[i]) != 1]
+
+    dim_indices = []
+    for dim, fs in enumerate(fragment_size_per_dim):
+        fsa = tuple(accumulate((0,) + tuple(fs)))
+        dim_indices.append([slice(i, j) for i, j in zip(fsa[:-1], fsa[1:])])
+
+    f_indices = [
+        (slice(None),) * len(u) if dim in fragmented_dims else u 
+        for dim, u in enumerate(dim_indices)
+    ]
+    f_shapes = [
+        fs if dim in fragmented_dims else (size,) * len(fs)
+        for dim, (fs, size) in enumerate(zip(fragment_size_per_dim, array_shape))
+    ]
+
+    fragment_info = {}
+    for frag_pos in product(*(range(len(fs)) for fs in fragment_size_per_dim)):
+        fragment_info[frag_pos] = {
+            'shape': [f_shapes[a][i] for a, i in enumerate(frag_pos)],
+            'location': location[frag_pos],
+            'address': address[frag_pos],
+            'extent': [f_indices[a][i] for a, i in enumerate(frag_pos)],
+            'global_extent': [dim_indices[a][i] for a, i in enumerate(frag_pos)],
+        }
+    return fragment_info
+
+def table_fragment_info(fragment_size_per_dim, array_shape, location, address):
+    """
+    The current decoding - integer offsets per dimension and indices into tables of
+    unique locations and addresses.
+    """
+    fragment_space = tuple(len(fs) for fs in fragment_size_per_dim)
+    starts, stops  = get_fragment_bounds(fragment_size_per_dim)
+
+    locations, location_index = get_string_table(location, fragment_space)
+    addresses, address_index  = get_string_table(address, fragment_space)
+
+    return FragmentTable(
+        starts, stops,
+        locations=locations, location_index=location_index,
+        addresses=addresses, address_index=address_index,
+    )
+
+def synthetic_inputs(nfragments):
+    fragment_size_per_dim = [[FRAGMENT_SIZE]*nfragments, [90], [180]]
+    array_shape = (nfragments*FRAGMENT_SIZE, 90, 180)
+
+    location = np.empty((nfragments, 1, 1), dtype=object)
+    location[:, 0, 0] = [f'/data/fragment_{x}.nc' for x in range(nfragments)]
+    address  = np.full((nfragments, 1, 1), 'p', dtype=object)
+    return fragment_size_per_dim, array_shape, location, address
+
+def timed(func, *args):
+    t0 = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - t0, result
+
+def main():
+    print(f'{"fragments":>10} {"legacy (s)":>12} {"table (s)":>10} {"extents (s)":>12} {"speedup":>9}')
+    for nfragments in (int(1e4), int(1e5), int(1e6)):
+        inputs = synthetic_inputs(nfragments)
+
+        t_table, table = timed(table_fragment_info, *inputs)
+        t_extents, _   = timed(get_fragment_extents, *inputs[:2])
+
+        if nfragments > LEGACY_LIMIT:
+            print(f'{nfragments:>10} {"-":>12} {t_table:>10.4f} {t_extents:>12.4f} {"-":>9}')
+            continue
+
+        t_legacy, ref = timed(legacy_fragment_info, *inputs)
+
+        for pos in [(0,0,0), (nfragments//2,0,0), (nfragments-1,0,0)]:
+            assert table[pos] == ref[pos], 'Table decoding differs from legacy decoding'
+
+        print(f'{nfragments:>10} {t_legacy:>12.4f} {t_table:>10.4f} {t_extents:>12.4f} {t_legacy/t_table:>8.0f}x')
+
+if __name__ == '__main__':
+    main()
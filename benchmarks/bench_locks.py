@@ -0,0 +1,124 @@
+"""
+Benchmark fragment read throughput under the threaded dask scheduler.
+
+Reads a synthetic aggregation of compressed netCDF fragment files with each dask chunk
+covering one time step, comparing:
+
+ - ``synchronous``: Single-threaded reads, for reference.
+ - ``global``: Per-file locks plus the global netCDF/HDF5 lock, so all reads are
+   serialised.
+ - ``default``: Per-file locks, with the global lock only if the HDF5 build is not
+   thread-safe (see ``cfapyx.locks.library_threadsafe``).
+ - ``per-file``: Per-file locks only, so threads reading different fragment files
+   proceed concurrently. Only run with a thread-safe HDF5 build, where it matches
+   ``default``.
+ - ``processes``: Reads dispatched to a pool of worker processes, each with its own
+   global lock, with the data returned through shared memory.
+
+Run with ``python benchmarks/bench_locks.py [nfragments] [workers]``
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import dask
+import netCDF4
+import numpy as np
+
+from cfapyx import get_lock_manager, get_process_reader
+from cfapyx.locks import library_threadsafe
+from cfapyx.decoder import FragmentTable, get_fragment_bounds
+from cfapyx.wrappers import FragmentArrayWrapper
+
+FRAGMENT_SHAPE = (4, 256, 256)
+
+def write_fragments(directory, nfragments, fragment_shape=FRAGMENT_SHAPE):
+    """
+    Write ``nfragments`` compressed fragment files of random data along the time dimension.
+    """
+    rng = np.random.default_rng(0)
+    locations = []
+    for x in range(nfragments):
+        location = os.path.join(directory, f'fragment_{x}.nc')
+        with netCDF4.Dataset(location, 'w') as ds:
+            for name, size in zip(('time', 'latitude', 'longitude'), fragment_shape):
+                ds.createDimension(name, size)
+            var = ds.createVariable(
+                'p', 'f4', ('time', 'latitude', 'longitude'), zlib=True, complevel=4
+            )
+            var[:] = rng.random(fragment_shape, dtype=np.float32)
+        locations.append(location)
+    return locations
+
+def fragment_wrapper(locations, options, fragment_shape=FRAGMENT_SHAPE):
+    """
+    Construct a FragmentArrayWrapper over the fragment files at ``locations``.
+    """
+    nfragments = len(locations)
+    fragment_size_per_dim = [[fragment_shape[0]]*nfragments, [fragment_shape[1]], [fragment_shape[2]]]
+    array_shape = (nfragments*fragment_shape[0],) + fragment_shape[1:]
+
+    starts, stops = get_fragment_bounds(fragment_size_per_dim)
+
+    fragment_info = FragmentTable(
+        starts, stops,
+        locations=locations,
+        location_index=np.arange(nfragments, dtype=np.int32).reshape((nfragments, 1, 1)),
+        addresses=['p'],
+        address_index=np.zeros((nfragments, 1, 1), dtype=np.int32),
+    )
+
+    return FragmentArrayWrapper(
+        fragment_info,
+        (nfragments, 1, 1),
+        shape=array_shape,
+        units='',
+        dtype=np.dtype('float32'),
+        cfa_options={'chunks': {'time': 1}, 'max_open_files': 0} | options,
+        named_dims=('time', 'latitude', 'longitude'),
+    )
+
+def throughput(locations, options, scheduler, workers):
+    """
+    Read the whole aggregation, returning the time taken and the rate in MB/s.
+    """
+    darr = fragment_wrapper(locations, options).__array__()
+
+    with dask.config.set(scheduler=scheduler, num_workers=workers):
+        # Start any worker processes outside the timed read.
+        darr[:workers].compute()
+
+        t0 = time.perf_counter()
+        data = darr.compute()
+        elapsed = time.perf_counter() - t0
+
+    return elapsed, data.nbytes / elapsed / 1e6
+
+def main(nfragments=32, workers=8):
+    modes = [
+        ('synchronous', {}, 'synchronous'),
+        ('global', {'global_lock': True}, 'threads'),
+        ('default', {}, 'threads'),
+        ('processes', {'processes': workers}, 'threads'),
+    ]
+    if library_threadsafe():
+        modes.insert(3, ('per-file', {'global_lock': False}, 'threads'))
+
+    with tempfile.TemporaryDirectory() as directory:
+        locations = write_fragments(directory, nfragments)
+
+        print(f'{nfragments} fragments, {workers} workers')
+        print(f'HDF5 thread-safe: {library_threadsafe()}')
+        print(f'{"mode":>12} {"time (s)":>10} {"MB/s":>10} {"contended":>10}')
+        for name, options, scheduler in modes:
+            get_lock_manager().reset_stats()
+            elapsed, rate = throughput(locations, options, scheduler, workers)
+            contended = get_lock_manager().stats()['contended']
+            print(f'{name:>12} {elapsed:>10.3f} {rate:>10.1f} {contended:>10}')
+
+    get_process_reader().shutdown()
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
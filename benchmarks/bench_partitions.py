@@ -0,0 +1,102 @@
+"""
+Benchmark the partition-to-fragment mapping in ``FragmentArrayWrapper._create_partitions``.
+
+Compares the vectorised mapping against the previous per-partition search over the 
+cumulative fragment coverage, for synthetic aggregations of 1e3, 1e4 and 1e5 partitions.
+
+Run with ``python benchmarks/bench_partitions.py``
+"""
+
+import time
+
+import numpy as np
+
+from cfapyx.decoder import FragmentTable, get_fragment_bounds
+from cfapyx.wrappers import FragmentArrayWrapper
+
+FRAGMENT_SIZE = 100
+
+def synthetic_wrapper(nfragments, fragment_size=FRAGMENT_SIZE, chunks=None):
+    """
+    Construct a FragmentArrayWrapper over a 1D time-aggregated array with ``nfragments``
+    fragments, without any fragment files.
+    """
+    fragment_size_per_dim = [[fragment_size]*nfragments, [10], [10]]
+    array_shape = (nfragments*fragment_size, 10, 10)
+
+    starts, stops = get_fragment_bounds(fragment_size_per_dim)
+
+    fragment_info = FragmentTable(
+        starts, stops,
+        locations=[f'fragment_{x}.nc' for x in range(nfragments)],
+        location_index=np.arange(nfragments, dtype=np.int32).reshape((nfragments, 1, 1)),
+        addresses=['p'],
+        address_index=np.zeros((nfragments, 1, 1), dtype=np.int32),
+    )
+
+    return FragmentArrayWrapper(
+        fragment_info,
+        (nfragments, 1, 1),
+        shape=array_shape,
+        units='',
+        dtype=np.dtype('float32'),
+        cfa_options={'chunks': chunks or {'time': 1}},
+        named_dims=('time', 'latitude', 'longitude'),
+    )
+
+def legacy_map_partitions(dask_chunks, fragment_coverage, fragment_starts):
+    """
+    The previous mapping - a linear search over the cumulative fragment coverage
+    for every partition index.
+    """
+    def outer_cumsum(array):
+        cumsum = np.cumsum(array)
+        cumsum = np.append(cumsum, 0)
+        return np.roll(cumsum,1)
+
+    fragment_index, local_start, local_stop = [], [], []
+    for dim in range(len(dask_chunks)):
+        cumulative      = outer_cumsum(fragment_coverage[dim])
+        partition_cumul = outer_cumsum(dask_chunks[dim])
+        findex, lstart, lstop = [], [], []
+        for c in range(len(dask_chunks[dim])):
+            cumul = max(filter(lambda l: l <= c, cumulative))
+            fc = int(np.where(cumulative == cumul)[0].squeeze())
+            findex.append(fc)
+            lstart.append(int(partition_cumul[c] - fragment_starts[dim][fc]))
+            lstop.append(int(partition_cumul[c+1] - fragment_starts[dim][fc]))
+        fragment_index.append(findex)
+        local_start.append(lstart)
+        local_stop.append(lstop)
+    return fragment_index, local_start, local_stop
+
+def mapping_inputs(nfragments, fragment_size=FRAGMENT_SIZE):
+    dask_chunks       = [[1]*(nfragments*fragment_size), [10], [10]]
+    fragment_coverage = [[fragment_size]*nfragments, [1], [1]]
+    fragment_starts   = [list(range(0, nfragments*fragment_size, fragment_size)), [0], [0]]
+    return dask_chunks, fragment_coverage, fragment_starts
+
+def timed(func, *args):
+    t0 = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - t0, result
+
+def main():
+    print(f'{"partitions":>10} {"legacy (s)":>12} {"vectorised (s)":>15} {"speedup":>9} {"create (s)":>11}')
+    for npartitions in (int(1e3), int(1e4), int(1e5)):
+        nfragments = npartitions // FRAGMENT_SIZE
+
+        wrapper = synthetic_wrapper(nfragments)
+        inputs  = mapping_inputs(nfragments)
+
+        t_legacy, ref = timed(legacy_map_partitions, *inputs)
+        t_vector, new = timed(wrapper._map_partitions, *inputs)
+
+        assert ref == new, 'Vectorised mapping differs from legacy mapping'
+
+        t_create, _ = timed(wrapper._create_partitions)
+
+        print(f'{npartitions:>10} {t_legacy:>12.4f} {t_vector:>15.4f} {t_legacy/t_vector:>8.0f}x {t_create:>11.4f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""
+Benchmark suite over synthetic aggregations of fragment files generated locally.
+
+Each case writes a set of netCDF fragment files covering a grid of 1 to 3 aggregated
+dimensions (``time``, ``latitude``, ``longitude``), with small or large fragments that are
+compressed or uncompressed. The following are timed for each case:
+
+ - ``create``: ``CFANetCDF.create`` over the fragment files.
+ - ``write``: ``CFANetCDF.write`` of the CFA-netCDF file.
+ - ``open``: ``xr.open_dataset(engine='CFA')``, including decoding the fragments.
+ - ``array``: ``FragmentArrayWrapper.__array__``, building the dask array.
+ - ``partitions``: ``FragmentArrayWrapper._create_partitions`` with one time step per chunk.
+ - ``partial_load``: Loading the region covered by the first fragment.
+ - ``full_load``: Loading the whole array, for cases of up to ``FULL_LOAD_LIMIT`` fragments.
+
+Results are written as JSON, and compared against a baseline from a previous run to
+report any metric slower than the baseline by more than the tolerance, in which case
+the exit status is 1.
+
+Run with ``python benchmarks/bench_suite.py [--profile quick|full] [--output results.json]
+[--baseline benchmarks/baselines/quick.json] [--tolerance 1.5]``
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import dask
+import netCDF4
+import numpy as np
+import xarray as xr
+
+from cfapyx import CFANetCDF
+
+DIMS = ('time', 'latitude', 'longitude')
+
+FRAGMENT_SHAPES = {
+    'small': (2, 4, 4),
+    'large': (8, 64, 64),
+}
+
+PROFILES = {
+    'quick': {'nfragments': (100, 1000), 'large_limit': 100},
+    'full':  {'nfragments': (100, 1000, 10000, 100000), 'large_limit': 1000},
+}
+
+# Cases with more fragments than this do not time the full load.
+FULL_LOAD_LIMIT = 10000
+
+# Metrics faster than this (in seconds) are not compared, as differences are noise.
+NOISE_FLOOR = 0.01
+
+def get_cases(profile: str) -> list:
+    """
+    The ``(nfragments, naggregated, fragment, compressed)`` parameters of each case in
+    ``profile``. Large fragments are limited to smaller aggregations to bound the disk
+    space used.
+    """
+    settings = PROFILES[profile]
+    cases = []
+    for nfragments, naggregated, fragment, compressed in itertools.product(
+            settings['nfragments'], (1, 2, 3), FRAGMENT_SHAPES, (False, True)):
+        if fragment == 'large' and nfragments > settings['large_limit']:
+            continue
+        cases.append((nfragments, naggregated, fragment, compressed))
+    return cases
+
+def case_name(nfragments, naggregated, fragment, compressed) -> str:
+    return f'n{nfragments}-d{naggregated}-{fragment}-{"zlib" if compressed else "raw"}'
+
+def fragment_grid(nfragments: int, naggregated: int) -> tuple:
+    """
+    The number of fragments along each dimension, for close to ``nfragments`` fragments
+    split evenly over the first ``naggregated`` dimensions.
+    """
+    per_dim = int(round(nfragments ** (1 / naggregated)))
+    grid    = [per_dim] * (naggregated - 1)
+    grid.append(max(1, int(round(nfragments / max(1, np.prod(grid))))))
+    return tuple(grid) + (1,) * (len(DIMS) - naggregated)
+
+def write_fragments(directory, grid, fragment_shape, compressed) -> list:
+    """
+    Write one fragment file of random data for every position in the fragment ``grid``,
+    with coordinate variables placing each fragment in the aggregated array.
+    """
+    rng = np.random.default_rng(0)
+    files = []
+    for position in itertools.product(*(range(g) for g in grid)):
+        location = os.path.join(directory, 'fragment_' + '_'.join(map(str, position)) + '.nc')
+        with netCDF4.Dataset(location, 'w') as ds:
+            for dim, size, p in zip(DIMS, fragment_shape, position):
+                ds.createDimension(dim, size)
+                coord = ds.createVariable(dim, 'f8', (dim,))
+                coord[:] = np.arange(p * size, (p + 1) * size)
+            var = ds.createVariable('p', 'f4', DIMS, zlib=compressed, complevel=4)
+            var.units = 'K'
+            var[:] = rng.random(fragment_shape, dtype=np.float32)
+        files.append(location)
+    return files
+
+def timed(func, repeat=1):
+    """
+    The shortest time in seconds of ``repeat`` calls to ``func``, and the result of the
+    last call.
+    """
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def run_case(directory, nfragments, naggregated, fragment, compressed, repeat=3) -> dict:
+    """
+    Generate the fragments for one case and time each stage, see the module docstring.
+    """
+    grid  = fragment_grid(nfragments, naggregated)
+    files = write_fragments(directory, grid, FRAGMENT_SHAPES[fragment], compressed)
+    cfa_file = os.path.join(directory, 'aggregation.nca')
+
+    results = {'nfragments': len(files), 'grid': list(grid)}
+
+    creator = CFANetCDF(files)
+    results['create'], _ = timed(lambda: creator.create(agg_dims=list(DIMS[:naggregated])))
+    results['write'], _  = timed(lambda: creator.write(cfa_file))
+
+    def open_cfa():
+        ds = xr.open_dataset(cfa_file, engine='CFA', cache=False)
+        ds.close()
+        return ds
+
+    results['open'], _ = timed(open_cfa, repeat)
+
+    with xr.open_dataset(cfa_file, engine='CFA', cache=False) as ds:
+        p = ds['p']
+
+        def build_array():
+            wrapper = p.cfa._find_wrapper()
+            wrapper.cfa_options = wrapper.cfa_options
+            return wrapper.__array__()
+
+        results['array'], _ = timed(build_array, repeat)
+
+        def create_partitions():
+            wrapper = p.cfa._find_wrapper()
+            wrapper.chunks = {'time': 1}
+            return wrapper._create_partitions()
+
+        results['partitions'], _ = timed(create_partitions, repeat)
+
+        first = {dim: slice(0, size) for dim, size in zip(DIMS, FRAGMENT_SHAPES[fragment])}
+        results['partial_load'], _ = timed(lambda: p.isel(first).values, repeat)
+
+        if len(files) <= FULL_LOAD_LIMIT:
+            results['full_load'], _ = timed(lambda: p.values)
+
+    return results
+
+def metadata() -> dict:
+    """
+    Description of the machine and library versions for a set of results.
+    """
+    return {
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'dask': dask.__version__,
+        'xarray': xr.__version__,
+        'netCDF4': netCDF4.__version__,
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    The ``(case, metric, baseline, result)`` of every metric slower than the baseline by
+    more than a factor of ``tolerance``.
+    """
+    regressions = []
+    for name, metrics in results['cases'].items():
+        base = baseline['cases'].get(name)
+        if base is None:
+            continue
+        for metric, value in metrics.items():
+            if metric in ('nfragments', 'grid') or metric not in base:
+                continue
+            if max(value, base[metric]) < NOISE_FLOOR:
+                continue
+            if value > base[metric] * tolerance:
+                regressions.append((name, metric, base[metric], value))
+    return regressions
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Synthetic large-aggregation benchmarks')
+    parser.add_argument('--profile', choices=PROFILES, default='quick')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare the results against this JSON file')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+        help='Slowdown factor relative to the baseline reported as a regression')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(args)
+
+    results = {'profile': args.profile, 'metadata': metadata(), 'cases': {}}
+
+    for case in get_cases(args.profile):
+        name = case_name(*case)
+        with tempfile.TemporaryDirectory() as directory:
+            results['cases'][name] = run_case(directory, *case, repeat=args.repeat)
+
+        timings = ' '.join(
+            f'{k}={v:.4f}' for k, v in results['cases'][name].items() if isinstance(v, float)
+        )
+        print(f'{name:>24} {timings}', flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name, metric, base, value in regressions:
+        print(f'REGRESSION {name} {metric}: {base:.4f}s -> {value:.4f}s ({value/base:.2f}x)')
+    if not regressions:
+        print(f'No regressions against {args.baseline} (tolerance {args.tolerance}x)')
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
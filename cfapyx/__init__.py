@@ -1,3 +1,12 @@
 from .backend import CFANetCDFBackendEntrypoint
 from .creator import CFANetCDF
-from .utils import set_verbose
\ No newline at end of file
+from .append import append_fragments
+from .utils import set_verbose
+from .pool import get_handle_pool
+from .prefetch import get_prefetcher
+from .cache import get_fragment_cache
+from .locks import get_lock_manager
+from .processes import get_process_reader
+from .instrument import get_read_recorder, instrument
+from .metadata import get_metadata_cache
+from .accessor import CFAAccessor
\ No newline at end of file
@@ -0,0 +1,252 @@
+__author__    = "Daniel Westwood"
+__contact__   = "daniel.westwood@stfc.ac.uk"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+
+import logging
+import operator
+
+import numpy as np
+import xarray as xr
+from xarray import conventions
+from xarray.core import indexing
+
+from cfapyx.index import FragmentIntervalIndex
+from cfapyx.utils import logstream
+from cfapyx.wrappers import FragmentArrayWrapper
+
+logger = logging.getLogger(__name__)
+
+logger.addHandler(logstream)
+logger.propagate = False
+
+COMPARISONS = {
+    '>':  operator.gt,
+    '>=': operator.ge,
+    '<':  operator.lt,
+    '<=': operator.le,
+}
+
+# Encoding attributes used by Xarray to mask and scale the data on decoding.
+_MASK_AND_SCALE = ('_FillValue', 'missing_value', 'scale_factor', 'add_offset', '_Unsigned')
+
+@xr.register_dataarray_accessor('cfa')
+class CFAAccessor:
+    """
+    Xarray accessor ``DataArray.cfa`` for operations on CFA aggregated variables which
+    are answered from the metadata in the CFA file where possible. Variables which are
+    not aggregated, or have no such metadata, fall back to the standard Xarray methods.
+    """
+
+    def __init__(self, xarray_obj):
+        self._obj = xarray_obj
+
+    def min(self):
+        """
+        Minimum of the whole variable, from the per-fragment statistics if present.
+        """
+        return self._reduce('min')
+
+    def max(self):
+        """
+        Maximum of the whole variable, from the per-fragment statistics if present.
+        """
+        return self._reduce('max')
+
+    def sum(self):
+        """
+        Sum of the whole variable, from the per-fragment statistics if present.
+        """
+        return self._reduce('sum')
+
+    def mean(self):
+        """
+        Mean of the whole variable, from the per-fragment statistics if present.
+        """
+        return self._reduce('mean')
+
+    def count(self):
+        """
+        Number of valid values in the whole variable, from the per-fragment statistics
+        if present.
+        """
+        return self._reduce('count')
+
+    def where(self, op: str, threshold):
+        """
+        Equivalent to ``da.where(da <op> threshold)``, where fragments which cannot 
+        contain any value satisfying the condition are not read, according to the
+        per-fragment statistics.
+
+        :param op:          (str) The comparison, one of ``>``, ``>=``, ``<`` or ``<=``.
+
+        :param threshold:   (float) The value compared against.
+        """
+        if op not in COMPARISONS:
+            raise ValueError(
+                f'Unsupported comparison "{op}" - expected one of {tuple(COMPARISONS.keys())}'
+            )
+        compare = COMPARISONS[op]
+
+        data = self._pruned(op, threshold)
+        if data is None:
+            return self._obj.where(compare(self._obj, threshold))
+        return data.where(compare(data, threshold))
+
+    def _pruned(self, op: str, threshold):
+        """
+        Construct a copy of this variable where only the fragments which may satisfy 
+        ``x <op> threshold`` are read, or None if the variable cannot be pruned. The 
+        other fragments are filled with the missing value, or NaN, which never satisfies
+        the condition once decoded.
+        """
+        wrapper = self._find_wrapper()
+        if not _has_statistics(wrapper) or self._obj.dtype.kind != 'f':
+            return None
+
+        encoding = self._obj.encoding
+        fill_value = encoding.get('_FillValue', encoding.get('missing_value'))
+        if fill_value is None:
+            if wrapper.dtype.kind != 'f':
+                return None
+            fill_value = np.nan
+
+        keep = wrapper.statistics.keep(op, threshold)
+        return self._from_raw(self._obj, wrapper.prune(keep, fill_value))
+
+    def fragment_index(self):
+        """
+        The ``FragmentIntervalIndex`` from the coordinate values of this variable to its
+        fragments, for each dimension with an index. None if the variable is not aggregated.
+        """
+        wrapper = self._find_wrapper()
+        if wrapper is None:
+            return None
+
+        bounds = wrapper._fragment_bounds()
+        coords, fbounds = {}, {}
+        for axis, dim in enumerate(self._obj.dims):
+            if dim in self._obj.indexes:
+                coords[dim]  = self._obj.indexes[dim]
+                fbounds[dim] = bounds[axis]
+        return FragmentIntervalIndex(coords, fbounds)
+
+    def fragments(self, indexers: dict = None, **indexers_kwargs) -> dict:
+        """
+        The ``(start, stop)`` range of fragments along each dimension covering the values
+        selected by the label ``indexers``, as for ``DataArray.sel``.
+        """
+        indexers = (indexers or {}) | indexers_kwargs
+        index = self.fragment_index()
+        if index is None:
+            raise ValueError(f'Variable "{self._obj.name}" is not a CFA aggregated variable.')
+        return {dim: index.fragments(dim, label) for dim, label in indexers.items()}
+
+    def sel(self, indexers: dict = None, **indexers_kwargs):
+        """
+        Label-based selection equivalent to ``DataArray.sel``. Selections along indexed 
+        dimensions are resolved to the minimal set of fragments with the fragment index,
+        and the result is a dask-backed array over only those fragments.
+        """
+        indexers = (indexers or {}) | indexers_kwargs
+
+        index = self.fragment_index()
+        if index is None:
+            return self._obj.sel(indexers)
+
+        key, remaining = {}, {}
+        for dim, label in indexers.items():
+            if dim in index:
+                key[dim] = index.index_slice(dim, label)
+            else:
+                remaining[dim] = label
+
+        wrapper  = self._find_wrapper()
+        selected = self._obj.isel(key)
+
+        data = None
+        if selected.size:
+            raw_data = wrapper[tuple(key.get(dim, slice(None)) for dim in self._obj.dims)]
+            # Length-1 selections may be dropped by the wrapper.
+            data = self._from_raw(selected, raw_data.reshape(selected.shape))
+        if data is None:
+            data = selected
+
+        # Scalar labels drop the dimension, as for DataArray.sel
+        drop = {dim: 0 for dim, label in indexers.items() if dim in key and not isinstance(label, slice)}
+        if drop:
+            data = data.isel(drop)
+        if remaining:
+            data = data.sel(remaining)
+        return data
+
+    def _from_raw(self, obj, raw_data):
+        """
+        Replace the data of ``obj`` with ``raw_data`` from the fragments, applying the 
+        same masking and scaling as Xarray applies to the source data. Returns None if
+        the decoded data would not match the original variable.
+        """
+        encoding = obj.encoding
+        raw = xr.Variable(
+            obj.dims,
+            raw_data,
+            attrs={k: encoding[k] for k in _MASK_AND_SCALE if k in encoding}
+        )
+
+        decoded = conventions.decode_cf_variable(
+            obj.name, raw, mask_and_scale=True, decode_times=False, 
+            decode_timedelta=False
+        )
+        if decoded.dtype != obj.dtype or decoded.shape != obj.shape:
+            return None
+        return obj.copy(data=decoded.data)
+
+    def _reduce(self, name: str):
+        """
+        Apply the reduction ``name`` to the whole variable, from the statistics of the
+        fragments if possible.
+        """
+        wrapper = self._find_wrapper()
+        if not _has_statistics(wrapper) or self._obj.dtype.kind not in 'iuf':
+            return getattr(self._obj, name)()
+
+        value = getattr(wrapper.statistics, name)()
+        return xr.DataArray(value, name=self._obj.name)
+
+    def _find_wrapper(self):
+        """
+        Find the ``FragmentArrayWrapper`` behind this variable, or None if the variable 
+        is not aggregated, has been indexed or is already loaded.
+        """
+        array = self._obj.variable._data
+
+        while not isinstance(array, FragmentArrayWrapper):
+            if isinstance(array, indexing.LazilyIndexedArray):
+                if not _is_full_selection(array.key.tuple, array.array.shape):
+                    return None
+
+            array = getattr(array, 'array', None)
+            if array is None:
+                return None
+
+        return array
+
+def _has_statistics(wrapper) -> bool:
+    """
+    Determine if ``wrapper`` has per-fragment statistics in the units of the aggregated
+    variable. Statistics recorded in other units, or with no units for a variable with
+    units, are not used as the data is converted to the aggregated units on reading.
+    """
+    if wrapper is None or wrapper.statistics is None:
+        return False
+    return (wrapper.statistics.units or '') == (wrapper.units or '')
+
+def _is_full_selection(key, shape) -> bool:
+    """
+    Determine if the indexer ``key`` selects the whole of an array with ``shape``.
+    """
+    if len(key) != len(shape):
+        return False
+    for k, size in zip(key, shape):
+        if not isinstance(k, slice) or k.indices(size) != (0, size, 1):
+            return False
+    return True
@@ -0,0 +1,448 @@
+__author__    = "Daniel Westwood"
+__contact__   = "daniel.westwood@stfc.ac.uk"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+
+import glob
+import logging
+import os
+import re
+
+import netCDF4
+import numpy as np
+
+from cfapyx.creator import _scan
+from cfapyx.statistics import STATISTICS
+from cfapyx.utils import logstream
+
+logger = logging.getLogger(__name__)
+
+logger.addHandler(logstream)
+logger.propagate = False
+
+# Terms of the ``aggregated_data`` attribute, with the names used by earlier conventions.
+_TERMS = {
+    'uris': ('uris', 'location'),
+    'map': ('map', 'shape'),
+    'identifiers': ('identifiers', 'address'),
+}
+
+# Coordinate attributes which must match for new fragments to extend the coordinate.
+_MATCHING_ATTRS = ('units', 'calendar')
+
+def append_fragments(
+        cfa_file: str,
+        files: list,
+        outfile: str = None,
+        agg_dim: str = None,
+        workers: int = None,
+    ) -> str:
+    """
+    Append new fragment files to an existing CFA-netCDF aggregation, extending the
+    aggregation along one of its aggregated dimensions. Only the new files are read,
+    and the existing fragments are taken from the ``fragment_uris``, ``fragment_map``
+    and statistics variables of the CFA-netCDF file, which is rewritten with these
+    variables and the aggregated coordinate extended. As the CFA-netCDF file only
+    holds the aggregation metadata, the time taken grows with the number of new files
+    rather than the size of the aggregation.
+
+    New fragments are ordered with the existing fragments by their first coordinate
+    value, as in ``CFANetCDF.create``, and must match the existing fragments along
+    every other dimension. Global and variable attributes are kept from the existing
+    file.
+
+    :param cfa_file:    (str) The CFA-netCDF file to extend.
+
+    :param files:       (list) The new fragment files, or a glob pattern. Each file
+        may be a tuple of the locations of the same fragment, as for ``CFANetCDF``.
+
+    :param outfile:     (str) *Optional* file to write the extended aggregation to,
+        by default ``cfa_file`` is replaced.
+
+    :param agg_dim:     (str) The dimension to extend. Required unless only one
+        dimension of the aggregation has more than one fragment.
+
+    :param workers:     (int) Number of worker processes used to read the new files,
+        see ``CFANetCDF.create``.
+
+    :returns:   The path of the extended CFA-netCDF file.
+    """
+
+    if isinstance(files, str):
+        files = sorted(glob.glob(files))
+    if not files:
+        raise ValueError('No fragment files given to append.')
+
+    outfile = outfile or cfa_file
+    temp    = f'{outfile}.{os.getpid()}.tmp'
+
+    with netCDF4.Dataset(cfa_file) as ds:
+        aggregation = _Aggregation(ds, agg_dim)
+
+        logger.info(
+            f'Appending {len(files)} files along "{aggregation.agg_dim}" to {cfa_file}'
+        )
+
+        indices = range(aggregation.nfragments, aggregation.nfragments + len(files))
+        for file, summary in zip(files, _scan(
+                files, indices, agg_dims=aggregation.coord_dims,
+                statistics=aggregation.has_statistics, sample_budget=0,
+                workers=workers)):
+            aggregation.add(file, summary)
+
+        # Write to a temporary file first so the aggregation is never left incomplete.
+        try:
+            with netCDF4.Dataset(temp, mode='w', format=ds.data_model) as out:
+                aggregation.write(out)
+        except Exception:
+            if os.path.isfile(temp):
+                os.remove(temp)
+            raise
+
+    os.replace(temp, outfile)
+    return outfile
+
+class _Aggregation:
+    """
+    The fragments of an existing CFA-netCDF file along each aggregated dimension, to
+    which new fragment files are added before writing the extended file.
+    """
+
+    def __init__(self, ds, agg_dim: str = None):
+        """
+        :param ds:          (obj) The open CFA-netCDF file.
+
+        :param agg_dim:     (str) The dimension to extend, see ``append_fragments``.
+        """
+        self.ds = ds
+
+        self.variables = {}
+        for name, var in ds.variables.items():
+            if not hasattr(var, 'aggregated_dimensions'):
+                continue
+            terms = _decode_terms(var.aggregated_data)
+            self.variables[name] = {
+                'dims': tuple(var.aggregated_dimensions.split(' ')),
+                'uris': _find_term(terms, 'uris', name),
+                'map': _find_term(terms, 'map', name),
+                'identifiers': _find_term(terms, 'identifiers', name),
+                'statistics': _decode_terms(getattr(var, 'aggregated_statistics', '')),
+            }
+
+        if not self.variables:
+            raise ValueError('No aggregated variables found in the CFA-netCDF file.')
+
+        dims = []
+        for meta in self.variables.values():
+            dims += [d for d in meta['dims'] if d not in dims]
+        self.coord_dims = [d for d in dims if d in ds.variables]
+
+        # Fragment sizes along each dimension, from the first row of the fragment map
+        # which covers each dimension.
+        self.sizes = {}
+        for meta in self.variables.values():
+            shapes = ds.variables[meta['map']][...]
+            for row, d in zip(shapes, meta['dims']):
+                if d not in self.sizes:
+                    nfrags = ds.dimensions[f'f_{d}'].size
+                    self.sizes[d] = [int(s) for s in np.ma.getdata(row)[:nfrags]]
+
+        self.agg_dim = self._growing_dimension(agg_dim)
+        if self.agg_dim not in self.coord_dims:
+            raise ValueError(
+                f'Unable to extend "{self.agg_dim}", which has no coordinate variable.'
+            )
+
+        # Position of each fragment along the fragmented dimensions, by its first value.
+        self.positions   = {}
+        self.coordinates = []
+        for d in self.coord_dims:
+            values  = np.ma.getdata(ds.variables[d][...])
+            offsets = np.cumsum([0] + self.sizes[d])
+            self.positions[d] = {values[o]: x for x, o in enumerate(offsets[:-1])}
+            if d == self.agg_dim:
+                self.coordinates = [values[s:e] for s, e in zip(offsets[:-1], offsets[1:])]
+
+        self.coord_attrs = {
+            a: ds.variables[self.agg_dim].getncattr(a)
+            for a in _MATCHING_ATTRS if a in ds.variables[self.agg_dim].ncattrs()
+        }
+
+        self.nfragments = int(np.prod([len(s) for s in self.sizes.values()]))
+
+        self.has_statistics = any(m['statistics'] for m in self.variables.values())
+
+        # The new fragments along agg_dim, by the first coordinate value.
+        self.new = {}
+
+    def _growing_dimension(self, agg_dim):
+        """
+        The dimension to extend, which is the only fragmented dimension of the
+        aggregation if not given.
+        """
+        if agg_dim is not None:
+            if agg_dim not in self.sizes:
+                raise ValueError(f'"{agg_dim}" is not an aggregated dimension.')
+            return agg_dim
+
+        fragmented = [d for d, sizes in self.sizes.items() if len(sizes) > 1]
+        if len(fragmented) != 1:
+            raise ValueError(
+                'Unable to determine the dimension to extend from the fragmented '
+                f'dimensions {tuple(fragmented)} - specify agg_dim.'
+            )
+        return fragmented[0]
+
+    def add(self, file, summary: dict):
+        """
+        Add the new fragment ``file`` described by the ``summary`` from ``_scan_file``,
+        placing it by its first coordinate value along each dimension.
+        """
+        if summary['is_aggregated']:
+            raise ValueError(
+                f'Unable to append "{file}", which is an aggregation - only fragment '
+                'files may be appended.'
+            )
+
+        var_info = {v: info for v, info, _ in summary['var_info']}
+        for name, meta in self.variables.items():
+            if name not in var_info or var_info[name]['dims'] != meta['dims']:
+                raise ValueError(
+                    f'Aggregated variable "{name}" with dimensions {meta["dims"]} is '
+                    f'not present in "{file}".'
+                )
+
+        position = {}
+        fragment = None
+        for d, new_info, arr_components, attrs in summary['dim_info']:
+            if d not in self.sizes:
+                continue
+
+            if arr_components is None:
+                size, start = new_info['size'], None
+            else:
+                size, start = int(arr_components['sizes']), arr_components['starts']
+
+            if d == self.agg_dim:
+                for attr, value in self.coord_attrs.items():
+                    if attr not in attrs.ncattrs() or attrs.getncattr(attr) != value:
+                        raise ValueError(
+                            f'The "{attr}" of "{d}" in "{file}" differs from the '
+                            'aggregation.'
+                        )
+                fragment = (start, size, arr_components['arrays'])
+            else:
+                if start is None:
+                    position[d] = 0
+                elif start in self.positions[d]:
+                    position[d] = self.positions[d][start]
+                else:
+                    raise ValueError(
+                        f'"{file}" does not match any existing fragment along "{d}".'
+                    )
+                if size != self.sizes[d][position[d]]:
+                    raise ValueError(f'Fragment size of "{file}" differs along "{d}".')
+
+        if fragment is None:
+            raise ValueError(f'"{file}" has no "{self.agg_dim}" dimension.')
+
+        start, size, array = fragment
+        if start in self.positions[self.agg_dim]:
+            raise ValueError(
+                f'A fragment starting at {start} along "{self.agg_dim}" is already in '
+                f'the aggregation, from "{file}".'
+            )
+
+        if start not in self.new:
+            self.new[start] = {'size': size, 'array': array, 'files': {}}
+        elif self.new[start]['size'] != size:
+            raise ValueError(f'Fragment size of "{file}" differs along "{self.agg_dim}".')
+
+        key = tuple(sorted(position.items()))
+        if key in self.new[start]['files']:
+            raise ValueError(
+                f'"{file}" covers the same fragment as '
+                f'"{self.new[start]["files"][key][0]}".'
+            )
+        self.new[start]['files'][key] = (file, summary['statistics'])
+
+    def write(self, out):
+        """
+        Write the aggregation to the new CFA-netCDF file ``out``, copying every
+        dimension and variable with those that depend on ``agg_dim`` extended.
+        """
+        if not self.new:
+            raise ValueError('No new fragments to append.')
+
+        agg_dim = self.agg_dim
+        f_dim   = f'f_{agg_dim}'
+
+        starts = list(self.positions[agg_dim].keys()) + list(self.new.keys())
+        order  = np.argsort(np.array(starts, dtype=np.float64), kind='stable')
+
+        new_starts = list(self.new.keys())
+        sizes = self.sizes[agg_dim] + [self.new[s]['size'] for s in new_starts]
+        sizes = [sizes[x] for x in order]
+
+        arrays = self.coordinates + [self.new[s]['array'] for s in new_starts]
+        coord  = np.concatenate([np.asarray(arrays[x]) for x in order])
+
+        dim_sizes = {agg_dim: len(coord), f_dim: len(sizes)}
+        all_sizes = self.sizes | {agg_dim: sizes}
+
+        data, dims = {agg_dim: coord.astype(self.ds.variables[agg_dim].dtype)}, {}
+        for name, meta in self.variables.items():
+            if agg_dim not in meta['dims']:
+                continue
+
+            if meta['uris'] not in data:
+                uris = self.ds.variables[meta['uris']]
+                data[meta['uris']] = self._extend(uris, order, new_starts, self._new_uris)
+
+            shapes, i_dim = _fragment_map(meta['dims'], all_sizes)
+            data[meta['map']], dims[meta['map']] = shapes, (
+                self.ds.variables[meta['map']].dimensions[0], i_dim
+            )
+
+            identifiers = self.ds.variables[meta['identifiers']]
+            if f_dim in identifiers.dimensions:
+                data[meta['identifiers']] = self._extend(
+                    identifiers, order, new_starts, lambda var, shape, dims: np.full(
+                        shape, name, dtype=object)
+                )
+
+            for stat, sname in meta['statistics'].items():
+                data[sname] = self._extend(
+                    self.ds.variables[sname], order, new_starts,
+                    lambda var, shape, dims, n=name, s=stat: self._new_statistics(
+                        n, STATISTICS.index(s), var, shape, dims)
+                )
+
+        for name, dim in self.ds.dimensions.items():
+            size = None if dim.isunlimited() else dim_sizes.get(name, dim.size)
+            out.createDimension(name, size)
+
+        out.setncatts({a: self.ds.getncattr(a) for a in self.ds.ncattrs()})
+
+        for name, var in self.ds.variables.items():
+            vdims = dims.get(name, var.dimensions)
+            if name not in data and (agg_dim in vdims or f_dim in vdims):
+                raise ValueError(f'Unable to extend variable "{name}" along "{agg_dim}".')
+
+            attrs = {a: var.getncattr(a) for a in var.ncattrs()}
+            new = out.createVariable(
+                name,
+                var.datatype,
+                vdims,
+                fill_value=attrs.pop('_FillValue', None),
+            )
+            new.setncatts(attrs)
+
+            if name in self.variables:
+                continue
+            values = data[name] if name in data else var[...]
+            if var.dtype == str:
+                new[...] = np.array(values, dtype=object)
+            else:
+                new[...] = values
+
+        logger.info(
+            f'Extended "{agg_dim}" to {len(sizes)} fragments with {len(self.new)} new'
+        )
+
+    def _extend(self, var, order, new_starts, new_values):
+        """
+        The values of the fragment array variable ``var`` with the blocks for the
+        new fragments added along ``f_<agg_dim>``, then reordered by ``order``.
+        """
+        axis  = var.dimensions.index(f'f_{self.agg_dim}')
+        shape = list(var.shape)
+        shape[axis] = len(new_starts)
+
+        values = var[...]
+        if var.dtype == str:
+            values = np.array(values, dtype=object)
+
+        block  = new_values(var, tuple(shape), var.dimensions)
+        values = np.ma.concatenate([values, block], axis=axis)
+        return np.take(values, order, axis=axis)
+
+    def _new_fragments(self, dims):
+        """
+        Generate the index of each new fragment in a block of the fragment array
+        variable with ``dims``, with the file and statistics of the fragment.
+        """
+        for x, start in enumerate(self.new.keys()):
+            for key, (file, statistics) in self.new[start]['files'].items():
+                position = dict(key) | {self.agg_dim: x}
+                index = tuple(
+                    position.get(d[2:], 0) for d in dims if d != 'versions'
+                )
+                yield index, file, statistics
+
+    def _new_uris(self, var, shape, dims):
+        block = np.full(shape, '', dtype=object)
+        for index, file, _ in self._new_fragments(dims):
+            if 'versions' in dims:
+                locations = file if isinstance(file, tuple) else (file,)
+                if len(locations) > shape[-1]:
+                    raise ValueError(
+                        f'Fragment {file} has more locations than the aggregation.'
+                    )
+                for v, location in enumerate(locations):
+                    block[index + (v,)] = location
+            else:
+                block[index] = file[0] if isinstance(file, tuple) else file
+
+        first = block[..., 0] if 'versions' in dims else block
+        if (first == '').any():
+            raise ValueError(
+                f'New fragments along "{self.agg_dim}" do not cover every fragment '
+                'of the other aggregated dimensions.'
+            )
+        return block
+
+    def _new_statistics(self, name, stat, var, shape, dims):
+        if 'count' in STATISTICS[stat]:
+            block = np.zeros(shape, dtype=var.dtype)
+        else:
+            block = np.full(shape, np.nan, dtype=var.dtype)
+
+        for index, file, statistics in self._new_fragments(dims):
+            if statistics and name in statistics:
+                block[index] = statistics[name][stat]
+        return block
+
+def _fragment_map(dims: tuple, sizes: dict) -> tuple:
+    """
+    The ``fragment_map`` for an aggregated variable with ``dims``, given the fragment
+    sizes along each dimension, as written by ``CFANetCDF.write``. Also returns the
+    name of the second dimension of the map, which is the most fragmented dimension.
+    """
+    largest, i_dim = 0, ''
+    for d in dims:
+        if len(sizes[d]) > largest:
+            largest, i_dim = len(sizes[d]), f'f_{d}'
+
+    shapes = np.zeros((len(dims), largest), dtype=int)
+    for x, d in enumerate(dims):
+        shapes[x, :len(sizes[d])] = sizes[d]
+    return np.ma.array(shapes, mask=(shapes == 0)), i_dim
+
+def _decode_terms(value: str) -> dict:
+    """
+    Decode a ``term: variable`` blank-separated list, as in the ``aggregated_data``
+    attribute.
+    """
+    if not value:
+        return {}
+    parts = re.split(': | ', value)
+    return {k: v for k, v in zip(parts[0::2], parts[1::2])}
+
+def _find_term(terms: dict, term: str, name: str) -> str:
+    for alias in _TERMS[term]:
+        if alias in terms:
+            return terms[alias]
+    raise ValueError(
+        f'Unable to append to "{name}" - the "{term}" term is missing from '
+        'aggregated_data.'
+    )
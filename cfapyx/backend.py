@@ -40,9 +40,13 @@ def open_cfa_dataset(
 
     :param filename_or_obj:       (str) The path to a CFA-netCDF file to be opened by Xarray
 
+    :param drop_variables:        (str/list) Variables to exclude from the dataset. These are 
+                                  skipped before CFA decoding, so their fragment array variables
+                                  are never read.
+
     :param cfa_options:           (dict) A set of kwargs provided to CFA which provide additional 
                                   configurations. Currently implemented are: substitutions (dict), 
-                                  decode_cfa (bool)
+                                  decode_cfa (bool), keep_variables (list)
 
     :param group:                 (str) The name or path to a NetCDF group. CFA can handle opening 
                                   from specific groups and will inherit both ``group`` and ``global``
@@ -61,6 +65,9 @@ def open_cfa_dataset(
     # Expands cfa_options into individual kwargs for the store.
     store.cfa_options = cfa_options
 
+    # Dropped variables are skipped by the store before any CFA decoding.
+    store.drop_variables = drop_variables
+
     # Xarray makes use of StoreBackendEntrypoints to provide the Dataset 'ds'
     store_entrypoint = CFAStoreBackendEntrypoint()
     ds = store_entrypoint.open_dataset(
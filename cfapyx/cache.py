@@ -0,0 +1,299 @@
+__author__    = "Daniel Westwood"
+__contact__   = "daniel.westwood@stfc.ac.uk"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+
+import hashlib
+import logging
+import os
+import threading
+import urllib.request
+from collections import OrderedDict
+
+import numpy as np
+
+from cfapyx.utils import logstream
+
+logger = logging.getLogger(__name__)
+
+logger.addHandler(logstream)
+logger.propagate = False
+
+DEFAULT_CACHE_SIZE = 2 * 1024**3
+
+# Size of each block streamed from a remote fragment file.
+FETCH_BLOCK_SIZE = 1024**2
+
+class FragmentCache:
+    """
+    Persistent on-disk cache of fragment data read from slow or remote locations.
+    Each entry is a ``.npy`` file in the cache directory named by a hash of the
+    ``(location, address, extent)`` of the data. Whole remote fragment files may also
+    be held, as ``.nc`` files named by a hash of their URL. The total size of the cache
+    is bounded by ``max_bytes``, with the least recently used entries removed first.
+    Entries already in the directory are reused by later processes.
+    """
+
+    description = 'On-disk LRU cache of fragment data'
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_CACHE_SIZE):
+        """
+        :param directory:   (str) The local directory in which cached fragment data is
+            stored. Created if not already present.
+
+        :param max_bytes:   (int) The maximum total size in bytes of the cached data.
+        """
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()
+        self._lock    = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Total size in bytes of the cached data.
+        """
+        return sum(self._entries.values())
+
+    def get(self, key: tuple):
+        """
+        Return the cached array for ``key``, or None if it is not in the cache.
+
+        :param key:     (tuple) The ``(location, address, extent)`` identifying the data.
+        """
+        name = self._name(key, '.npy')
+        with self._lock:
+            if name not in self._entries:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(name)
+
+        path = self._path(name)
+        try:
+            data = np.load(path, allow_pickle=False)
+            os.utime(path)
+        except (OSError, ValueError) as err:
+            logger.debug(f'Unable to load cached fragment {path}: {err}')
+            with self._lock:
+                self._entries.pop(name, None)
+                self._misses += 1
+            return None
+
+        with self._lock:
+            self._hits += 1
+        return data
+
+    def put(self, key: tuple, data):
+        """
+        Store ``data`` under ``key``, removing the least recently used entries if the
+        cache is over budget. Data larger than the whole budget is not stored.
+        """
+        data = np.asarray(data)
+        if isinstance(data, np.ma.MaskedArray) or data.dtype.hasobject:
+            return
+        if data.nbytes > self.max_bytes:
+            return
+
+        name = self._name(key, '.npy')
+        path = self._path(name)
+        temp = self._temp(path)
+
+        # Write to a temporary file first so readers never see a partial entry.
+        try:
+            with open(temp, 'wb') as f:
+                np.save(f, data, allow_pickle=False)
+            os.replace(temp, path)
+        except OSError as err:
+            logger.debug(f'Unable to cache fragment {path}: {err}')
+            if os.path.isfile(temp):
+                os.remove(temp)
+            return
+
+        with self._lock:
+            self._entries[name] = os.path.getsize(path)
+            self._entries.move_to_end(name)
+            self._stores += 1
+            self._evict()
+
+    def fetch(self, url: str, check=None) -> str:
+        """
+        Return the path of a local copy of the remote file at ``url``, streaming it
+        into the cache directory if not already present. Files larger than the whole
+        budget are not downloaded.
+
+        :param url:     (str) The ``http://`` or ``https://`` location of the file.
+
+        :param check:   (callable) *Optional* function applied to the path of the
+            downloaded file before it is added to the cache, which should raise an
+            ``OSError`` if the file is not usable.
+
+        :returns:   (str) The path of the cached copy of the file.
+        """
+        name = self._name((url,), '.nc')
+        path = self._path(name)
+        with self._lock:
+            if name in self._entries and os.path.isfile(path):
+                self._entries.move_to_end(name)
+                self._hits += 1
+                return path
+            self._misses += 1
+
+        temp = self._temp(path)
+        try:
+            with urllib.request.urlopen(url) as response, open(temp, 'wb') as f:
+                length = response.headers.get('Content-Length')
+                if length is not None and int(length) > self.max_bytes:
+                    raise OSError(
+                        f'Remote file {url} of {length} bytes is larger than the '
+                        f'fragment cache budget of {self.max_bytes} bytes'
+                    )
+                size = 0
+                while block := response.read(FETCH_BLOCK_SIZE):
+                    size += len(block)
+                    if size > self.max_bytes:
+                        raise OSError(
+                            f'Remote file {url} is larger than the fragment cache '
+                            f'budget of {self.max_bytes} bytes'
+                        )
+                    f.write(block)
+            if check is not None:
+                check(temp)
+            os.replace(temp, path)
+        except Exception:
+            if os.path.isfile(temp):
+                os.remove(temp)
+            raise
+
+        logger.debug(f'Fetched remote file {url} ({size} bytes) into the cache')
+        with self._lock:
+            self._entries[name] = size
+            self._entries.move_to_end(name)
+            self._stores += 1
+            self._evict()
+        return path
+
+    def resize(self, max_bytes: int):
+        """
+        Change the byte budget of the cache, removing entries if now over budget.
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """
+        Remove every entry from the cache directory.
+        """
+        with self._lock:
+            for name in list(self._entries.keys()):
+                self._remove(name)
+
+    def reset_stats(self):
+        """
+        Reset the counters reported by ``stats``.
+        """
+        self._hits      = 0
+        self._misses    = 0
+        self._stores    = 0
+        self._evictions = 0
+
+    def stats(self) -> dict:
+        """
+        Report the usage of the cache. The ``hit_rate`` is the fraction of reads
+        served from the cache directory.
+        """
+        requests = self._hits + self._misses
+        return {
+            'entries': len(self._entries),
+            'nbytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'stores': self._stores,
+            'hits': self._hits,
+            'misses': self._misses,
+            'evictions': self._evictions,
+            'hit_rate': self._hits/requests if requests else 0.0,
+        }
+
+    def _scan(self):
+        """
+        Register the entries already present in the cache directory, oldest first.
+        """
+        found = []
+        for f in os.listdir(self.directory):
+            if not f.endswith(('.npy', '.nc')):
+                continue
+            path = os.path.join(self.directory, f)
+            stat = os.stat(path)
+            found.append((stat.st_mtime, f, stat.st_size))
+
+        for mtime, name, size in sorted(found):
+            self._entries[name] = size
+
+    def _evict(self):
+        """
+        Remove least recently used entries until the cache is within budget. Must be
+        called with the cache lock held.
+        """
+        total = self.nbytes
+        while total > self.max_bytes and self._entries:
+            name = next(iter(self._entries))
+            total -= self._entries[name]
+            self._remove(name)
+            self._evictions += 1
+
+    def _remove(self, name):
+        self._entries.pop(name)
+        try:
+            os.remove(self._path(name))
+        except OSError as err:
+            logger.debug(f'Unable to remove cached fragment {name}: {err}')
+
+    def _name(self, key, suffix):
+        return hashlib.sha256(repr(key).encode()).hexdigest() + suffix
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _temp(self, path):
+        return f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_fragment_cache(directory: str) -> FragmentCache:
+    """
+    Return the process-wide fragment cache for ``directory``, creating it if needed.
+    """
+    directory = os.path.abspath(directory)
+    with _caches_lock:
+        if directory not in _caches:
+            _caches[directory] = FragmentCache(directory)
+        return _caches[directory]
+
+def is_cached_location(location, prefixes=None) -> bool:
+    """
+    Determine if fragments from ``location`` should be held in the fragment cache.
+    Remote locations (e.g. ``https://``) are always cached, along with any location
+    starting with one of ``prefixes``, such as a network mount.
+    """
+    if not isinstance(location, str):
+        return False
+    if '://' in location and not location.startswith('file://'):
+        return True
+    return any(location.startswith(p) for p in (prefixes or []))
+
+def is_http_location(location) -> bool:
+    """
+    Determine if ``location`` is served over plain HTTP(S), such that the file may be
+    downloaded whole into the fragment cache.
+    """
+    return isinstance(location, str) and location.startswith(('http://', 'https://'))
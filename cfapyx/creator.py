@@ -4,11 +4,15 @@ __copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
 
 import glob
 import logging
-from collections import OrderedDict
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
 
 import netCDF4
 import numpy as np
 
+from cfapyx.statistics import STATISTICS, fragment_statistics
 from cfapyx.utils import logstream
 
 logger = logging.getLogger(__name__)
@@ -18,18 +22,40 @@ logger.propagate = False
 
 CONCAT_MSG = 'See individual datasets for more information.'
 
+# Number of files compared to check non-aggregated variables are identical.
+SAMPLE_FILES = 2
+
+# Default bytes of variable values kept from each sample file in the first pass.
+DEFAULT_SAMPLE_BUDGET = 16 * 1024**2
+
+# Largest number of files scanned in one task by a worker process.
+SCAN_BATCH = 64
+
+# Tasks queued ahead of the merge for each worker process.
+SCAN_AHEAD = 2
+
 class CFACreateMixin:
     """
     Mixin class for ``Create`` methods for a CFA-netCDF dataset.
     """
 
-    def _first_pass(self, agg_dims: list = None) -> tuple:
+    def _first_pass(
+            self, 
+            agg_dims: list = None, 
+            workers: int = None,
+            sample_budget: int = DEFAULT_SAMPLE_BUDGET,
+        ) -> tuple:
         """
         Perform a first pass across all provided files. Extracts the global
         attributes and information on all variables and dimensions into 
         separate python dictionaries. Also collects the set of files arranged
         by aggregated dimension coordinates, to be used later in constructing
         the CFA ``fragment_uris`` properties.
+
+        The metadata of each file is extracted by ``_scan_file``, in a pool of
+        ``workers`` processes if given, and always merged here in file order. The
+        values of variables up to ``sample_budget`` bytes are kept from the first
+        files, for comparison of the non-aggregated variables in ``_second_pass``.
         """
 
         logger.info('Performing first pass on the set of files.')
@@ -39,45 +65,39 @@ class CFACreateMixin:
         dim_info = None
         global_attrs = None
 
+        # Set of the fragment starts already found along each dimension.
+        known_starts = {}
+
         ## First Pass - Determine dimensions
-        for x, file in enumerate(self.files):
-            is_aggregated = False
+        self.sample_values = []
+
+        scanned = self._scan_files(
+            agg_dims=agg_dims, workers=workers, sample_budget=sample_budget
+        )
+        for x, (file, summary) in enumerate(zip(self.files, scanned)):
             logger.info(f'First pass: File {x+1}/{len(self.files)}')
 
-            ds = self._call_file(file)
+            self._track_filename(file)
 
             if len(file) == 1:
                 file = file[0]
-            
-            all_dims = ds.dimensions.keys()
-            all_vars = ds.variables.keys()
-
-            # Determine if standard aggregation or fragment extension
-            for v in all_vars:
-                if hasattr(ds[v],'aggregated_dimensions'):
-                    is_aggregated = True
-                    if self.agg_extend is None:
-                        self.agg_extend = True
-                    elif not self.agg_extend:
-                        raise ValueError(
-                            'Mixed file types not allowed. Can only extend'
-                            ' fragment sets or aggregation sets.'
-                        )
 
-            coord_variables = []
-            pure_dimensions = []
-            variables       = []
+            is_aggregated = summary['is_aggregated']
 
-            ## Sort dimension/variable types - switch to dict with types?
-            for d in all_dims:
-                if d in all_vars:
-                    coord_variables.append(d)
-                else:
-                    pure_dimensions.append(d)
+            # Determine if standard aggregation or fragment extension
+            if is_aggregated:
+                if self.agg_extend is None:
+                    self.agg_extend = True
+                elif not self.agg_extend:
+                    raise ValueError(
+                        'Mixed file types not allowed. Can only extend'
+                        ' fragment sets or aggregation sets.'
+                    )
 
-            for v in all_vars:
-                if v not in all_dims:
-                    variables.append(v)
+            all_dims        = summary['dims']
+            coord_variables = summary['coord_variables']
+            pure_dimensions = summary['pure_dimensions']
+            variables       = summary['variables']
 
             if not dim_info:
                 dim_info = {d: {} for d in all_dims}
@@ -97,28 +117,22 @@ class CFACreateMixin:
                     )
 
             ## Accumulate global attributes
-            ncattrs = {}
-            for attr in ds.ncattrs():
-                ncattrs[attr] = ds.getncattr(attr)
-            global_attrs = self._accumulate_attrs(global_attrs, ncattrs)
+            global_attrs = self._accumulate_attrs(global_attrs, summary['ncattrs'])
 
             ## Accumulate dimension info
             fcoord = []
             first_time = (x == 0)
-            for d in all_dims:
+            for d, new_info, arr_components, attrs in summary['dim_info']:
 
                 if dim_info[d] == {} and not first_time:
                     raise ValueError(
                         f'Files contain differing numbers of dimensions. "{d}"'
                         'appears to not be present in all files.'
                     )
-                new_info, arr_components = self._collect_dim_info(
-                    ds, d, pure_dimensions, coord_variables, 
-                    agg_dims=agg_dims, first_time=first_time)
                 
                 if new_info['type'] == 'coord':
                     # Only coordinate dimensions can have attributes
-                    dim_info = self._update_info(ds[d], dim_info, new_info)
+                    dim_info = self._update_info(attrs, dim_info, new_info)
                     if is_aggregated:
                         if 'sizes' not in dim_info[d]:
                             dim_info[d]['sizes'] = []
@@ -137,46 +151,28 @@ class CFACreateMixin:
 
                 if arr_components is not None:
                     if first_time:
-                        for attr in arr_components.keys():
-                            dim_info[d][attr] = [arr_components[attr]]
+                        dim_info[d]['starts'] = [arr_components['starts']]
+                        dim_info[d]['sizes']  = [arr_components['sizes']]
+                        dim_info[d]['arrays'] = _FragmentCoordinates(arr_components['arrays'])
+                        known_starts[d] = {arr_components['starts']}
                     else:
-                        if arr_components['starts'] not in dim_info[d]['starts']:
+                        if arr_components['starts'] not in known_starts[d]:
+                            known_starts[d].add(arr_components['starts'])
                             dim_info[d]['starts'] += [arr_components['starts']]
                             dim_info[d]['sizes']  += [arr_components['sizes']]
-                            dim_info[d]['arrays'] += [arr_components['arrays']]
+                            dim_info[d]['arrays'].append(arr_components['arrays'])
 
                     fcoord.append(arr_components['starts'].item())
 
             ## Accumulate var_info
-            for v in variables:
+            for v, new_info, attrs in summary['var_info']:
+                var_info = self._update_info(attrs, var_info, new_info)
 
-                try:
-                    fill = ds[v].get_fill_value()
-                except:
-                    fill = None
-
-                vdims = []
-                for d in ds[v].dimensions: # Preserving the dimensions per variable
-                    if d in coord_variables:
-                        vdims.append(d)
-
-                new_info = {
-                    'dtype': np.dtype(ds[v].dtype),
-                    'dims' : tuple(ds[v].dimensions),
-                    'cdims': vdims,
-                    'identifiers': v, # Or match with replacement,
-                    '_FillValue': fill,
-                }
-
-                if is_aggregated:
-                    # Special handling for extraction of string variables
-                    # Easier to keep numpy arrays separate if they are wrapped in lists
-                    if ds[v].size == 1:
-                        new_info['arr'] = [np.array(ds[v][0], dtype=ds[v].dtype)]
-                    else:
-                        new_info['arr'] = [np.array(list(ds[v]), dtype=ds[v].dtype)]
+            if summary['statistics'] is not None:
+                self.fragment_stats[tuple(fcoord)] = summary['statistics']
 
-                var_info = self._update_info(ds[v], var_info, new_info)
+            if x < SAMPLE_FILES:
+                self.sample_values.append(summary['values'])
 
             # No variables in current file are aggregations
             if self.agg_extend is None and not is_aggregated:
@@ -194,6 +190,43 @@ class CFACreateMixin:
 
         return arranged_files, global_attrs, var_info, dim_info
 
+    def _scan_files(
+            self, 
+            agg_dims: list = None, 
+            workers: int = None, 
+            sample_budget: int = DEFAULT_SAMPLE_BUDGET
+        ):
+        """
+        Generate the metadata summary of each file from ``_scan_file``, in file order.
+        With more than one of ``workers``, the files are scanned in a pool of worker
+        processes, as opening many files is dominated by filesystem latency. Batches
+        of files are only submitted as earlier batches are merged, so the number of
+        summaries held at once does not grow with the number of files. Files not yet
+        scanned are cancelled if the merge of an earlier file fails.
+        """
+        yield from _scan(
+            self.files,
+            range(len(self.files)),
+            agg_dims=agg_dims,
+            statistics=self.statistics is not None,
+            sample_budget=sample_budget,
+            workers=workers,
+        )
+
+    @staticmethod
+    def _fragment_statistics(ds, var_info: dict) -> dict:
+        """
+        Compute the summary statistics of each numeric variable with coordinate 
+        dimensions in this fragment file. Only the variables found to be aggregated 
+        have their statistics written to the CFA-netCDF file.
+        """
+        stats = {}
+        for v, info in var_info.items():
+            if not info.get('cdims') or np.dtype(info['dtype']).kind not in 'iuf':
+                continue
+            stats[v] = fragment_statistics(ds.variables[v][...])
+        return stats
+
     def _second_pass(
             self,
             var_info : dict,
@@ -202,19 +235,27 @@ class CFACreateMixin:
 
         """
         Second pass through a subset of the files (2) to collect non-aggregated variables
-        which will be stored in the CFA file.
+        which will be stored in the CFA file. Values kept from the first pass are used
+        where available, so the files are only opened again for variables that were 
+        over the sample budget.
         """
 
         logger.info('Performing a second pass on a subset of files.')
         
-        second_set = self.files[:2]
+        second_set = self.files[:SAMPLE_FILES]
         for x, file in enumerate(second_set):
-            logger.info(f'Second pass: File {x+1}/{len(self.files)}')
+            samples = {}
+            if x < len(self.sample_values):
+                samples = self.sample_values[x]
 
-            ds = self._call_file(file) # Typically have to do this twice.
+            missing = [v for v in non_aggregated if v not in samples]
+            if missing:
+                logger.info(f'Second pass: File {x+1}/{len(self.files)}')
+                with self._call_file(file) as ds:
+                    samples = samples | {v: np.array(ds.variables[v][...]) for v in missing}
 
             for v in non_aggregated:
-                new_values = np.array(ds.variables[v])
+                new_values = samples[v]
 
                 if 'data' not in var_info[v]:
                     var_info[v]['data'] = new_values
@@ -225,8 +266,8 @@ class CFACreateMixin:
                         )
         return var_info
 
+    @staticmethod
     def _collect_dim_info(
-            self,
             ds,
             d : str,
             pure_dimensions : list,
@@ -268,7 +309,7 @@ class CFACreateMixin:
             
             if d in agg_dims:
 
-                array = np.array(list(ds[d]), dtype=ds[d].dtype)
+                array = np.array(ds[d][...], dtype=ds[d].dtype)
                 start = array[0]
                 size  = len(array)
 
@@ -354,7 +395,7 @@ class CFACreateMixin:
             dim_info[cd]['f_size'] = len(starts)
 
             if len(starts) == 1:
-                cdimarr = arrays[0]
+                cdimarr = np.array(arrays[0])
                 ndimsizes = (sizes[0],)
                 nstarts = starts[0]
 
@@ -367,17 +408,11 @@ class CFACreateMixin:
                 arr  = narr.astype(np.float64)
                 sort = np.argsort(arr)
 
-                cdimarr = None
-                nds, nstarts = [],[]
-                for s in sort:
-
-                    if cdimarr is None:
-                        cdimarr = np.array(arrays[s])
-                    else:
-                        cdimarr = np.concatenate((cdimarr, np.array(arrays[s])))
+                # Joined in one step, as joining each array in turn is quadratic.
+                cdimarr = np.concatenate([arrays[s] for s in sort])
 
-                    nds.append(sizes[s])
-                    nstarts.append(starts[s])
+                nds     = [sizes[s] for s in sort]
+                nstarts = [starts[s] for s in sort]
 
                 ndimsizes   = tuple(nds) # Removed np.array here
 
@@ -425,6 +460,8 @@ class CFACreateMixin:
         # Initialise empty location container
         location = np.empty(location_space, dtype=f'<U{len(self.longest_filename)}')
 
+        positions = self._start_positions(dim_info)
+
         # Map collected coords to proper place for location.
         for coord in arranged_files.keys():
 
@@ -432,13 +469,78 @@ class CFACreateMixin:
             for x, c in enumerate(coord):
                 if self.fragment_space[x] > 1:
                     new_coord.append(
-                        dim_info[named_cdims[x]]['starts'].index(c)
+                        positions[named_cdims[x]][c]
                     )
 
             location[tuple(new_coord)] = arranged_files[coord]
         
         return location
 
+    def _assemble_statistics(
+            self,
+            var_info : dict,
+            dim_info : dict
+        ) -> dict:
+
+        """
+        Arrange the statistics collected from each fragment file into arrays in the
+        fragment space of each aggregated variable, with one array per statistic.
+        Variables whose fragments have different units have no statistics, as the 
+        values from each fragment are in its own units.
+        """
+
+        logger.debug('Assembling the fragment statistics')
+
+        named_cdims = [k for k, v in dim_info.items() if v['type'] == 'coord']
+        positions   = self._start_positions(dim_info)
+
+        statistics = {}
+        for var, meta in var_info.items():
+            if 'adims' not in meta:
+                continue
+
+            if meta['attrs'].get('units') == self.concat_msg:
+                logger.warning(
+                    f'Fragments of "{var}" have different units, no statistics are recorded'
+                )
+                continue
+
+            shape  = tuple(dim_info[d].get('f_size') or 1 for d in meta['dims'])
+            arrays = {
+                s: np.zeros(shape, dtype=np.int64) if 'count' in s else np.full(shape, np.nan)
+                for s in STATISTICS
+            }
+
+            for coord, fstats in self.fragment_stats.items():
+                if var not in fstats:
+                    continue
+
+                index = []
+                for d in meta['dims']:
+                    if (dim_info[d].get('f_size') or 1) > 1:
+                        c = coord[named_cdims.index(d)]
+                        index.append(positions[d][c])
+                    else:
+                        index.append(0)
+
+                for s, value in zip(STATISTICS, fstats[var]):
+                    arrays[s][tuple(index)] = value
+
+            statistics[var] = arrays
+
+        return statistics
+
+    def _start_positions(self, dim_info: dict) -> dict:
+        """
+        Map the start of each fragment to its position along each fragmented
+        dimension, once the starts have been ordered by ``_arrange_dimensions``.
+        """
+        positions = {}
+        for d, info in dim_info.items():
+            if (info.get('f_size') or 1) > 1:
+                positions[d] = {start: x for x, start in enumerate(info['starts'])}
+        return positions
+
     def _apply_agg_dims(
             self,
             var_info,
@@ -688,6 +790,32 @@ class CFAWriteMixin:
 
             location[(slice(0, None) for i in vopt)] = np.array(loc_data, dtype=str)
 
+    def _write_fragment_statistics(self):
+        """
+        Create the per-fragment statistics variables for each aggregated variable,
+        referenced from the ``aggregated_statistics`` attribute of that variable.
+        These allow readers to answer global reductions without opening any fragment.
+        The min, max and sum are recorded with the units of the fragments.
+        """
+
+        for var, arrays in self.statistics.items():
+            dims  = tuple(f'f_{d}' for d in self.var_info[var]['dims'])
+            units = self.var_info[var]['attrs'].get('units')
+            terms = []
+            for s in STATISTICS:
+                name = f'fragment_{s}_{var}'
+                stat = self.ds.createVariable(
+                    name,
+                    np.int64 if 'count' in s else np.float64,
+                    dims,
+                )
+                stat[:] = arrays[s]
+                if units is not None and 'count' not in s:
+                    stat.units = units
+                terms.append(f'{s}: {name}')
+
+            self.ds.variables[var].aggregated_statistics = ' '.join(terms)
+
     def _write_fragment_shapes(self):
         """
         Construct the ``fragment_map`` variable part for each 
@@ -856,6 +984,10 @@ class CFANetCDF(CFACreateMixin, CFAWriteMixin):
         self.location = None
         self.cdim_opts = None
 
+        self.statistics     = None
+        self.fragment_stats = {}
+        self.sample_values  = []
+
         self.concat_msg = concat_msg
 
         self.ds = None
@@ -865,18 +997,41 @@ class CFANetCDF(CFACreateMixin, CFAWriteMixin):
             updates : dict = None,
             removals: list = None,
             agg_dims: list = None,
+            statistics: bool = False,
+            workers: int = None,
+            sample_budget: int = DEFAULT_SAMPLE_BUDGET,
         ) -> None:
 
         """
         Perform the operations and passes needed to accumulate the set of
         variable/dimension info and attributes to then construct a CFA-netCDF
-        file."""
+        file.
+
+        :param statistics:      (bool) Record the min, max, sum, count and NaN count 
+            of every fragment of each aggregated variable, so readers can answer
+            global reductions and prune fragments from threshold queries without
+            opening the fragments. Requires reading all the fragment data.
+
+        :param workers:         (int) Number of worker processes used to read the
+            metadata of the files in the first pass, which are merged in file order
+            so the result is the same as a serial pass. Default None reads each file
+            in turn.
+
+        :param sample_budget:   (int) Bytes of variable values kept from each of the 
+            first two files in the first pass, to check that non-aggregated variables 
+            are identical without opening those files again. Default 16MiB.
+        """
 
         updates  = updates or {}
         removals = removals or []
 
+        self.statistics     = {} if statistics else None
+        self.fragment_stats = {}
+
         # First pass collect info
-        arranged_files, global_attrs, var_info, dim_info = self._first_pass(agg_dims=agg_dims)
+        arranged_files, global_attrs, var_info, dim_info = self._first_pass(
+            agg_dims=agg_dims, workers=workers, sample_budget=sample_budget
+        )
 
         if self.agg_extend:
             self._extend(
@@ -900,6 +1055,7 @@ class CFANetCDF(CFACreateMixin, CFAWriteMixin):
         # Perform a second pass to collect non-aggregated variables if present.
         if len(non_aggregated) > 0:
             var_info = self._second_pass(var_info, non_aggregated)
+        self.sample_values = []
         
         # Define the fragment space
         self.fragment_space = [v['f_size'] for v in dim_info.values() if 'f_size' in v]
@@ -907,6 +1063,9 @@ class CFANetCDF(CFACreateMixin, CFAWriteMixin):
         # Assemble the location with correct dimensions
         location = self._assemble_location(arranged_files, dim_info)
 
+        if statistics:
+            self.statistics = self._assemble_statistics(var_info, dim_info)
+
         self.global_attrs = global_attrs
         self.dim_info   = dim_info
         self.var_info   = var_info
@@ -958,6 +1117,9 @@ class CFANetCDF(CFACreateMixin, CFAWriteMixin):
 
         self._write_variables()
 
+        if self.statistics:
+            self._write_fragment_statistics()
+
         self.ds.close()
 
     def handle_conventions(self, value) -> str:
@@ -1423,17 +1585,257 @@ class CFANetCDF(CFACreateMixin, CFAWriteMixin):
         to be used to define the ``uris`` parameter later.
         """
 
+        self._track_filename(file)
         if isinstance(file, tuple):
-            ds = netCDF4.Dataset(file[0])
-            for f in file:
-                if len(f) > len(self.longest_filename):
-                    self.longest_filename = f
-        else:
-            ds = netCDF4.Dataset(file)
-            if len(file) > len(self.longest_filename):
-                self.longest_filename = file
+            return netCDF4.Dataset(file[0])
+        return netCDF4.Dataset(file)
+
+    def _track_filename(self, file):
+        """
+        Record the longest of the filenames given for ``file``, used to define
+        the ``uris`` parameter later.
+        """
+        if not isinstance(file, tuple):
+            file = (file,)
+        for f in file:
+            if len(f) > len(self.longest_filename):
+                self.longest_filename = f
+
+class _Attributes:
+    """
+    Snapshot of the name and attributes of a netCDF variable, which can be passed
+    between processes in place of the variable for ``_update_info``.
+    """
+
+    def __init__(self, ncattr_obj):
+        self.name   = ncattr_obj.name
+        self._attrs = {a: ncattr_obj.getncattr(a) for a in ncattr_obj.ncattrs()}
+
+    def ncattrs(self):
+        return list(self._attrs.keys())
+
+    def getncattr(self, attr):
+        return self._attrs[attr]
+
+class _FragmentCoordinates:
+    """
+    The coordinate values of each fragment along one dimension, held in a single
+    array which grows as fragments are added, rather than as one array per fragment.
+    Indexing returns the values of one fragment as a view of the single array.
+    """
+
+    def __init__(self, array):
+        array = np.asarray(array).ravel()
+
+        self._values  = np.empty(max(16, array.size), dtype=array.dtype)
+        self._offsets = np.zeros(17, dtype=np.int64)
+        self._count   = 0
+
+        self.append(array)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(f'Fragment {index} out of range for {self._count} fragments')
+        return self._values[self._offsets[index]:self._offsets[index+1]]
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
 
-        return ds
+    def append(self, array):
+        """
+        Add the coordinate values of the next fragment, growing the arrays by doubling
+        when full.
+        """
+        array = np.asarray(array).ravel()
+        end   = self._offsets[self._count]
+        dtype = np.result_type(self._values.dtype, array.dtype)
+
+        if dtype != self._values.dtype or end + array.size > self._values.size:
+            values = np.empty(max(2 * self._values.size, end + array.size), dtype=dtype)
+            values[:end] = self._values[:end]
+            self._values = values
+
+        if self._count + 2 > self._offsets.size:
+            offsets = np.zeros(2 * self._offsets.size, dtype=np.int64)
+            offsets[:self._offsets.size] = self._offsets
+            self._offsets = offsets
+
+        self._values[end:end + array.size] = array
+        self._count += 1
+        self._offsets[self._count] = end + array.size
+
+def _scan(
+        files: list,
+        indices,
+        agg_dims: list = None,
+        statistics: bool = False,
+        sample_budget: int = DEFAULT_SAMPLE_BUDGET,
+        workers: int = None,
+    ):
+    """
+    Generate the summary of each of ``files`` from ``_scan_file``, in order, given
+    the position of each file in the aggregation in ``indices``. See 
+    ``CFACreateMixin._scan_files``.
+    """
+    args = (
+        files,
+        indices,
+        repeat(agg_dims),
+        repeat(statistics),
+        repeat(sample_budget),
+    )
+
+    if not workers or workers < 2:
+        yield from map(_scan_file, *args)
+        return
+
+    # Forked workers would inherit netCDF/HDF5 library state.
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn')
+    )
+    batch_size = max(1, min(SCAN_BATCH, len(files) // (workers * 16)))
+    arguments  = zip(*args)
+
+    pending = deque()
+    try:
+        while batch := list(islice(arguments, batch_size)):
+            pending.append(executor.submit(_scan_batch, batch))
+            if len(pending) >= workers * SCAN_AHEAD:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+def _scan_batch(batch: list) -> list:
+    """
+    Scan each file in ``batch`` in turn, given as the arguments to ``_scan_file``.
+    """
+    return [_scan_file(*args) for args in batch]
+
+def _scan_file(
+        file, 
+        index: int, 
+        agg_dims: list = None, 
+        statistics: bool = False,
+        sample_budget: int = DEFAULT_SAMPLE_BUDGET,
+    ) -> dict:
+    """
+    Extract the metadata of one file needed by the first pass, in a form that can be
+    returned from a worker process. The dimension info of the first file (``index``
+    0) is collected for all coordinate variables, as in ``_collect_dim_info``.
+
+    :returns:   A dict of the dimension and variable names in the file, the global
+        attributes, the info and attributes of each dimension and variable, the
+        fragment statistics if requested and the file is not itself an aggregation,
+        and the values of any variables sampled from the first files.
+    """
+    if isinstance(file, tuple):
+        file = file[0]
+
+    with netCDF4.Dataset(file) as ds:
+        all_dims = list(ds.dimensions.keys())
+        all_vars = list(ds.variables.keys())
+
+        is_aggregated = any(hasattr(ds[v], 'aggregated_dimensions') for v in all_vars)
+
+        coord_variables = [d for d in all_dims if d in all_vars]
+        pure_dimensions = [d for d in all_dims if d not in all_vars]
+        variables       = [v for v in all_vars if v not in all_dims]
+
+        ncattrs = {attr: ds.getncattr(attr) for attr in ds.ncattrs()}
+
+        dim_info = []
+        for d in all_dims:
+            new_info, arr_components = CFACreateMixin._collect_dim_info(
+                ds, d, pure_dimensions, coord_variables, 
+                agg_dims=agg_dims, first_time=(index == 0))
+
+            attrs = None
+            if new_info['type'] == 'coord':
+                attrs = _Attributes(ds[d])
+            dim_info.append((d, new_info, arr_components, attrs))
+
+        var_info = []
+        for v in variables:
+
+            try:
+                fill = ds[v].get_fill_value()
+            except:
+                fill = None
+
+            vdims = []
+            for d in ds[v].dimensions: # Preserving the dimensions per variable
+                if d in coord_variables:
+                    vdims.append(d)
+
+            new_info = {
+                'dtype': np.dtype(ds[v].dtype),
+                'dims' : tuple(ds[v].dimensions),
+                'cdims': vdims,
+                'identifiers': v, # Or match with replacement,
+                '_FillValue': fill,
+            }
+
+            if is_aggregated:
+                # Special handling for extraction of string variables
+                # Easier to keep numpy arrays separate if they are wrapped in lists
+                if ds[v].size == 1:
+                    new_info['arr'] = [np.array(ds[v][0], dtype=ds[v].dtype)]
+                else:
+                    new_info['arr'] = [np.array(list(ds[v]), dtype=ds[v].dtype)]
+
+            var_info.append((v, new_info, _Attributes(ds[v])))
+
+        fragment_stats = None
+        if statistics and not is_aggregated:
+            fragment_stats = CFACreateMixin._fragment_statistics(
+                ds, {v: info for v, info, _ in var_info}
+            )
+
+        values = {}
+        if index < SAMPLE_FILES and not is_aggregated:
+            values = _sample_values(ds, var_info, agg_dims, sample_budget)
+
+    return {
+        'is_aggregated': is_aggregated,
+        'dims': all_dims,
+        'coord_variables': coord_variables,
+        'pure_dimensions': pure_dimensions,
+        'variables': variables,
+        'ncattrs': ncattrs,
+        'dim_info': dim_info,
+        'var_info': var_info,
+        'statistics': fragment_stats,
+        'values': values,
+    }
+
+def _sample_values(ds, var_info: list, agg_dims: list, sample_budget: int) -> dict:
+    """
+    Read the values of the variables in ``ds`` which may be non-aggregated, smallest
+    first, until ``sample_budget`` bytes have been read. Variables spanning any of the
+    ``agg_dims`` are aggregated so are never sampled, if the dimensions are known.
+    """
+    candidates = []
+    for v, info, _ in var_info:
+        if agg_dims and set(info['cdims']) & set(agg_dims):
+            continue
+        candidates.append((ds[v].size * np.dtype(info['dtype']).itemsize, v))
+
+    values = {}
+    for nbytes, v in sorted(candidates):
+        if nbytes > sample_budget:
+            break
+        values[v] = np.array(ds.variables[v][...])
+        sample_budget -= nbytes
+    return values
 
 def _display_attrs(attrs):
     for k, v in attrs.items():
@@ -4,6 +4,7 @@ __copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
 
 import logging
 import re
+from functools import partial
 
 import netCDF4
 import numpy as np
@@ -13,8 +14,11 @@ from xarray.core import indexing
 from xarray.core.utils import FrozenDict
 from xarray.core.variable import Variable
 
-from cfapyx.decoder import get_fragment_extents, get_fragment_positions
+from cfapyx.decoder import (FragmentTable, get_fragment_bounds,
+                            get_string_table)
 from cfapyx.group import CFAGroupWrapper
+from cfapyx.metadata import get_metadata_cache
+from cfapyx.statistics import FragmentStatistics
 from cfapyx.wrappers import FragmentArrayWrapper
 
 from cfapyx.utils import logstream, CONVENTIONS
@@ -51,6 +55,28 @@ class CFADataStore(NetCDF4DataStore):
     def chunks(self, value):
         self._cfa_chunks = value
 
+    @property
+    def drop_variables(self):
+        if hasattr(self,'_drop_variables'):
+            return self._drop_variables
+        return None
+
+    @drop_variables.setter
+    def drop_variables(self, value):
+        if isinstance(value, str):
+            value = [value]
+        self._drop_variables = value
+
+    @property
+    def decoded_fragment_arrays(self):
+        """
+        Decoded fragment array variables for this file, keyed by group path, variable
+        name and ``fragment_space``.
+        """
+        if not hasattr(self, '_decoded_fragment_arrays'):
+            self._decoded_fragment_arrays = {}
+        return self._decoded_fragment_arrays
+
     @property
     def cfa_options(self):
         """
@@ -62,7 +88,18 @@ class CFADataStore(NetCDF4DataStore):
             'substitutions': self._substitutions,
             'decode_cfa': self._decode_cfa,
             'chunks': self.chunks,
-            'chunk_limits': self._chunk_limits
+            'chunk_limits': self._chunk_limits,
+            'max_open_files': self._max_open_files,
+            'prefetch': self._prefetch,
+            'cache_dir': self._cache_dir,
+            'cache_size': self._cache_size,
+            'cache_locations': self._cache_locations,
+            'lazy_decode': self._lazy_decode,
+            'keep_variables': self._keep_variables,
+            'global_lock': self._global_lock,
+            'processes': self._processes,
+            'instrument': self._instrument,
+            'metadata_cache': self._metadata_cache,
         }
 
     @cfa_options.setter
@@ -75,6 +112,17 @@ class CFADataStore(NetCDF4DataStore):
             decode_cfa=True,
             chunks={},
             chunk_limits=True,
+            max_open_files=None,
+            prefetch=None,
+            cache_dir=None,
+            cache_size=None,
+            cache_locations=None,
+            lazy_decode=False,
+            keep_variables=None,
+            global_lock=None,
+            processes=None,
+            instrument=False,
+            metadata_cache=None,
         ):
         """
         Method to set cfa options.
@@ -88,12 +136,78 @@ class CFADataStore(NetCDF4DataStore):
         :param chunks:          (dict) Not implemented in 2024.9.0
 
         :param chunk_limits:    (dict) Not implemented in 2024.9.0
+
+        :param max_open_files:  (int) Budget for the number of fragment files held 
+                                open by the process-wide handle pool. A value of 0 
+                                disables handle pooling, default uses the existing
+                                pool budget.
+
+        :param prefetch:        (int) Number of fragments to read ahead along the leading
+                                aggregated dimension whenever a fragment is read. Default
+                                None disables prefetching.
+
+        :param cache_dir:       (str) Local directory for the on-disk cache of fragment
+                                data from remote (e.g. ``https://``) locations. Default 
+                                None disables the cache.
+
+        :param cache_size:      (int) Byte budget for the fragment cache, the least 
+                                recently used data is removed once this is exceeded.
+
+        :param cache_locations: (list) Additional location prefixes (e.g. network mounts)
+                                for which fragment data should be cached.
+
+        :param lazy_decode:     (bool) Defer decoding the fragment array variables of each
+                                aggregated variable until its data is first accessed,
+                                default is False.
+
+        :param keep_variables:  (list) Names of the only variables to open, along with
+                                the coordinate variables of their dimensions. Fragment
+                                array variables of all other aggregated variables are 
+                                never read. Default None opens all variables.
+
+        :param global_lock:     (bool) Hold the global netCDF/HDF5 lock for every fragment
+                                read in addition to the per-file lock. Default None only
+                                takes it where the library build is not thread-safe. 
+                                False is unsafe for netCDF fragments without a thread-safe
+                                build.
+
+        :param processes:       (int) Number of worker processes to read fragment data,
+                                returned through shared memory. Default None reads in
+                                the calling thread.
+
+        :param instrument:      (bool) Record the open, read, unit conversion and graph
+                                build times of the aggregated variables in the 
+                                process-wide ``ReadRecorder``, default is False.
+
+        :param metadata_cache:  (str) Directory of the persistent cache of decoded 
+                                aggregation metadata, or True for the user cache 
+                                directory. A warm open of an unchanged file then skips
+                                reading the fragment array variables. Default None 
+                                disables the cache.
         """
 
         self.chunks = chunks
         self._substitutions = substitutions
         self._decode_cfa    = decode_cfa
         self._chunk_limits  = chunk_limits
+        self._max_open_files = max_open_files
+        self._prefetch       = prefetch
+
+        self._cache_dir       = cache_dir
+        self._cache_size      = cache_size
+        self._cache_locations = cache_locations
+
+        self._lazy_decode = lazy_decode
+
+        if isinstance(keep_variables, str):
+            keep_variables = [keep_variables]
+        self._keep_variables = keep_variables
+
+        self._global_lock = global_lock
+        self._processes   = processes
+        self._instrument  = instrument
+
+        self._metadata_cache = metadata_cache
 
     def _acquire(self, needs_lock=True):
         """
@@ -155,7 +269,8 @@ class CFADataStore(NetCDF4DataStore):
             array_shape,
             value=None, 
             cformat='', 
-            substitutions=None):
+            substitutions=None,
+            statistics=None):
         """
         Private method for performing the decoding of the standard ``fragment array 
         variables``. Any convention version-specific adjustments should be made prior 
@@ -181,28 +296,32 @@ class CFADataStore(NetCDF4DataStore):
 
         :param substitutions:   (dict) Set of substitutions to apply in the form 'base':'sub'
 
-        :returns:       (fragment_info) A dictionary of fragment metadata where each 
-                        key is the coordinates of a fragment in index space and the 
-                        value is a dictionary of the attributes specific to that 
-                        fragment.
+        :param statistics:  (dict) *Optional* per-fragment statistics variables by the name
+                            of each statistic, from the ``aggregated_statistics`` attribute.
+
+        :returns:       (fragment_info) A ``FragmentTable`` of fragment metadata, holding 
+                        the extent of each fragment in index space as integer arrays and 
+                        the locations and addresses as indices into tables of unique 
+                        values, along with the ``fragment_space``.
 
         """
         
-        fragment_info = {}
-
-        # Extract non-padded fragment sizes per dimension.
-        fragment_size_per_dim = [i.compressed().tolist() for i in shape]
+        # Start and stop of each fragment in array space, per dimension.
+        starts, stops = self._decoded(shape, self._decode_shape)
 
         # Derive the total shape of the fragment array in all fragmented dimensions.
-        fragment_space    = [len(fsize) for fsize in fragment_size_per_dim]
-
-        # Obtain the positions of each fragment in index space.
-        fragment_positions = get_fragment_positions(fragment_size_per_dim)
-
-        global_extent, extent, shapes = get_fragment_extents(
-            fragment_size_per_dim, 
-            array_shape
-        )
+        fragment_space = tuple(len(s) for s in starts)
+
+        if statistics:
+            units = getattr(statistics['min'], 'units', None) if 'min' in statistics else None
+            statistics = FragmentStatistics(**{
+                name: self._decoded(
+                    var, lambda v: np.ma.filled(v[...].astype(np.float64), np.nan)
+                )
+                for name, var in statistics.items()
+            }, units=units)
+        else:
+            statistics = None
 
         if value is not None:
             # --------------------------------------------------------
@@ -210,92 +329,182 @@ class CFADataStore(NetCDF4DataStore):
             # locations.
             # --------------------------------------------------------
             fragment_space = value.shape
-            fragment_info = {
-                frag_pos: {
-                    "shape": shapes[frag_pos],
-                    "fill_value": value[frag_pos].item(),
-                    "global_extent": global_extent[frag_pos],
-                    "extent": extent[frag_pos],
-                    "format": "full",
-                }
-                for frag_pos in fragment_positions
-            }
+            fill_values    = self._decoded(
+                value, 
+                lambda v: np.asarray(v[...]).reshape(fragment_space),
+                fragment_space=fragment_space
+            )
+            fragment_info  = FragmentTable(
+                starts, stops, fill_values=fill_values, statistics=statistics
+            )
 
             return fragment_info, fragment_space
 
-        if not address.ndim: # Scalar address
-            addr    = address.getValue()
-            adtype  = np.array(addr).dtype
-            address = np.full(fragment_space, addr, dtype=adtype)
+        def string_table(values):
+            return get_string_table(values[...], fragment_space)
+
+        locations, location_index = self._decoded(location, string_table, fragment_space)
+        addresses, address_index  = self._decoded(address, string_table, fragment_space)
 
+        formats, format_index = None, None
         if cformat != '':
-            if not cformat.ndim:
-                cft = cformat.getValue()
-                npdtype = np.array(cft).dtype
-                cformat = np.full(fragment_space, cft, dtype=npdtype)
-
-        for frag_pos in fragment_positions:
-
-            fragment_info[frag_pos] = {
-                "shape"    : shapes[frag_pos],
-                "location" : location[frag_pos],
-                "address"  : address[frag_pos],
-                "extent"   : extent[frag_pos],
-                "global_extent": global_extent[frag_pos]
-            }
-            if hasattr(cformat, 'shape'):
-                fragment_info[frag_pos]["format"] = cformat[frag_pos]
+            formats, format_index = self._decoded(cformat, string_table, fragment_space)
+
+        fragment_info = FragmentTable(
+            starts, stops,
+            locations=locations,
+            location_index=location_index,
+            addresses=addresses,
+            address_index=address_index,
+            formats=formats,
+            format_index=format_index,
+            statistics=statistics,
+        )
 
         # Apply string substitutions to the fragment filenames
         if substitutions:
-            for value in fragment_info.values():
-                for base, sub in substitutions.items():
-                    if isinstance(value['location'], str):
-                        value["location"] = value["location"].replace(base, sub)
-                    else:
-                        for v in value["location"]:
-                            v = v.replace(base, sub)
+            for base, sub in substitutions.items():
+                fragment_info.substitute(base, sub)
 
         return fragment_info, fragment_space
 
+    def _decode_shape(self, shape):
+        """
+        Decode the ``shape`` fragment array variable into the start and stop of each
+        fragment along each dimension.
+        """
+        # Extract non-padded fragment sizes per dimension.
+        fragment_size_per_dim = [i.compressed().tolist() for i in shape]
+        return get_fragment_bounds(fragment_size_per_dim)
+
+    def _decoded(self, var, decode, fragment_space=None):
+        """
+        Decode the fragment array variable ``var`` with ``decode``, reusing the result
+        if this variable has already been decoded for this file. Aggregated variables
+        which share fragment array variables then share one decoded structure.
+
+        :param var:             (obj) The NetCDF4.Variable for a fragment array variable.
+
+        :param decode:          (callable) Function to decode the values of ``var``.
+
+        :param fragment_space:  (tuple) The number of fragments along each dimension. 
+                                Scalar variables are expanded to this shape.
+        """
+        key = (var.group().path, var.name, fragment_space)
+        if key in self.decoded_fragment_arrays:
+            return self.decoded_fragment_arrays[key]
+
+        values = var
+        if fragment_space is not None and not var.ndim: 
+            # Scalar variable, same value for all fragments
+            item   = var.getValue()
+            values = np.full(fragment_space, item, dtype=np.array(item).dtype)
+
+        decoded = decode(values)
+        self.decoded_fragment_arrays[key] = decoded
+        return decoded
+
+    def _deferred_decoding(self, name, array_shape, agg_data, statistics=None):
+        """
+        Decode the fragments of the aggregated variable ``name`` on first data access
+        with ``lazy_decode``, which may be in a dask worker thread. The fragment array
+        variables are read and ``decoded_fragment_arrays`` updated while holding the
+        store lock, as for any other read from this file.
+        """
+        with self.lock:
+            return self._cached_decoding(
+                name, array_shape, agg_data, statistics=statistics, needs_lock=False
+            )
+
+    def _cached_decoding(
+            self, name, array_shape, agg_data, statistics=None, needs_lock=True
+        ):
+        """
+        Decode the fragments of the aggregated variable ``name``, see ``perform_decoding``.
+        The decoded fragments are taken from the persistent ``MetadataCache`` if enabled
+        and the file is unchanged since they were stored, otherwise they are decoded and
+        stored for the next open. User substitutions are applied to the fragments after
+        decoding, so do not change the cached metadata.
+
+        :param needs_lock:  (bool) Acquire the file with the store lock, False if the
+                            caller already holds it.
+        """
+        if not self._metadata_cache:
+            return self.perform_decoding(
+                array_shape, agg_data, statistics=statistics, needs_lock=needs_lock
+            )
+
+        directory = self._metadata_cache
+        if directory is True:
+            directory = None
+        cache = get_metadata_cache(directory)
+
+        key = cache.key(self._filename, self._group)
+        if key is None:
+            return self.perform_decoding(
+                array_shape, agg_data, statistics=statistics, needs_lock=needs_lock
+            )
+
+        decoded = cache.get(key, name)
+        if decoded is None:
+            decoded = self.perform_decoding(
+                array_shape, agg_data, statistics=statistics, needs_lock=needs_lock
+            )
+            cache.put(key, name, *decoded)
+        return decoded
+
     # Public class methods
 
-    def perform_decoding(self, array_shape, agg_data):
+    def perform_decoding(self, array_shape, agg_data, statistics=None, needs_lock=True):
         """
         Public method ``perform_decoding`` involves extracting the aggregated 
         information parameters and assembling the required information for actual 
         decoding.
+
+        :param statistics:  (dict) *Optional* names of the per-fragment statistics 
+                            variables, by the name of each statistic.
+
+        :param needs_lock:  (bool) Acquire the file with the store lock, False if the
+                            caller already holds it.
         """
 
+        ds = self._acquire(needs_lock)
+
         # If not raised an error in checking, we can continue.
         self._check_applied_conventions(agg_data)
 
-        cformat = ''
-        value   = None
+        cformat  = ''
+        value    = None
+        location = None
+        address  = None
         if self._internal_convention == 'beta':
            # Beta Version (Earliest)
-            shape        = self.ds.variables[agg_data['location']]
-            location     = self.ds.variables[agg_data['file']]
-            cformat      = self.ds.variables[agg_data['format']]
+            shape        = ds.variables[agg_data['location']]
+            location     = ds.variables[agg_data['file']]
+            cformat      = ds.variables[agg_data['format']]
         else:
             conventions = CONVENTIONS[self._internal_convention]
-            shape = self.ds.variables[agg_data[conventions[0]]]
+            shape = ds.variables[agg_data[conventions[0]]]
 
             if self._internal_convention == 'secondary':
-                value = self.ds.variables[agg_data['unique_values']]
+                value = ds.variables[agg_data['unique_values']]
             else:
-                location = self.ds.variables[agg_data[conventions[1]]]
-                address  = self.ds.variables[agg_data[conventions[2]]]
+                location = ds.variables[agg_data[conventions[1]]]
+                address  = ds.variables[agg_data[conventions[2]]]
                 if 'value' in agg_data:
-                    value    = self.ds.variables[agg_data['value']]
+                    value    = ds.variables[agg_data['value']]
         subs = {}
         if hasattr(location, 'substitutions'):
             subs = location.substitutions.replace('https://', 'https@//')
             subs = self._decode_feature_data(subs, readd={'https://':'https@//'})
 
+        if statistics:
+            statistics = {k: ds.variables[v] for k, v in statistics.items()}
+
         return self._perform_decoding(shape, address, location, array_shape,
                                       cformat=cformat, value=value, 
-                                      substitutions = xarray_subs | subs) 
+                                      substitutions = xarray_subs | subs,
+                                      statistics=statistics) 
         # Combine substitutions with known defaults for using in xarray.
 
     def get_variables(self):
@@ -313,8 +522,9 @@ class CFADataStore(NetCDF4DataStore):
         """
 
         if not self._decode_cfa:
+            variables = self._select_variables(dict(self.ds.variables))
             return FrozenDict(
-                (k, self.open_variable(k, v)) for k, v in self.ds.variables.items()
+                (k, self.open_variable(k, v)) for k, v in variables.items()
             )
 
         # Determine CFA-aggregated variables
@@ -333,6 +543,12 @@ class CFADataStore(NetCDF4DataStore):
 
                 for vname in agg_data:
                     fragment_array_vars += re.split(': | ',vname)
+
+                # Per-fragment statistics variables are also fragment array variables.
+                if hasattr(self.ds.variables[avar], 'aggregated_statistics'):
+                    fragment_array_vars += re.split(
+                        ': | ', self.ds.variables[avar].aggregated_statistics
+                    )
                 
             all_vars[avar] = (self.ds.variables[avar], cfa)
 
@@ -341,11 +557,45 @@ class CFADataStore(NetCDF4DataStore):
             if var not in fragment_array_vars:
                 real_vars[var] = all_vars[var]
 
+        # Skipped variables are never opened, so their fragment arrays are not read.
+        real_vars = self._select_variables(real_vars)
 
         return FrozenDict(
             (k, self.open_variable(k, v)) for k, v in real_vars.items()
         )
 
+    def _select_variables(self, variables: dict) -> dict:
+        """
+        Remove variables excluded by ``drop_variables`` or not requested by the
+        ``keep_variables`` option, before any of them are opened or decoded.
+
+        :param variables:   (dict) Named NetCDF4 variables, or tuples of the form 
+                            ``(NetCDF4.Variable, cfa)`` as in ``open_variable``.
+        """
+
+        if self._keep_variables is not None:
+            keep = set(self._keep_variables)
+            for name in self._keep_variables:
+                if name not in variables:
+                    continue
+                var = variables[name]
+                if isinstance(var, tuple):
+                    var = var[0]
+
+                # Coordinate variables for the dimensions of each kept variable.
+                if hasattr(var, 'aggregated_dimensions'):
+                    keep.update(var.aggregated_dimensions.split(' '))
+                else:
+                    keep.update(var.dimensions)
+
+            variables = {k: v for k, v in variables.items() if k in keep}
+
+        if self.drop_variables:
+            drop = set(self.drop_variables)
+            variables = {k: v for k, v in variables.items() if k not in drop}
+
+        return variables
+
     def get_attrs(self):
         """
         Produce the FrozenDict of attributes from the ``NetCDF4.Dataset`` or 
@@ -399,11 +649,25 @@ class CFADataStore(NetCDF4DataStore):
         }
         agg_data  = self._decode_feature_data(var.aggregated_data)
 
+        statistics = None
+        if hasattr(var, 'aggregated_statistics'):
+            statistics = self._decode_feature_data(var.aggregated_statistics)
+
         ## Array Metadata
         dimensions  = tuple(real_dims.keys())
         array_shape = tuple(real_dims.values())
 
-        fragment_info, fragment_space = self.perform_decoding(array_shape, agg_data)
+        decoder = None
+        if self._lazy_decode:
+            # Fragment array variables are only read on first data access.
+            fragment_info, fragment_space = None, None
+            decoder = partial(
+                self._deferred_decoding, name, array_shape, agg_data, statistics=statistics
+            )
+        else:
+            fragment_info, fragment_space = self._cached_decoding(
+                name, array_shape, agg_data, statistics=statistics
+            )
 
         units = ''
         if hasattr(var, 'units'):
@@ -427,6 +691,7 @@ class CFADataStore(NetCDF4DataStore):
                 dtype=var.dtype,
                 cfa_options=self.cfa_options,
                 named_dims=dimensions,
+                decoder=decoder,
             ))
             
         encoding = {}
@@ -3,7 +3,11 @@ __contact__   = "daniel.westwood@stfc.ac.uk"
 __copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
 
 import logging
-from itertools import accumulate, product
+from collections.abc import Mapping
+from itertools import product
+
+import numpy as np
+from dask.base import tokenize
 
 from cfapyx.utils import logstream
 
@@ -26,9 +30,305 @@ def get_fragment_positions(fragment_size_per_dim):
     """
     return product(*(range(len(sizes)) for sizes in fragment_size_per_dim))
 
+def get_fragment_bounds(fragment_size_per_dim):
+    """
+    Get the start and stop of each fragment in ``array space``, along each dimension.
+
+    :param fragment_size_per_dim:       (list) The set of fragment sizes per dimension. first dimension has length 
+                                        equal to the number of array dimensions, second dimension is a list of the
+                                        fragment sizes for the corresponding array dimension.
+
+    :returns:       The tuples of ``starts`` and ``stops`` with one integer array per dimension, giving the
+                    start and stop index of each fragment along that dimension.
+    """
+    starts, stops = [], []
+    for fs in fragment_size_per_dim:
+        offsets = np.concatenate(([0], np.cumsum(fs, dtype=np.int64)))
+        starts.append(offsets[:-1])
+        stops.append(offsets[1:])
+    return tuple(starts), tuple(stops)
+
+def get_string_table(values, fragment_space):
+    """
+    Deduplicate the per-fragment ``values`` (e.g. locations or addresses) into a table of
+    unique values and an integer index into that table for every fragment.
+
+    :param values:          (obj) Array of values with shape ``fragment_space``, or with an
+                            additional trailing dimension where each fragment has several values.
+
+    :param fragment_space:  (tuple) The number of fragments along each dimension.
+
+    :returns:       The list of unique values and the integer array of indices into this list, 
+                    with shape ``fragment_space``.
+    """
+    values = np.asarray(values, dtype=object)
+    nfrags = int(np.prod(fragment_space, dtype=np.int64))
+
+    if values.ndim > len(fragment_space):
+        # Multiple values per fragment, kept together as a tuple.
+        rows = values.reshape(nfrags, -1)
+        flat = np.empty(nfrags, dtype=object)
+        flat[:] = [tuple(r) for r in rows]
+    else:
+        flat = values.reshape(nfrags)
+
+    table, lookup = [], {}
+    index = np.empty(nfrags, dtype=np.int32)
+    for i, v in enumerate(flat):
+        if v not in lookup:
+            lookup[v] = len(table)
+            table.append(v)
+        index[i] = lookup[v]
+
+    return table, index.reshape(fragment_space)
+
+class FragmentTable:
+    """
+    Columnar description of every fragment in an aggregated array. Fragment positions
+    along each dimension are given by integer ``starts`` and ``stops`` arrays, and the
+    location, address and format of each fragment by an integer index into a table of
+    unique values. Per-fragment dictionaries are only created on request.
+    """
+
+    description = 'Columnar table of fragment metadata'
+
+    def __init__(
+            self,
+            starts,
+            stops,
+            locations=None,
+            location_index=None,
+            addresses=None,
+            address_index=None,
+            formats=None,
+            format_index=None,
+            fill_values=None,
+            statistics=None,
+        ):
+        """
+        :param starts:          (tuple) The start of each fragment in ``array space``, one 
+                                integer array per dimension.
+
+        :param stops:           (tuple) The stop of each fragment in ``array space``, one
+                                integer array per dimension.
+
+        :param locations:       (list) The unique fragment locations.
+
+        :param location_index:  (obj) Integer array with shape ``fragment_space`` of indices 
+                                into ``locations``.
+
+        :param addresses:       (list) The unique fragment addresses.
+
+        :param address_index:   (obj) Integer array of indices into ``addresses``.
+
+        :param formats:         (list) The unique fragment formats, if provided.
+
+        :param format_index:    (obj) Integer array of indices into ``formats``.
+
+        :param fill_values:     (obj) Array with shape ``fragment_space`` of the single value
+                                of each fragment, for fragments defined by a ``value`` rather 
+                                than a file.
+
+        :param statistics:      (obj) The ``FragmentStatistics`` recorded for each fragment
+                                in the CFA file, if present.
+        """
+
+        self.starts = tuple(np.asarray(s, dtype=np.int64) for s in starts)
+        self.stops  = tuple(np.asarray(s, dtype=np.int64) for s in stops)
+
+        self.locations      = locations
+        self.location_index = location_index
+        self.addresses      = addresses
+        self.address_index  = address_index
+        self.formats        = formats
+        self.format_index   = format_index
+        self.fill_values    = fill_values
+        self.statistics     = statistics
+
+    @classmethod
+    def from_dict(cls, fragment_info: dict, fragment_space):
+        """
+        Create the table from the per-fragment dictionary form of ``fragment_info``, 
+        where each fragment is described by a ``shape``, ``global_extent`` and either 
+        a ``location`` and ``address`` or a ``fill_value``.
+        """
+        fragment_space = tuple(fragment_space)
+        ndim = len(fragment_space)
+
+        starts, stops = [], []
+        for dim in range(ndim):
+            position = [0]*ndim
+            dstart, dstop = [], []
+            for x in range(fragment_space[dim]):
+                position[dim] = x
+                finfo = fragment_info[tuple(position)]
+                ext   = finfo['global_extent'][dim]
+                dstart.append(ext.start or 0)
+                dstop.append((ext.start or 0) + finfo['shape'][dim])
+            starts.append(dstart)
+            stops.append(dstop)
+
+        positions = list(product(*(range(n) for n in fragment_space)))
+        first = fragment_info[positions[0]]
+
+        def column(name):
+            values = np.empty(len(positions), dtype=object)
+            values[:] = [fragment_info[pos][name] for pos in positions]
+            return get_string_table(values.reshape(fragment_space), fragment_space)
+
+        kwargs = {}
+        if 'fill_value' in first:
+            fill_values = np.array([fragment_info[pos]['fill_value'] for pos in positions])
+            kwargs['fill_values'] = fill_values.reshape(fragment_space)
+        else:
+            kwargs['locations'], kwargs['location_index'] = column('location')
+            kwargs['addresses'], kwargs['address_index']  = column('address')
+        if 'format' in first and 'fill_value' not in first:
+            kwargs['formats'], kwargs['format_index'] = column('format')
+
+        return cls(starts, stops, **kwargs)
+
+    def __len__(self):
+        return int(np.prod(self.fragment_space, dtype=np.int64))
+
+    def __getitem__(self, pos):
+        """
+        The dictionary description of the fragment at ``pos`` in ``fragment space``.
+        """
+        pos  = tuple(pos)
+        info = {
+            'shape': list(self.shape(pos)),
+            'global_extent': self.global_extent(pos),
+            'extent': self.extent(pos),
+        }
+        if self.is_constant:
+            info['fill_value'] = self.fill_value(pos)
+            info['format'] = 'full'
+            return info
+
+        info['location'] = self.location(pos)
+        info['address']  = self.address(pos)
+        if self.formats is not None:
+            info['format'] = self.format(pos)
+        return info
+
+    def __dask_tokenize__(self):
+        return tokenize(
+            self.starts, self.stops,
+            self.locations, self.location_index,
+            self.addresses, self.address_index,
+            self.formats, self.format_index,
+            self.fill_values
+        )
+
+    @property
+    def fragment_space(self) -> tuple:
+        return tuple(len(s) for s in self.starts)
+
+    @property
+    def ndim(self) -> int:
+        return len(self.starts)
+
+    @property
+    def is_constant(self) -> bool:
+        """
+        True if the fragments are defined by a single value rather than a file.
+        """
+        return self.fill_values is not None
+
+    def keys(self):
+        return product(*(range(n) for n in self.fragment_space))
+
+    def bounds(self, dim: int):
+        """
+        The fragment boundaries along ``dim`` in ``array space``, an integer array of 
+        length ``n_fragments + 1``.
+        """
+        return np.concatenate((self.starts[dim], self.stops[dim][-1:]))
+
+    def shape(self, pos) -> tuple:
+        return tuple(
+            int(self.stops[d][p] - self.starts[d][p]) for d, p in enumerate(pos)
+        )
+
+    def global_extent(self, pos) -> list:
+        return [
+            slice(int(self.starts[d][p]), int(self.stops[d][p])) for d, p in enumerate(pos)
+        ]
+
+    def extent(self, pos) -> list:
+        """
+        The extent to apply to the fragment at ``pos``, which is always the whole fragment.
+        """
+        return [
+            slice(None) if len(self.starts[d]) != 1 else slice(0, int(self.stops[d][0]))
+            for d in range(len(pos))
+        ]
+
+    def location(self, pos):
+        return self.locations[self.location_index[pos]]
+
+    def address(self, pos):
+        return self.addresses[self.address_index[pos]]
+
+    def format(self, pos):
+        return self.formats[self.format_index[pos]]
+
+    def fill_value(self, pos):
+        return self.fill_values[pos].item()
+
+    def substitute(self, base: str, substitution: str):
+        """
+        Apply a string substitution to every fragment location, which only requires
+        a change to each of the unique locations.
+        """
+        if self.locations is None:
+            return
+
+        def replace(loc):
+            if isinstance(loc, str):
+                return loc.replace(base, substitution)
+            return tuple(l.replace(base, substitution) for l in loc)
+
+        self.locations = [replace(loc) for loc in self.locations]
+
+class FragmentExtentMap(Mapping):
+    """
+    Read-only mapping from each fragment position to a per-dimension list, created on
+    demand from the integer fragment offsets. Used for the ``global_extents``, ``extents``
+    and ``shapes`` returned by ``get_fragment_extents``, so no per-fragment objects are
+    created until a fragment is looked up.
+    """
+
+    def __init__(self, fragment_space, element):
+        """
+        :param fragment_space:  (tuple) The number of fragments along each dimension.
+
+        :param element:         (callable) Gives the entry for one dimension, from the 
+                                dimension and the fragment index along that dimension.
+        """
+        self.fragment_space = tuple(fragment_space)
+        self._element = element
+
+    def __getitem__(self, pos):
+        if len(pos) != len(self.fragment_space):
+            raise KeyError(pos)
+        for p, n in zip(pos, self.fragment_space):
+            if not 0 <= p < n:
+                raise KeyError(pos)
+        return [self._element(dim, p) for dim, p in enumerate(pos)]
+
+    def __iter__(self):
+        return product(*(range(n) for n in self.fragment_space))
+
+    def __len__(self):
+        return int(np.prod(self.fragment_space, dtype=np.int64))
+
 def get_fragment_extents(fragment_size_per_dim, array_shape):
     """
     Return descriptors for every fragment. Copied from cf-python version 3.14.0 onwards.
+    The cumulative fragment offsets are computed once per dimension, and the descriptors
+    for each fragment are only created when that fragment is looked up.
 
     :param fragment_size_per_dim:       (list) The set of fragment sizes per dimension. first dimension has length 
                                         equal to the number of array dimensions, second dimension is a list of the
@@ -47,70 +347,27 @@ def get_fragment_extents(fragment_size_per_dim, array_shape):
 
     """
 
-    ndim = len(fragment_size_per_dim)
+    starts, stops  = get_fragment_bounds(fragment_size_per_dim)
+    fragment_space = tuple(len(s) for s in starts)
 
-    initial = [0 for i in range(ndim)]
-    final   = [len(i) for i in fragment_size_per_dim]
+    fragmented = [n != 1 for n in fragment_space]
 
-    fragmented_dims = [i for i in range(len(fragment_size_per_dim)) if len(fragment_size_per_dim[i]) != 1]
+    def global_extent(dim, i):
+        return slice(int(starts[dim][i]), int(stops[dim][i]))
 
-    dim_shapes  = []
-    dim_indices = []
-    f_locations = []
-    for dim, fs in enumerate(fragment_size_per_dim):
+    def extent(dim, i):
+        if fragmented[dim]:
+            return slice(None)
+        # No fragmentation along this dimension
+        return global_extent(dim, i)
 
-        # (num_fragments) for each dimension
-        dim_shapes.append(fs)
+    def shape(dim, i):
+        if fragmented[dim]:
+            return int(stops[dim][i] - starts[dim][i])
+        return array_shape[dim]
 
-        fsa = tuple(accumulate((0,) + tuple(fs)))
-
-        if dim in fragmented_dims:
-            # Same as s_locations
-            f_locations.append(tuple(range(len(fs))))
-        else:
-            # No fragmentation along this dimension
-            # (0, 0, 0, 0 ...) in each non-fragmented dimension.
-            f_locations.append((0,) * len(fs))
+    global_extents = FragmentExtentMap(fragment_space, global_extent)
+    extents        = FragmentExtentMap(fragment_space, extent)
+    shapes         = FragmentExtentMap(fragment_space, shape)
 
-        # List of slices a to a+1 for every item in the new fs.
-        dim_indices.append([slice(i, j) for i, j in zip(fsa[:-1], fsa[1:])])
-
-    # Transform f_locations to get a dict of positions with a slice and shape for each.
-    positions = [
-        coord for coord in product(
-            *[range(r[0], r[1]) for r in zip(initial, final)]
-        )
-    ]
-
-    f_indices = []
-    for dim, u in enumerate(dim_indices):
-        if dim in fragmented_dims:
-            f_indices.append( (slice(None),) * len(u))
-        else:
-            f_indices.append( u )
-
-    f_shapes = [
-        dim_shape if dim in fragmented_dims else (size,) * len(dim_shape)
-        for dim, (dim_shape, size) in enumerate(zip(dim_shapes, array_shape))
-    ]
-
-    global_extents = {}
-    extents = {}
-    shapes = {}
-
-    for frag_pos in positions:
-        extents[frag_pos] = []
-        global_extents[frag_pos] = []
-        shapes[frag_pos] = []
-        for a, i in enumerate(frag_pos):
-            extents[frag_pos].append(
-                f_indices[a][i]
-            )
-            global_extents[frag_pos].append(
-                dim_indices[a][i]
-            )
-            shapes[frag_pos].append(
-                f_shapes[a][i]
-            )
-            
     return global_extents, extents, shapes
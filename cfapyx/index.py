@@ -0,0 +1,91 @@
+__author__    = "Daniel Westwood"
+__contact__   = "daniel.westwood@stfc.ac.uk"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from cfapyx.utils import logstream
+
+logger = logging.getLogger(__name__)
+
+logger.addHandler(logstream)
+logger.propagate = False
+
+class FragmentIntervalIndex:
+    """
+    Per-dimension index from coordinate values to the fragments of an aggregated
+    array. Each fragment covers the interval of coordinate values between its first
+    and last index along a dimension, so a label selection is resolved to a range of
+    array indices and then to the minimal range of fragments by bisection.
+    """
+
+    description = 'Interval index from coordinate values to fragments'
+
+    def __init__(self, coords: dict, bounds: dict):
+        """
+        :param coords:      (dict) The (decoded) coordinate values along each indexed
+                            dimension, as a ``pandas.Index`` or array of monotonic values.
+
+        :param bounds:      (dict) The boundaries of the fragments along each indexed
+                            dimension in ``array space``, as an integer array of length
+                            ``n_fragments + 1``.
+        """
+        self.coords = {dim: pd.Index(values) for dim, values in coords.items()}
+        self.bounds = {dim: np.asarray(b, dtype=np.int64) for dim, b in bounds.items()}
+
+        for dim, index in self.coords.items():
+            if len(index) != self.bounds[dim][-1]:
+                raise ValueError(
+                    f'Coordinate "{dim}" has {len(index)} values but the fragments '
+                    f'cover {self.bounds[dim][-1]} indices.'
+                )
+
+    def __contains__(self, dim):
+        return dim in self.coords
+
+    def intervals(self, dim: str) -> tuple:
+        """
+        The first and last coordinate value of each fragment along ``dim``.
+        """
+        values = self.coords[dim]
+        bounds = self.bounds[dim]
+        return values[bounds[:-1]], values[bounds[1:] - 1]
+
+    def index_slice(self, dim: str, label) -> slice:
+        """
+        Resolve the label ``slice`` (or single label) along ``dim`` to a slice of array
+        indices, with the same semantics as ``DataArray.sel``, including partial
+        datetime strings such as ``'2001'``.
+        """
+        index = self.coords[dim]
+        if isinstance(label, slice):
+            if label.step is not None:
+                raise ValueError('Label slices with a step are not supported.')
+            indexer = index.slice_indexer(label.start, label.stop)
+        else:
+            indexer = index.get_loc(label)
+
+        if isinstance(indexer, (int, np.integer)):
+            indexer = slice(int(indexer), int(indexer) + 1)
+        if not isinstance(indexer, slice):
+            raise KeyError(f'Label {label} does not select a contiguous range of "{dim}".')
+
+        start, stop, step = indexer.indices(len(index))
+        return slice(start, max(start, stop), step)
+
+    def fragments(self, dim: str, label) -> tuple:
+        """
+        The ``(start, stop)`` range of fragments along ``dim`` which cover the values
+        selected by ``label``.
+        """
+        indices = self.index_slice(dim, label)
+        bounds  = self.bounds[dim]
+        if indices.start >= indices.stop:
+            return (0, 0)
+
+        first = int(np.searchsorted(bounds, indices.start, side='right') - 1)
+        last  = int(np.searchsorted(bounds, indices.stop - 1, side='right') - 1)
+        return (first, last + 1)
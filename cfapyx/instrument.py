@@ -0,0 +1,157 @@
+__author__    = "Daniel Westwood"
+__contact__   = "daniel.westwood@stfc.ac.uk"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from cfapyx.utils import logstream
+
+logger = logging.getLogger(__name__)
+
+logger.addHandler(logstream)
+logger.propagate = False
+
+# Stages of the read path that are timed, see ``ReadRecorder``.
+STAGES = ('open', 'read', 'units', 'graph')
+
+COLUMNS = ('stage', 'location', 'address', 'position', 'seconds', 'nbytes')
+
+class ReadRecorder:
+    """
+    Record of the time spent in each stage of reading an aggregated array:
+
+     - ``open``: Opening a fragment file, when not already held by the handle pool.
+     - ``read``: Reading the data for one partition, including any open and unit
+       conversion, with the number of bytes read.
+     - ``units``: Converting the data of one partition to the aggregated units.
+     - ``graph``: Building the dask graph for an aggregated array, where the address
+       is the name of the dask array.
+
+    Each record identifies the fragment location, address and position in ``fragment
+    space``, so slow storage tiers or hot fragments can be found from the ``table``.
+    """
+
+    description = 'Timings of fragment opens, reads and graph builds'
+
+    def __init__(self):
+        self._records = []
+        self._lock    = threading.Lock()
+
+    def __len__(self):
+        return len(self._records)
+
+    def add(self, record: dict):
+        """
+        Add a single ``record`` with the fields given in ``COLUMNS``.
+        """
+        with self._lock:
+            self._records.append(record)
+
+    def records(self) -> list:
+        """
+        A copy of every record, as a list of dicts.
+        """
+        with self._lock:
+            return list(self._records)
+
+    def table(self) -> pd.DataFrame:
+        """
+        Every record as a ``pandas.DataFrame``, one row per timed event.
+        """
+        return pd.DataFrame(self.records(), columns=list(COLUMNS))
+
+    def summary(self, by: str = 'location') -> pd.DataFrame:
+        """
+        Totals of the records for each stage, grouped by ``by`` (e.g. ``location`` or
+        ``position``), ordered by the total time taken.
+        """
+        summary = self.table().groupby([by, 'stage'], dropna=False).agg(
+            count=('seconds', 'size'),
+            seconds=('seconds', 'sum'),
+            max_seconds=('seconds', 'max'),
+            nbytes=('nbytes', 'sum'),
+        )
+        return summary.sort_values('seconds', ascending=False)
+
+    def reset(self):
+        """
+        Remove all records.
+        """
+        with self._lock:
+            self._records = []
+
+_recorder  = ReadRecorder()
+_active    = []
+_active_lock = threading.Lock()
+
+def get_read_recorder() -> ReadRecorder:
+    """
+    Return the process-wide recorder, which receives the timings of every variable
+    opened with the ``instrument`` option.
+    """
+    return _recorder
+
+def is_recording(instrument: bool = False) -> bool:
+    """
+    Determine if an event should be timed, either because ``instrument`` is set for
+    the source variable or an ``instrument`` context is active.
+    """
+    return bool(instrument or _active)
+
+@contextmanager
+def instrument():
+    """
+    Record the timings of every read within the context, for all variables. Yields
+    a new ``ReadRecorder`` holding only the events within this context.
+
+    ::
+
+        with cfapyx.instrument() as recorder:
+            ds['p'].isel(time=slice(0, 10)).values
+
+        recorder.summary()
+    """
+    recorder = ReadRecorder()
+    with _active_lock:
+        _active.append(recorder)
+    try:
+        yield recorder
+    finally:
+        with _active_lock:
+            _active.remove(recorder)
+
+@contextmanager
+def timed(stage: str, instrument: bool = False, location=None, address=None, position=None):
+    """
+    Time the events within the context as ``stage``, if recording. Yields the record,
+    which may be updated with the ``nbytes`` read, and is given to the process-wide
+    recorder if ``instrument`` is set as well as to every active ``instrument`` context.
+    """
+    recorders = list(_active)
+    if instrument:
+        recorders.append(_recorder)
+
+    record = {
+        'stage': stage,
+        'location': location,
+        'address': address,
+        'position': position,
+        'seconds': None,
+        'nbytes': 0,
+    }
+    if not recorders:
+        yield record
+        return
+
+    t0 = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - t0
+        for recorder in recorders:
+            recorder.add(dict(record))
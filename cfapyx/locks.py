@@ -0,0 +1,172 @@
+__author__    = "Daniel Westwood"
+__contact__   = "daniel.westwood@stfc.ac.uk"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+
+import ctypes
+import ctypes.util
+import functools
+import glob
+import logging
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+
+from dask.utils import SerializableLock
+from xarray.backends.locks import NETCDFC_LOCK
+
+from cfapyx.utils import logstream
+
+logger = logging.getLogger(__name__)
+
+logger.addHandler(logstream)
+logger.propagate = False
+
+# Fragment formats read through the netCDF-C and HDF5 libraries.
+GLOBAL_LOCK_FORMATS = ('nc', 'nc4', 'netcdf', 'hdf5')
+
+def _find_hdf5() -> str:
+    """
+    The path of the HDF5 library loaded by netCDF4, preferring the copy bundled with
+    the netCDF4 wheel over any system library.
+    """
+    import netCDF4
+
+    package = os.path.dirname(netCDF4.__file__)
+    for libs in ('../netcdf4.libs', '../netCDF4.libs', '.dylibs'):
+        found = sorted(glob.glob(os.path.join(package, libs, 'libhdf5[-.]*')))
+        if found:
+            return found[0]
+    return ctypes.util.find_library('hdf5')
+
+@functools.lru_cache(maxsize=None)
+def library_threadsafe() -> bool:
+    """
+    Determine if the HDF5 library used by netCDF4 was built thread-safe, in which case
+    HDF5 serialises its own calls and netCDF fragments may be read without the global
+    lock. False if the library cannot be found or inspected.
+    """
+    try:
+        library = ctypes.CDLL(_find_hdf5())
+        threadsafe = ctypes.c_bool(False)
+        if library.H5is_library_threadsafe(ctypes.byref(threadsafe)) < 0:
+            return False
+    except (OSError, AttributeError, TypeError) as err:
+        logger.debug(f'Unable to determine HDF5 thread-safety: {err}')
+        return False
+
+    logger.debug(f'HDF5 library is thread-safe: {threadsafe.value}')
+    return bool(threadsafe.value)
+
+class FragmentLockManager:
+    """
+    Process-wide manager of the locks held while reading fragment files. Each fragment
+    file has its own lock, so reads of the same file are serialised. Reads of netCDF
+    fragments additionally take a single global lock shared with Xarray's own netCDF
+    calls, unless the HDF5 library was built thread-safe (see ``library_threadsafe``).
+    Threads reading different files then only proceed concurrently with a thread-safe
+    library build.
+    """
+
+    description = 'Per-file locks for fragment reads'
+
+    def __init__(self, global_lock: bool = None):
+        """
+        :param global_lock:     (bool) Take the global library lock for every fragment
+            read (True), never (False), or only for formats whose library build requires
+            it (None, default). False is unsafe for netCDF fragments unless the library
+            is thread-safe.
+        """
+
+        self.global_lock = global_lock
+
+        self._locks = weakref.WeakValueDictionary()
+        self._lock  = threading.Lock()
+
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self._locks)
+
+    def get_lock(self, location) -> SerializableLock:
+        """
+        Return the lock for the fragment file at ``location``. The lock is identified by
+        its location, so copies sent to other workers in the same process share it.
+        """
+        if not isinstance(location, str):
+            location = tuple(location)
+
+        with self._lock:
+            lock = self._locks.get(location)
+            if lock is None:
+                lock = SerializableLock(token=f'cfapyx-fragment-{location}')
+                self._locks[location] = lock
+        return lock
+
+    def needs_global_lock(self, format: str = 'nc', global_lock: bool = None) -> bool:
+        """
+        Determine if reads of fragments in ``format`` must also hold the global lock.
+
+        :param format:          (str) The format of the fragment file.
+
+        :param global_lock:     (bool) Per-read override of the manager setting, with
+            None deferring to the manager.
+        """
+        if global_lock is None:
+            global_lock = self.global_lock
+        if global_lock is None:
+            return (format or 'nc') in GLOBAL_LOCK_FORMATS and not library_threadsafe()
+        return bool(global_lock)
+
+    @contextmanager
+    def lock(self, location, format: str = 'nc', global_lock: bool = None):
+        """
+        Hold the lock for the fragment file at ``location``, and the global lock if
+        required for ``format``, for the duration of the context. The file lock is
+        always taken first so locks are acquired in a consistent order.
+        """
+        file_lock = self.get_lock(location)
+
+        contended = not file_lock.acquire(blocking=False)
+        if contended:
+            file_lock.acquire()
+
+        try:
+            with self._lock:
+                self._acquisitions += 1
+                self._contended    += contended
+
+            if self.needs_global_lock(format, global_lock):
+                with NETCDFC_LOCK:
+                    yield
+            else:
+                yield
+        finally:
+            file_lock.release()
+
+    def reset_stats(self):
+        """
+        Reset the counters reported by ``stats``.
+        """
+        self._acquisitions = 0
+        self._contended    = 0
+
+    def stats(self) -> dict:
+        """
+        Report the usage of the file locks. ``contended`` counts the reads which had to
+        wait for another reader of the same file.
+        """
+        return {
+            'files': len(self._locks),
+            'global_lock': self.global_lock,
+            'acquisitions': self._acquisitions,
+            'contended': self._contended,
+        }
+
+_manager = FragmentLockManager()
+
+def get_lock_manager() -> FragmentLockManager:
+    """
+    Return the process-wide lock manager used by ``CFAPartition`` reads.
+    """
+    return _manager
@@ -0,0 +1,259 @@
+__author__    = "Daniel Westwood"
+__contact__   = "daniel.westwood@stfc.ac.uk"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from cfapyx.decoder import FragmentTable
+from cfapyx.statistics import STATISTICS, FragmentStatistics
+from cfapyx.utils import logstream
+
+logger = logging.getLogger(__name__)
+
+logger.addHandler(logstream)
+logger.propagate = False
+
+# Version of the stored layout, entries from other versions are never read.
+METADATA_VERSION = 2
+
+# Integer arrays of a FragmentTable with shape ``fragment_space``.
+_INDEX_ARRAYS = ('location_index', 'address_index', 'format_index', 'fill_values')
+
+# String tables of a FragmentTable, indexed by the arrays above.
+_STRING_TABLES = ('locations', 'addresses', 'formats')
+
+def default_metadata_dir() -> str:
+    """
+    The user cache directory for decoded aggregation metadata.
+    """
+    base = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'cfapyx', 'metadata')
+
+class MetadataCache:
+    """
+    Persistent on-disk cache of the decoded fragments of each aggregated variable in a
+    CFA-netCDF file. Each file has one entry directory, named by a hash of the path of
+    the file and a hash of its modification time and size, so any change to the file
+    invalidates the entry. No ``cfa_options`` change the decoded fragments, as
+    substitutions are applied afterwards. Within an entry each variable is stored as
+    ``.npy`` arrays, opened memory-mapped, with its string tables in JSON. A warm open
+    then never reads the fragment array variables from the CFA file. Dimensions and
+    attributes are not cached, and are still read from the file header.
+    """
+
+    description = 'On-disk cache of decoded aggregation metadata'
+
+    def __init__(self, directory: str):
+        """
+        :param directory:   (str) The local directory in which decoded metadata is
+            stored. Created if not already present.
+        """
+
+        self.directory = directory
+        self._lock     = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.reset_stats()
+
+    def __len__(self):
+        return len([d for d in os.listdir(self.directory) if not d.endswith('.tmp')])
+
+    def key(self, filename: str, group: str = None):
+        """
+        The key of the entry for the file at ``filename``, or None if the file cannot
+        be cached (e.g. a remote file).
+
+        :param filename:    (str) The path to the CFA-netCDF file.
+
+        :param group:       (str) The group opened within the file, if any.
+        """
+        if not isinstance(filename, str) or '://' in filename:
+            return None
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+
+        path  = os.path.abspath(filename)
+        ident = (path, group)
+        state = (METADATA_VERSION, stat.st_mtime_ns, stat.st_size)
+        return f'{_hash(ident)}-{_hash(state)}'
+
+    def get(self, key: str, name: str):
+        """
+        Return the ``(fragment_info, fragment_space)`` stored for variable ``name`` in
+        the entry ``key``, or None if not in the cache.
+        """
+        path = self._path(key, name)
+        try:
+            with open(os.path.join(path, 'table.json')) as f:
+                meta = json.load(f)
+
+            def load(array):
+                return np.load(os.path.join(path, f'{array}.npy'), mmap_mode='r')
+
+            ndim   = len(meta['fragment_space'])
+            starts = [load(f'starts_{d}') for d in range(ndim)]
+            stops  = [load(f'stops_{d}') for d in range(ndim)]
+
+            kwargs = {a: load(a) for a in _INDEX_ARRAYS if a in meta['arrays']}
+            for table in _STRING_TABLES:
+                if meta.get(table) is not None:
+                    kwargs[table] = [_from_json(v) for v in meta[table]]
+
+            if meta['statistics']:
+                kwargs['statistics'] = FragmentStatistics(
+                    **{s: load(f'statistics_{s}') for s in STATISTICS},
+                    units=meta.get('statistics_units'),
+                )
+        except (OSError, ValueError, KeyError) as err:
+            if not isinstance(err, FileNotFoundError):
+                logger.debug(f'Unable to load cached metadata {path}: {err}')
+            with self._lock:
+                self._misses += 1
+            return None
+
+        with self._lock:
+            self._hits += 1
+        return FragmentTable(starts, stops, **kwargs), tuple(meta['fragment_space'])
+
+    def put(self, key: str, name: str, fragment_info: FragmentTable, fragment_space: tuple):
+        """
+        Store the decoded ``fragment_info`` for variable ``name`` in the entry ``key``,
+        removing any older entries for the same file. Tables with values that cannot
+        be stored without pickling are not stored.
+        """
+        arrays = {}
+        for d, (start, stop) in enumerate(zip(fragment_info.starts, fragment_info.stops)):
+            arrays[f'starts_{d}'] = start
+            arrays[f'stops_{d}']  = stop
+        for array in _INDEX_ARRAYS:
+            if getattr(fragment_info, array) is not None:
+                arrays[array] = getattr(fragment_info, array)
+
+        statistics = fragment_info.statistics
+        if statistics is not None:
+            for s, values in zip(STATISTICS, (
+                    statistics.min_values, statistics.max_values, statistics.sum_values,
+                    statistics.counts, statistics.nan_counts)):
+                arrays[f'statistics_{s}'] = values
+
+        arrays = {k: np.asarray(v) for k, v in arrays.items()}
+        if any(isinstance(v, np.ma.MaskedArray) or v.dtype.hasobject for v in arrays.values()):
+            return
+
+        meta = {
+            'variable': name,
+            'fragment_space': [int(n) for n in fragment_space],
+            'arrays': list(arrays.keys()),
+            'statistics': statistics is not None,
+            'statistics_units': None if statistics is None else statistics.units,
+        }
+        for table in _STRING_TABLES:
+            values = getattr(fragment_info, table)
+            meta[table] = None if values is None else [_to_json(v) for v in values]
+
+        path = self._path(key, name)
+        temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+        # Write to a temporary directory first so readers never see a partial entry.
+        try:
+            os.makedirs(temp)
+            for array, values in arrays.items():
+                np.save(os.path.join(temp, f'{array}.npy'), values, allow_pickle=False)
+            with open(os.path.join(temp, 'table.json'), 'w') as f:
+                json.dump(meta, f)
+
+            self._remove_stale(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.replace(temp, path)
+            except OSError:
+                # Already stored by another process.
+                shutil.rmtree(temp, ignore_errors=True)
+                return
+        except (OSError, TypeError, ValueError) as err:
+            logger.debug(f'Unable to cache metadata {path}: {err}')
+            shutil.rmtree(temp, ignore_errors=True)
+            return
+
+        with self._lock:
+            self._stores += 1
+
+    def clear(self):
+        """
+        Remove every entry from the cache directory.
+        """
+        with self._lock:
+            for entry in os.listdir(self.directory):
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+    def reset_stats(self):
+        """
+        Reset the counters reported by ``stats``.
+        """
+        self._hits   = 0
+        self._misses = 0
+        self._stores = 0
+
+    def stats(self) -> dict:
+        """
+        Report the usage of the cache. The ``hit_rate`` is the fraction of aggregated
+        variables opened from the cache directory.
+        """
+        requests = self._hits + self._misses
+        return {
+            'entries': len(self),
+            'stores': self._stores,
+            'hits': self._hits,
+            'misses': self._misses,
+            'hit_rate': self._hits/requests if requests else 0.0,
+        }
+
+    def _remove_stale(self, key):
+        """
+        Remove the entries for previous versions of the file identified by ``key``.
+        """
+        ident, _ = key.split('-')
+        for entry in os.listdir(self.directory):
+            if entry.startswith(f'{ident}-') and entry != key and not entry.endswith('.tmp'):
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+    def _path(self, key, name):
+        return os.path.join(self.directory, key, name)
+
+def _hash(value) -> str:
+    return hashlib.sha256(repr(value).encode()).hexdigest()[:32]
+
+def _to_json(value):
+    # Fragments with several locations are described by a tuple.
+    if isinstance(value, tuple):
+        return list(value)
+    return value
+
+def _from_json(value):
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_metadata_cache(directory: str = None) -> MetadataCache:
+    """
+    Return the process-wide metadata cache for ``directory``, by default in the user
+    cache directory, creating it if needed.
+    """
+    directory = os.path.abspath(directory or default_metadata_dir())
+    with _caches_lock:
+        if directory not in _caches:
+            _caches[directory] = MetadataCache(directory)
+        return _caches[directory]
@@ -0,0 +1,191 @@
+__author__    = "Daniel Westwood"
+__contact__   = "daniel.westwood@stfc.ac.uk"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from cfapyx.utils import logstream
+
+logger = logging.getLogger(__name__)
+
+logger.addHandler(logstream)
+logger.propagate = False
+
+DEFAULT_MAX_OPEN_FILES = 64
+
+class _PoolEntry:
+    """
+    Single open fragment handle held by the pool, with a count of the readers
+    currently using it. Entries in use are never closed by eviction.
+    """
+
+    def __init__(self, handle):
+        self.handle  = handle
+        self.users   = 0
+        self.lock    = threading.RLock()
+
+class FragmentHandlePool:
+    """
+    Process-wide pool of open fragment file handles, keyed by ``(location, address)``.
+    The number of open handles is bounded by ``max_open_files``, with the least
+    recently used handles closed first when the budget is exceeded.
+    """
+
+    description = 'Pool of open fragment file handles with LRU eviction'
+
+    def __init__(self, max_open_files: int = DEFAULT_MAX_OPEN_FILES):
+        """
+        :param max_open_files:  (int) The maximum number of fragment files that may
+            be held open at once. Handles currently in use by a reader are not counted
+            against this limit until they are released.
+        """
+
+        self._entries = OrderedDict()
+        self._lock    = threading.Lock()
+
+        self.max_open_files = max_open_files
+
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @contextmanager
+    def checkout(self, key: tuple, opener):
+        """
+        Yield an open handle for the fragment identified by ``key``, opening it with
+        ``opener`` if not already held by the pool. Concurrent readers of the same
+        handle are serialised, as netCDF4/HDF5 handles are not safe to share across
+        threads.
+
+        :param key:     (tuple) The ``(location, address)`` pair for this fragment.
+
+        :param opener:  (callable) Function with no arguments that opens the fragment
+            file and returns the handle.
+        """
+
+        entry = self._acquire(key, opener)
+        try:
+            with entry.lock:
+                yield entry.handle
+        finally:
+            self._release(entry)
+
+    def resize(self, max_open_files: int):
+        """
+        Change the open-file budget for the pool, closing unused handles if the
+        pool is now over budget.
+        """
+        with self._lock:
+            self.max_open_files = max_open_files
+            self._evict()
+
+    def close_all(self):
+        """
+        Close every handle in the pool that is not currently in use.
+        """
+        with self._lock:
+            for key in list(self._entries.keys()):
+                if self._entries[key].users == 0:
+                    self._close(key)
+
+    def reset_stats(self):
+        """
+        Reset the counters reported by ``stats``.
+        """
+        self._opens     = 0
+        self._hits      = 0
+        self._misses    = 0
+        self._evictions = 0
+
+    def stats(self) -> dict:
+        """
+        Report the usage of the pool so far. The ``hit_rate`` is the fraction of
+        requests served by an already-open handle.
+        """
+        requests = self._hits + self._misses
+        return {
+            'open_files': len(self._entries),
+            'max_open_files': self.max_open_files,
+            'opens': self._opens,
+            'hits': self._hits,
+            'misses': self._misses,
+            'evictions': self._evictions,
+            'hit_rate': self._hits/requests if requests else 0.0,
+        }
+
+    def _acquire(self, key, opener):
+        """
+        Fetch the entry for ``key`` or open a new one, and mark it as in use.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._hits += 1
+                self._entries.move_to_end(key)
+                entry = self._entries[key]
+                entry.users += 1
+                return entry
+            self._misses += 1
+
+        # Open outside the pool lock so slow filesystems do not block other readers.
+        handle = opener()
+
+        with self._lock:
+            self._opens += 1
+            if key in self._entries:
+                # Another reader opened the same fragment in the meantime.
+                try:
+                    handle.close()
+                except Exception:
+                    pass
+                entry = self._entries[key]
+                self._entries.move_to_end(key)
+            else:
+                entry = _PoolEntry(handle)
+                self._entries[key] = entry
+            entry.users += 1
+            self._evict()
+        return entry
+
+    def _release(self, entry):
+        with self._lock:
+            entry.users -= 1
+            self._evict()
+
+    def _evict(self):
+        """
+        Close least recently used handles until the pool is within budget. Must be
+        called with the pool lock held.
+        """
+        if self.max_open_files is None:
+            return
+
+        excess = len(self._entries) - self.max_open_files
+        if excess <= 0:
+            return
+
+        for key in list(self._entries.keys()):
+            if excess <= 0:
+                break
+            if self._entries[key].users == 0:
+                self._close(key)
+                self._evictions += 1
+                excess -= 1
+
+    def _close(self, key):
+        entry = self._entries.pop(key)
+        try:
+            entry.handle.close()
+        except Exception as err:
+            logger.debug(f'Unable to close fragment handle {key}: {err}')
+
+_handle_pool = FragmentHandlePool()
+
+def get_handle_pool() -> FragmentHandlePool:
+    """
+    Return the process-wide fragment handle pool used by ``CFAPartition`` reads.
+    """
+    return _handle_pool
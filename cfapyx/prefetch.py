@@ -0,0 +1,202 @@
+__author__    = "Daniel Westwood"
+__contact__   = "daniel.westwood@stfc.ac.uk"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from cfapyx.utils import logstream
+
+logger = logging.getLogger(__name__)
+
+logger.addHandler(logstream)
+logger.propagate = False
+
+DEFAULT_PREFETCH_WORKERS = 4
+
+class FragmentPrefetcher:
+    """
+    Process-wide read-ahead buffer for sequential fragment access. While one partition
+    is read, the following fragments along the leading aggregated dimension are read
+    by a background thread pool into a bounded buffer, keyed by ``(location, address)``.
+    A later read is served from the buffer if the buffered region covers its extent.
+    """
+
+    description = 'Read-ahead buffer for fragment data'
+
+    def __init__(
+            self,
+            max_workers: int = DEFAULT_PREFETCH_WORKERS,
+            buffer_size: int = 2 * DEFAULT_PREFETCH_WORKERS
+        ):
+        """
+        :param max_workers:     (int) The number of background threads reading fragments.
+
+        :param buffer_size:     (int) The maximum number of prefetched fragment regions held
+            in the buffer. The oldest regions are discarded first.
+        """
+
+        self.max_workers = max_workers
+        self.buffer_size = buffer_size
+
+        self._executor = None
+        self._buffer   = OrderedDict()
+        self._lock     = threading.Lock()
+
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def fetch(self, partition):
+        """
+        Return the data for ``partition``, from the buffer if it has been prefetched,
+        otherwise by reading it directly. The partitions listed in ``partition.prefetch``
+        are queued for reading in the background.
+        """
+
+        for neighbour in partition.prefetch or []:
+            self.submit(neighbour)
+
+        data = self._from_buffer(partition)
+        if data is not None:
+            return data
+
+        return partition._read()
+
+    def submit(self, partition):
+        """
+        Queue ``partition`` to be read in the background, unless the buffer already
+        holds or is reading this region.
+        """
+        key    = partition._pool_key()
+        extent = _extent_tuple(partition.get_extent())
+
+        with self._lock:
+            if key in self._buffer and self._buffer[key][0] == extent:
+                self._buffer.move_to_end(key)
+                return
+
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='cfapyx-prefetch'
+                )
+
+            # Partitions take the locks for their fragment file when read.
+            future = self._executor.submit(partition._read)
+            self._buffer[key] = (extent, future)
+            self._prefetched += 1
+
+            while len(self._buffer) > self.buffer_size:
+                _, (_, old) = self._buffer.popitem(last=False)
+                if old.cancel() or not old.done():
+                    self._discarded += 1
+
+    def resize(self, max_workers: int = None, buffer_size: int = None):
+        """
+        Change the number of background readers or the buffer size. A change to the
+        number of workers takes effect for the next set of reads.
+        """
+        with self._lock:
+            if max_workers and max_workers != self.max_workers:
+                self.max_workers = max_workers
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                    self._executor = None
+            if buffer_size:
+                self.buffer_size = buffer_size
+
+    def clear(self):
+        """
+        Discard all buffered fragment regions.
+        """
+        with self._lock:
+            for extent, future in self._buffer.values():
+                future.cancel()
+            self._buffer.clear()
+
+    def reset_stats(self):
+        """
+        Reset the counters reported by ``stats``.
+        """
+        self._hits       = 0
+        self._misses     = 0
+        self._prefetched = 0
+        self._discarded  = 0
+
+    def stats(self) -> dict:
+        """
+        Report the usage of the prefetch buffer. The ``hit_rate`` is the fraction of
+        reads served from prefetched data.
+        """
+        requests = self._hits + self._misses
+        return {
+            'buffered': len(self._buffer),
+            'buffer_size': self.buffer_size,
+            'prefetched': self._prefetched,
+            'discarded': self._discarded,
+            'hits': self._hits,
+            'misses': self._misses,
+            'hit_rate': self._hits/requests if requests else 0.0,
+        }
+
+    def _from_buffer(self, partition):
+        """
+        Find buffered data covering the extent of ``partition`` and return the matching
+        region, or None if there is no suitable buffered region.
+        """
+        key    = partition._pool_key()
+        extent = _extent_tuple(partition.get_extent())
+
+        with self._lock:
+            entry = self._buffer.get(key)
+
+        if entry is not None:
+            buffered_extent, future = entry
+            selection = _relative_selection(buffered_extent, extent)
+            if selection is not None:
+                try:
+                    data = future.result()
+                except Exception as err:
+                    logger.debug(f'Prefetch of {key} failed: {err}')
+                    data = None
+
+                if data is not None and data.ndim == len(selection):
+                    with self._lock:
+                        self._hits += 1
+                    return data[selection]
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+def _extent_tuple(extent):
+    return tuple((e.start, e.stop, e.step) for e in extent)
+
+def _relative_selection(outer, inner):
+    """
+    Express the ``inner`` extent relative to the ``outer`` extent, or return None if
+    the ``outer`` extent does not contain it.
+    """
+    if len(outer) != len(inner):
+        return None
+
+    selection = []
+    for (ostart, ostop, ostep), (istart, istop, istep) in zip(outer, inner):
+        if (ostep or 1) != 1:
+            return None
+        if istart < ostart or istop > ostop:
+            return None
+        selection.append(slice(istart - ostart, istop - ostart, istep))
+    return tuple(selection)
+
+_prefetcher = FragmentPrefetcher()
+
+def get_prefetcher() -> FragmentPrefetcher:
+    """
+    Return the process-wide fragment prefetcher used by ``CFAPartition`` reads.
+    """
+    return _prefetcher
@@ -0,0 +1,169 @@
+__author__    = "Daniel Westwood"
+__contact__   = "daniel.westwood@stfc.ac.uk"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from cfapyx.utils import logstream
+
+logger = logging.getLogger(__name__)
+
+logger.addHandler(logstream)
+logger.propagate = False
+
+DEFAULT_READER_PROCESSES = 4
+
+class FragmentProcessReader:
+    """
+    Persistent pool of worker processes for reading fragment data. The netCDF-C and
+    HDF5 libraries serialise reads within one process, so reads dispatched to separate
+    processes can use multiple cores from a threaded dask compute. Each worker keeps its
+    own handle pool, and returns the data through a shared memory block rather than
+    pickling the array back to the calling process.
+    """
+
+    description = 'Process pool for fragment reads'
+
+    def __init__(self, max_workers: int = DEFAULT_READER_PROCESSES):
+        """
+        :param max_workers:     (int) The number of worker processes reading fragments.
+        """
+
+        self.max_workers = max_workers
+
+        self._executor = None
+        self._lock     = threading.Lock()
+
+        self.reset_stats()
+
+    def read(self, partition):
+        """
+        Read the data for ``partition`` in a worker process, returning a numpy array.
+        The data is copied out of the shared memory block so the block can be unlinked
+        at once, rather than held for the lifetime of the returned array. This costs one
+        memory copy of the data, in place of pickling it between processes.
+        """
+
+        # The worker reads the fragment itself, rather than dispatching it again.
+        partition = partition.copy()
+        partition.processes = None
+        partition.prefetch  = None
+
+        name, shape, dtype = self._get_executor().submit(_read_shared, partition).result()
+
+        if name is None:
+            # Arrays of objects cannot be placed in shared memory and are returned directly.
+            data = shape
+        else:
+            # The block is owned by this process from here, which unlinks it.
+            shm = SharedMemory(name=name)
+            try:
+                data = np.array(np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+            finally:
+                shm.close()
+                shm.unlink()
+
+        with self._lock:
+            self._reads  += 1
+            self._nbytes += data.nbytes
+        return data
+
+    def resize(self, max_workers: int):
+        """
+        Change the number of worker processes, which takes effect for the next read.
+        """
+        with self._lock:
+            if max_workers == self.max_workers:
+                return
+            self.max_workers = max_workers
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def shutdown(self):
+        """
+        Stop the worker processes. They are started again by the next read.
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def reset_stats(self):
+        """
+        Reset the counters reported by ``stats``.
+        """
+        self._reads  = 0
+        self._nbytes = 0
+
+    def stats(self) -> dict:
+        """
+        Report the reads served by the worker processes.
+        """
+        return {
+            'processes': self.max_workers,
+            'running': self._executor is not None,
+            'reads': self._reads,
+            'nbytes': self._nbytes,
+        }
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Forked workers would inherit netCDF/HDF5 library state mid-read.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+def _read_shared(partition):
+    """
+    Worker process task: read ``partition`` and copy the data into a new shared memory
+    block. Returns the name of the block with the shape and dtype of the data, which
+    the calling process unlinks once copied out. Ownership of the block passes to the
+    calling process, so it is unregistered from the resource tracker here and only 
+    registered by the calling process when it attaches.
+    """
+    data = np.ascontiguousarray(partition._read_fragment())
+
+    if data.dtype.hasobject:
+        return None, data, None
+
+    shm = SharedMemory(create=True, size=max(data.nbytes, 1))
+    try:
+        np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)[...] = data
+    except Exception:
+        shm.close()
+        shm.unlink()
+        raise
+    shm.close()
+
+    if os.name == 'posix':
+        # Shared memory is only tracked on POSIX systems.
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm.name, data.shape, data.dtype.str
+
+_reader = None
+_reader_lock = threading.Lock()
+
+def get_process_reader(max_workers: int = None) -> FragmentProcessReader:
+    """
+    Return the process-wide fragment reader, resized to ``max_workers`` processes if
+    given.
+    """
+    global _reader
+    with _reader_lock:
+        if _reader is None:
+            _reader = FragmentProcessReader(max_workers or DEFAULT_READER_PROCESSES)
+        elif max_workers:
+            _reader.resize(max_workers)
+        return _reader
@@ -0,0 +1,154 @@
+__author__    = "Daniel Westwood"
+__contact__   = "daniel.westwood@stfc.ac.uk"
+__copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
+
+import logging
+
+import numpy as np
+
+from cfapyx.utils import logstream
+
+logger = logging.getLogger(__name__)
+
+logger.addHandler(logstream)
+logger.propagate = False
+
+# Summary statistics recorded for each fragment, in the order written to the CFA file.
+STATISTICS = ('min', 'max', 'sum', 'count', 'nan_count')
+
+# Fragments that cannot contain any value satisfying ``x <op> threshold``.
+_PRUNE = {
+    '>':  lambda s, t: s.max_values <= t,
+    '>=': lambda s, t: s.max_values < t,
+    '<':  lambda s, t: s.min_values >= t,
+    '<=': lambda s, t: s.min_values > t,
+}
+
+def fragment_statistics(data) -> tuple:
+    """
+    Compute the summary statistics of the data from one fragment. Masked (missing)
+    values are ignored, and NaN values are counted separately from the valid values.
+
+    :param data:        (obj) The fragment data, as a numpy or numpy masked array.
+
+    :returns:   The ``(min, max, sum, count, nan_count)`` of the fragment, where min, max
+                and sum are NaN if the fragment has no valid values.
+    """
+    data  = np.ma.asarray(data)
+    valid = ~np.ma.getmaskarray(data)
+    raw   = np.asarray(np.ma.getdata(data))
+
+    nan_count = 0
+    if raw.dtype.kind in 'fc':
+        nans      = np.isnan(raw) & valid
+        nan_count = int(nans.sum())
+        valid     = valid & ~nans
+
+    values = raw[valid]
+    if not values.size:
+        return np.nan, np.nan, np.nan, 0, nan_count
+
+    return (
+        float(values.min()),
+        float(values.max()),
+        float(values.sum(dtype=np.float64)),
+        int(values.size),
+        nan_count
+    )
+
+class FragmentStatistics:
+    """
+    Per-fragment summary statistics of an aggregated variable, as recorded in the CFA
+    file by ``CFANetCDF``. Reductions over the whole aggregated array, and the fragments
+    which cannot satisfy a threshold condition, are found from these arrays without
+    opening any fragment.
+    """
+
+    description = 'Per-fragment summary statistics'
+
+    def __init__(self, min, max, sum, count, nan_count=None, units=None):
+        """
+        :param min:         (obj) Array with shape ``fragment_space`` of the minimum valid
+                            value in each fragment, NaN where there are no valid values.
+
+        :param max:         (obj) Array of the maximum valid value in each fragment.
+
+        :param sum:         (obj) Array of the sum of the valid values in each fragment.
+
+        :param count:       (obj) Integer array of the number of valid (non-missing,
+                            non-NaN) values in each fragment.
+
+        :param nan_count:   (obj) Integer array of the number of NaN values in each fragment.
+
+        :param units:       (str) *Optional* units of the min, max and sum values, as 
+                            recorded with the statistics. None if not recorded.
+        """
+        self.min_values = np.asarray(min, dtype=np.float64)
+        self.max_values = np.asarray(max, dtype=np.float64)
+        self.sum_values = np.asarray(sum, dtype=np.float64)
+        self.counts     = np.asarray(count, dtype=np.int64)
+
+        if nan_count is None:
+            nan_count = np.zeros_like(self.counts)
+        self.nan_counts = np.asarray(nan_count, dtype=np.int64)
+
+        self.units = units
+
+    @property
+    def fragment_space(self) -> tuple:
+        return self.counts.shape
+
+    def min(self) -> float:
+        """
+        The minimum valid value over all fragments.
+        """
+        if not self.count():
+            return np.nan
+        return float(np.min(self.min_values[self.counts > 0]))
+
+    def max(self) -> float:
+        """
+        The maximum valid value over all fragments.
+        """
+        if not self.count():
+            return np.nan
+        return float(np.max(self.max_values[self.counts > 0]))
+
+    def sum(self) -> float:
+        """
+        The sum of the valid values over all fragments.
+        """
+        return float(np.sum(self.sum_values[self.counts > 0]))
+
+    def count(self) -> int:
+        """
+        The number of valid values over all fragments.
+        """
+        return int(self.counts.sum())
+
+    def mean(self) -> float:
+        """
+        The mean of the valid values over all fragments.
+        """
+        count = self.count()
+        if not count:
+            return np.nan
+        return self.sum() / count
+
+    def keep(self, op: str, threshold) -> np.ndarray:
+        """
+        Determine the fragments which may contain values satisfying ``x <op> threshold``.
+
+        :param op:          (str) The comparison, one of ``>``, ``>=``, ``<`` or ``<=``.
+
+        :param threshold:   (float) The value compared against.
+
+        :returns:   Boolean array with shape ``fragment_space``, False for fragments in
+                    which no value can satisfy the condition.
+        """
+        if op not in _PRUNE:
+            raise ValueError(
+                f'Unsupported comparison "{op}" - expected one of {tuple(_PRUNE.keys())}'
+            )
+        pruned = _PRUNE[op](self, threshold) | (self.counts == 0)
+        return ~pruned
@@ -0,0 +1,94 @@
+import os
+
+import netCDF4
+import numpy as np
+import pytest
+import xarray as xr
+
+from cfapyx import CFANetCDF, append_fragments
+
+def write_fragment(directory, t, y, units='days since 2000-01-01'):
+    """
+    Write the fragment at position ``t`` along time and ``y`` along latitude, of two
+    time steps and three latitudes.
+    """
+    file = str(directory / f'frag_{t}_{y}.nc')
+    with netCDF4.Dataset(file, 'w') as ds:
+        ds.createDimension('time', 2)
+        ds.createDimension('latitude', 3)
+        time = ds.createVariable('time', 'f8', ('time',))
+        time.units = units
+        time[:] = [2*t, 2*t + 1]
+        ds.createVariable('latitude', 'f8', ('latitude',))[:] = np.arange(3*y, 3*y + 3)
+        ds.createVariable('p', 'f4', ('time', 'latitude'))[:] = (
+            np.arange(6).reshape(2, 3) + 10*t + 100*y
+        )
+    return file
+
+class TestAppend:
+
+    def test_append(self, tmp_path):
+
+        files = {(t, y): write_fragment(tmp_path, t, y) for t in range(4) for y in range(2)}
+
+        full = CFANetCDF(list(files.values()))
+        full.create(agg_dims=['time', 'latitude'], statistics=True)
+        full.write(str(tmp_path / 'full.nca'))
+
+        # Aggregate the middle time steps, then add the first and last in place.
+        FILE = str(tmp_path / 'growing.nca')
+        part = CFANetCDF([files[t, y] for t in (1, 2) for y in range(2)])
+        part.create(agg_dims=['time', 'latitude'], statistics=True)
+        part.write(FILE)
+
+        # Every latitude fragment is needed for each new time step.
+        with pytest.raises(ValueError, match='do not cover'):
+            append_fragments(FILE, [files[3, 0]], agg_dim='time')
+
+        new = [files[t, y] for t in (3, 0) for y in range(2)]
+        assert append_fragments(FILE, new, agg_dim='time') == FILE
+
+        with xr.open_dataset(str(tmp_path / 'full.nca'), engine='CFA') as expected, \
+                xr.open_dataset(FILE, engine='CFA') as ds:
+            assert np.array_equal(ds['time'].values, expected['time'].values)
+            assert np.array_equal(ds['p'].values, expected['p'].values)
+            assert ds['p'].cfa.max() == expected['p'].cfa.max()
+            assert ds['p'].cfa.count() == expected['p'].cfa.count()
+
+        with netCDF4.Dataset(FILE) as ds:
+            assert ds.variables['fragment_uris_0'][0, 1] == files[0, 1]
+            assert ds.variables['fragment_uris_0'][3, 0] == files[3, 0]
+
+        assert not [f for f in os.listdir(tmp_path) if f.endswith('.tmp')]
+
+    def test_append_errors(self, tmp_path):
+
+        files = [write_fragment(tmp_path, t, 0) for t in range(3)]
+
+        FILE = str(tmp_path / 'growing.nca')
+        cfa = CFANetCDF(files[:2])
+        cfa.create(agg_dims=['time'])
+        cfa.write(FILE)
+
+        with open(FILE, 'rb') as f:
+            original = f.read()
+
+        # Fragments already in the aggregation.
+        with pytest.raises(ValueError, match='already in the aggregation'):
+            append_fragments(FILE, files[1:])
+
+        # Coordinates in different units.
+        other = write_fragment(tmp_path, 5, 0, units='hours since 2000-01-01')
+        with pytest.raises(ValueError, match='units'):
+            append_fragments(FILE, [other])
+
+        # Fragments which do not match along latitude.
+        (tmp_path / 'other').mkdir()
+        other = write_fragment(tmp_path / 'other', 5, 1)
+        with pytest.raises(ValueError, match='latitude'):
+            append_fragments(FILE, [other])
+
+        # The aggregation is unchanged by a failed append.
+        with open(FILE, 'rb') as f:
+            assert f.read() == original
+        assert not [f for f in os.listdir(tmp_path) if f.endswith('.tmp')]
@@ -0,0 +1,174 @@
+import functools
+import os
+import shutil
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import netCDF4
+import numpy as np
+import pytest
+
+from cfapyx import get_fragment_cache
+from cfapyx.cache import FragmentCache, is_cached_location
+from cfapyx.wrappers import CFAPartition
+
+TESTDIR = 'cfapyx/tests/test_space'
+
+class _CountingHandler(SimpleHTTPRequestHandler):
+    requests = {}
+
+    def do_GET(self):
+        _CountingHandler.requests[self.path] = _CountingHandler.requests.get(self.path, 0) + 1
+        return super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+class TestFragmentCache:
+
+    def test_lru_budget(self, tmp_path):
+
+        cache = FragmentCache(str(tmp_path), max_bytes=2000)
+
+        for key in ['a', 'b', 'a', 'c']:
+            if cache.get((key,)) is None:
+                cache.put((key,), np.zeros(100))
+
+        stats = cache.stats()
+        assert stats['stores'] == 3
+        assert stats['hits'] == 1
+        assert stats['evictions'] == 1
+        assert stats['nbytes'] <= 2000
+
+        # 'b' was least recently used when 'c' was stored.
+        assert cache.get(('b',)) is None
+        assert cache.get(('a',)) is not None
+
+        # Entries persist for a new cache over the same directory.
+        assert len(FragmentCache(str(tmp_path), max_bytes=2000)) == 2
+
+    def test_cached_fragment(self, tmp_path, monkeypatch, testdir=TESTDIR):
+
+        opened = []
+        open_netcdf = CFAPartition._open_netcdf
+        def counted_open(self, filename):
+            opened.append(filename)
+            return open_netcdf(self, filename)
+        monkeypatch.setattr(CFAPartition, '_open_netcdf', counted_open)
+
+        cache = get_fragment_cache(str(tmp_path / 'cache'))
+        cache.reset_stats()
+
+        FILE = str(tmp_path / 'example0.nc')
+        shutil.copy(f'{testdir}/rain/example0.nc', FILE)
+
+        extent = [slice(0,1), slice(10,20), slice(0,360)]
+        partition = CFAPartition(
+            FILE, 'p', shape=(2,180,360), extent=extent,
+            format='nc', cache_dir=str(tmp_path / 'cache'), pool_handles=False
+        )
+
+        first  = np.array(partition)
+        opens  = len(opened)
+        second = np.array(partition.copy())
+
+        with netCDF4.Dataset(FILE) as ds:
+            ds.set_auto_maskandscale(False)
+            expected = ds.variables['p'][0:1, 10:20, :]
+
+        # The second read is served from the cache without opening the file.
+        assert opens > 0
+        assert len(opened) == opens
+        assert np.array_equal(first, expected)
+        assert np.array_equal(second, expected)
+
+        stats = cache.stats()
+        assert stats['misses'] == 1
+        assert stats['hits'] == 1
+
+        # A rewritten fragment is read again rather than served from the cache.
+        shutil.copy(f'{testdir}/rain/example1.nc', f'{FILE}.new')
+        os.replace(f'{FILE}.new', FILE)
+        os.utime(FILE, ns=(0, 0))
+
+        with netCDF4.Dataset(FILE) as ds:
+            ds.set_auto_maskandscale(False)
+            rewritten = ds.variables['p'][0:1, 10:20, :]
+
+        assert np.array_equal(np.array(partition.copy()), rewritten)
+        assert len(opened) > opens
+
+        assert is_cached_location('https://host/rain/example0.nc')
+        assert is_cached_location(f'{testdir}/rain/example0.nc', [f'{testdir}/rain/'])
+        assert not is_cached_location(f'{testdir}/rain/example0.nc')
+
+    def test_remote_fragment(self, tmp_path, testdir=TESTDIR):
+
+        handler = functools.partial(_CountingHandler, directory=testdir)
+        server  = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        thread  = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        try:
+            url = f'http://127.0.0.1:{server.server_port}/rain/example0.nc'
+            _CountingHandler.requests = {}
+
+            cache = get_fragment_cache(str(tmp_path))
+            cache.reset_stats()
+
+            extent = [slice(0,1), slice(10,20), slice(0,360)]
+            partition = CFAPartition(
+                url, 'p', shape=(2,180,360), extent=extent,
+                format='nc', cache_dir=str(tmp_path), pool_handles=False
+            )
+
+            first  = np.array(partition)
+            second = np.array(partition.copy())
+
+            # Other regions are read from the downloaded file, not the server.
+            other = np.array(CFAPartition(
+                url, 'p', shape=(2,180,360), extent=[slice(0,1), slice(0,5), slice(0,360)],
+                format='nc', cache_dir=str(tmp_path), pool_handles=False
+            ))
+
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        with netCDF4.Dataset(f'{testdir}/rain/example0.nc') as ds:
+            ds.set_auto_maskandscale(False)
+            expected = ds.variables['p'][0:1, 10:20, :]
+            expected_other = ds.variables['p'][0:1, 0:5, :]
+
+        assert _CountingHandler.requests == {'/rain/example0.nc': 1}
+        assert np.array_equal(first, expected)
+        assert np.array_equal(second, expected)
+        assert np.array_equal(other, expected_other)
+
+        # Two regions and the fragment file itself.
+        assert len(cache) == 3
+        stats = cache.stats()
+        assert stats['stores'] == 3
+        assert stats['hits'] == 2
+
+    def test_remote_budget(self, tmp_path, testdir=TESTDIR):
+
+        handler = functools.partial(_CountingHandler, directory=testdir)
+        server  = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        thread  = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        try:
+            url = f'http://127.0.0.1:{server.server_port}/rain/example0.nc'
+
+            # Files larger than the cache budget are not downloaded.
+            cache = FragmentCache(str(tmp_path), max_bytes=1000)
+            with pytest.raises(OSError, match='budget'):
+                cache.fetch(url)
+
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert len(cache) == 0
+        assert not os.listdir(tmp_path)
@@ -0,0 +1,45 @@
+import numpy as np
+
+from cfapyx.decoder import (FragmentTable, get_fragment_bounds,
+                            get_fragment_extents, get_fragment_positions,
+                            get_string_table)
+
+class TestFragmentTable:
+
+    def test_string_table(self):
+
+        values = np.array([['a.nc', 'b.nc'], ['a.nc', 'a.nc']], dtype=object)
+        table, index = get_string_table(values, (2,2))
+
+        assert table == ['a.nc', 'b.nc']
+        assert index.tolist() == [[0, 1], [0, 0]]
+
+    def test_matches_fragment_extents(self):
+
+        fragment_size_per_dim = [[2, 3, 1], [4], [5, 5]]
+        array_shape = (6, 4, 10)
+
+        global_extent, extent, shapes = get_fragment_extents(fragment_size_per_dim, array_shape)
+
+        fragment_info = {
+            pos: {
+                'shape': shapes[pos],
+                'location': f'fragment_{pos[0]}.nc',
+                'address': 'p',
+                'extent': extent[pos],
+                'global_extent': global_extent[pos],
+            } for pos in get_fragment_positions(fragment_size_per_dim)
+        }
+
+        starts, stops = get_fragment_bounds(fragment_size_per_dim)
+        table = FragmentTable.from_dict(fragment_info, (3, 1, 2))
+
+        assert all(np.array_equal(a, b) for a, b in zip(table.starts, starts))
+        assert len(table.locations) == 3
+        assert table.addresses == ['p']
+
+        for pos, info in fragment_info.items():
+            assert table[pos] == info
+
+        table.substitute('fragment_', 'remote/fragment_')
+        assert table.location((2, 0, 1)) == 'remote/fragment_2.nc'
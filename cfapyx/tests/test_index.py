@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from cfapyx import get_lock_manager
+from cfapyx.index import FragmentIntervalIndex
+
+TESTDIR = 'cfapyx/tests/test_space'
+
+class TestFragmentIndex:
+
+    def test_interval_index(self):
+
+        index = FragmentIntervalIndex(
+            {'time': np.arange(10, 20)}, {'time': [0, 4, 8, 10]}
+        )
+
+        assert 'time' in index
+        assert index.index_slice('time', slice(12, 15)) == slice(2, 6, 1)
+        assert index.fragments('time', slice(12, 15)) == (0, 2)
+        assert index.fragments('time', 18) == (2, 3)
+        assert index.fragments('time', slice(30, 40)) == (0, 0)
+
+        with pytest.raises(ValueError):
+            FragmentIntervalIndex({'time': np.arange(5)}, {'time': [0, 4, 8]})
+
+    def test_label_selection(self, testdir=TESTDIR):
+
+        FILE = f'{testdir}/testrain.nca'
+
+        with xr.open_dataset(FILE, engine='CFA', cache=False) as ds:
+            p = ds['p']
+
+            assert p.cfa.fragments(time=slice(3, 4)) == {'time': (1, 2)}
+
+            expected = p.sel(time=slice(3, 4), latitude=slice(0, 10)).values
+
+            manager = get_lock_manager()
+            manager.reset_stats()
+
+            data = p.cfa.sel(time=slice(3, 4), latitude=slice(0, 10)).values
+            assert np.allclose(data, expected, equal_nan=True)
+            # Only the single fragment covering the selected times is read.
+            assert manager.stats()['acquisitions'] == 1
+
+            scalar = p.cfa.sel(time=7)
+            assert scalar.dims == ('latitude', 'longitude')
+            assert np.allclose(scalar.values, p.sel(time=7).values, equal_nan=True)
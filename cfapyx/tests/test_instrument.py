@@ -0,0 +1,52 @@
+import xarray as xr
+
+from cfapyx import get_read_recorder, instrument
+
+TESTDIR = 'cfapyx/tests/test_space'
+
+class TestInstrument:
+
+    def test_instrument_context(self, testdir=TESTDIR):
+
+        FILE = f'{testdir}/testrain.nca'
+
+        with xr.open_dataset(FILE, engine='CFA', cache=False, cfa_options={'max_open_files': 0}) as ds:
+            with instrument() as recorder:
+                data = ds['p'].isel(time=slice(0, 4)).values
+
+            table = recorder.table()
+            stages = table.groupby('stage').size().to_dict()
+
+            # Two fragments of two time steps each, one graph build.
+            assert stages == {'graph': 1, 'open': 2, 'read': 2}
+            assert table[table.stage == 'read'].nbytes.sum() == data.nbytes
+            assert (table.seconds > 0).all()
+
+            summary = recorder.summary()
+            assert summary['count'].sum() == 5
+
+            # Nothing is recorded outside the context.
+            ds['p'].isel(time=slice(4, 6)).values
+            assert len(recorder) == 5
+
+    def test_instrument_option(self, testdir=TESTDIR):
+
+        FILE = f'{testdir}/testrain.nca'
+
+        recorder = get_read_recorder()
+        recorder.reset()
+
+        with xr.open_dataset(FILE, engine='CFA', cache=False, cfa_options={'instrument': True}) as ds:
+            darr = ds['p'].data
+            annotations = darr.dask.layers[darr.name].annotations
+            assert annotations['cfapyx_array'] == darr.name
+            assert 'cfapyx_graph_seconds' in annotations
+
+            fragment = annotations['cfapyx_fragment']((darr.name, 0, 0, 0))
+            assert fragment['address'] == 'p'
+            assert fragment['position'] == (0, 0, 0)
+
+            ds['p'].values
+
+        assert len(recorder.table().query('stage == "read"')) == 10
+        recorder.reset()
@@ -0,0 +1,125 @@
+import threading
+
+import dask
+import numpy as np
+import xarray as xr
+from arraypartition import ArrayPartition
+
+from cfapyx import get_lock_manager
+from cfapyx import locks
+from cfapyx.locks import FragmentLockManager, library_threadsafe
+from cfapyx.tests.test_read import fragment_wrapper
+
+TESTDIR = 'cfapyx/tests/test_space'
+
+class TestLockManager:
+
+    def test_per_file_locks(self):
+
+        manager = FragmentLockManager(global_lock=False)
+
+        assert manager.get_lock('a.nc') is manager.get_lock('a.nc')
+        assert manager.get_lock('a.nc') is not manager.get_lock('b.nc')
+
+        assert manager.needs_global_lock('nc', None) is False
+        assert FragmentLockManager().needs_global_lock('nc') != library_threadsafe()
+        assert not FragmentLockManager().needs_global_lock('zarr')
+
+        # Readers of different files hold their locks at the same time.
+        inside = threading.Barrier(2, timeout=5)
+        def read(location):
+            with manager.lock(location):
+                inside.wait()
+
+        threads = [threading.Thread(target=read, args=(f,)) for f in ['a.nc', 'b.nc']]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert not inside.broken
+        assert manager.stats()['contended'] == 0
+
+        # Readers of the same file are serialised.
+        def hold():
+            with manager.lock('a.nc'):
+                pass
+
+        with manager.lock('a.nc'):
+            blocked = threading.Thread(target=hold)
+            blocked.start()
+            blocked.join(timeout=0.2)
+            assert blocked.is_alive()
+
+        blocked.join()
+        assert manager.stats()['contended'] == 1
+
+    def test_threaded_read(self, testdir=TESTDIR):
+
+        FILE = f'{testdir}/testrain.nca'
+
+        manager = get_lock_manager()
+        manager.reset_stats()
+
+        with xr.open_dataset(FILE, engine='CFA') as ds:
+            expected = ds['p'].isel(latitude=slice(140,145)).to_numpy()
+
+        options = {'chunks': {'time': 1}, 'global_lock': True}
+        with xr.open_dataset(FILE, engine='CFA', cfa_options=options) as ds:
+            data = ds['p'].isel(latitude=slice(140,145)).to_numpy()
+
+        assert np.allclose(data, expected, equal_nan=True)
+        # One read per fragment, then one per time step.
+        assert manager.stats()['acquisitions'] == 30
+
+    def test_concurrent_files(self, monkeypatch, testdir=TESTDIR):
+
+        FILE = f'{testdir}/testrain.nca'
+
+        def overlapping_reads(timeout):
+            """
+            Read two fragment files from separate threads, with each read waiting
+            inside its file lock until a read of the other file starts.
+            """
+            active, overlap = set(), threading.Event()
+            guard, read = threading.Lock(), ArrayPartition.__array__
+            def overlapping_read(self, *args, **kwargs):
+                with guard:
+                    active.add(self.filename)
+                    if len(active) > 1:
+                        overlap.set()
+                overlap.wait(timeout=timeout)
+                try:
+                    return read(self, *args, **kwargs)
+                finally:
+                    with guard:
+                        active.discard(self.filename)
+
+            with monkeypatch.context() as m:
+                m.setattr(ArrayPartition, '__array__', overlapping_read)
+
+                options = {'chunks': {'time': 2}}
+                with xr.open_dataset(FILE, engine='CFA', cfa_options=options) as ds:
+                    wrapper = fragment_wrapper(ds['p'].variable._data)
+                    darr = wrapper.__array__()
+
+                    # One block per fragment file, each read from its own thread.
+                    def read_block(i):
+                        np.asarray(darr.blocks[i].compute(scheduler='sync'))
+
+                    threads = [
+                        threading.Thread(target=read_block, args=(i,)) for i in range(2)
+                    ]
+                    for t in threads:
+                        t.start()
+                    for t in threads:
+                        t.join()
+
+            return overlap.is_set()
+
+        # Reads of different files only overlap if the library build is thread-safe.
+        monkeypatch.setattr(locks, 'library_threadsafe', lambda: True)
+        assert overlapping_reads(timeout=5)
+
+        monkeypatch.setattr(locks, 'library_threadsafe', lambda: False)
+        assert not overlapping_reads(timeout=0.5)
@@ -0,0 +1,46 @@
+import os
+import shutil
+
+import numpy as np
+import xarray as xr
+
+from cfapyx import get_metadata_cache
+
+TESTDIR = 'cfapyx/tests/test_space'
+
+class TestMetadataCache:
+
+    def test_metadata_cache(self, tmp_path, testdir=TESTDIR):
+
+        FILE = str(tmp_path / 'testrain.nca')
+        shutil.copy(f'{testdir}/testrain.nca', FILE)
+
+        cache_dir = str(tmp_path / 'metadata')
+        options   = {'metadata_cache': cache_dir}
+        cache     = get_metadata_cache(cache_dir)
+
+        with xr.open_dataset(FILE, engine='CFA') as ds:
+            expected = ds['p'].values
+
+        with xr.open_dataset(FILE, engine='CFA', cfa_options=options) as ds:
+            assert np.allclose(ds['p'].values, expected, equal_nan=True)
+
+        assert cache.stats()['stores'] == 1
+        assert cache.stats()['hits'] == 0
+
+        # A warm open takes the decoded fragments from the cache.
+        with xr.open_dataset(FILE, engine='CFA', cfa_options=options) as ds:
+            assert np.allclose(ds['p'].values, expected, equal_nan=True)
+
+        assert cache.stats()['hits'] == 1
+
+        # A modified file is decoded again, replacing the previous entry.
+        stat = os.stat(FILE)
+        os.utime(FILE, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        with xr.open_dataset(FILE, engine='CFA', cfa_options=options | {'lazy_decode': True}) as ds:
+            assert np.allclose(ds['p'].values, expected, equal_nan=True)
+
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['stores'] == 2
+        assert len(cache) == 1
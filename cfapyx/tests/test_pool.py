@@ -0,0 +1,61 @@
+import xarray as xr
+
+from cfapyx import get_handle_pool
+from cfapyx.pool import FragmentHandlePool
+
+TESTDIR = 'cfapyx/tests/test_space'
+
+class _Handle:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class TestHandlePool:
+
+    def test_lru_eviction(self):
+
+        pool = FragmentHandlePool(max_open_files=2)
+        handles = {}
+
+        def opener(key):
+            def _open():
+                handles[key] = _Handle()
+                return handles[key]
+            return _open
+
+        for key in ['a', 'b', 'a', 'c']:
+            with pool.checkout((key, 'p'), opener(key)):
+                pass
+
+        stats = pool.stats()
+        assert stats['opens'] == 3
+        assert stats['hits'] == 1
+        assert stats['evictions'] == 1
+        assert len(pool) == 2
+
+        # 'b' was least recently used when 'c' was opened.
+        assert handles['b'].closed
+        assert not handles['a'].closed
+
+    def test_pooled_read(self, testdir=TESTDIR):
+
+        FILE = f'{testdir}/testrain.nca'
+
+        pool = get_handle_pool()
+        pool.close_all()
+        pool.reset_stats()
+
+        with xr.open_dataset(FILE, engine='CFA', cfa_options={'max_open_files': 4}, cache=False) as ds:
+            p_sel = ds['p'].isel(time=slice(0,3))
+
+            first  = p_sel.mean().to_numpy()
+            second = p_sel.mean().to_numpy()
+
+        assert abs(first - second) < 1e-6
+
+        stats = pool.stats()
+        assert stats['open_files'] <= 4
+        assert stats['opens'] == 2
+        assert stats['hits'] > 0
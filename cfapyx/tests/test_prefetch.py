@@ -0,0 +1,72 @@
+import numpy as np
+import xarray as xr
+
+from cfapyx import get_prefetcher
+from cfapyx.prefetch import FragmentPrefetcher
+
+TESTDIR = 'cfapyx/tests/test_space'
+
+class _Partition:
+    def __init__(self, key, extent, prefetch=None):
+        self.key      = key
+        self.extent   = extent
+        self.prefetch = prefetch
+        self.reads    = 0
+
+    def _pool_key(self):
+        return (self.key, 'p')
+
+    def get_extent(self):
+        return self.extent
+
+    def _read(self):
+        self.reads += 1
+        shape = tuple(e.stop - e.start for e in self.extent)
+        return np.arange(np.prod(shape)).reshape(shape)
+
+class TestPrefetcher:
+
+    def test_read_ahead(self):
+
+        prefetcher = FragmentPrefetcher(max_workers=2, buffer_size=2)
+        extent = (slice(0,4,1), slice(0,6,1))
+
+        neighbours = [_Partition(k, extent) for k in ['b', 'c', 'd']]
+        first = _Partition('a', extent, prefetch=neighbours)
+
+        assert prefetcher.fetch(first).shape == (4,6)
+
+        # Only the most recent regions fit in the buffer.
+        stats = prefetcher.stats()
+        assert stats['prefetched'] == 3
+        assert stats['buffered'] == 2
+        assert stats['misses'] == 1
+
+        # Sub-regions of a buffered fragment are served from the buffer.
+        sub = _Partition('d', (slice(1,3,1), slice(2,6,1)), prefetch=[])
+        data = prefetcher.fetch(sub)
+
+        assert sub.reads == 0
+        assert neighbours[2].reads == 1
+        assert (data == neighbours[2]._read()[1:3, 2:6]).all()
+        assert prefetcher.stats()['hits'] == 1
+
+    def test_prefetched_read(self, testdir=TESTDIR):
+
+        FILE = f'{testdir}/testrain.nca'
+
+        prefetcher = get_prefetcher()
+        prefetcher.clear()
+        prefetcher.reset_stats()
+
+        with xr.open_dataset(FILE, engine='CFA') as ds:
+            expected = ds['p'].isel(latitude=slice(140,145)).to_numpy()
+
+        with xr.open_dataset(FILE, engine='CFA', cfa_options={'prefetch': 2}) as ds:
+            for t in range(ds.sizes['time']):
+                data = ds['p'].isel(time=t, latitude=slice(140,145)).to_numpy()
+                assert np.allclose(data, expected[t], equal_nan=True)
+
+        stats = prefetcher.stats()
+        assert stats['prefetched'] > 0
+        assert stats['hits'] > stats['misses']
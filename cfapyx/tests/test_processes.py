@@ -0,0 +1,65 @@
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from cfapyx import get_process_reader
+from cfapyx.processes import _read_shared
+from cfapyx.wrappers import CFAPartition
+
+TESTDIR = 'cfapyx/tests/test_space'
+
+class TestProcessReader:
+
+    def test_process_read(self, testdir=TESTDIR):
+
+        FILE = f'{testdir}/testrain.nca'
+
+        reader = get_process_reader(2)
+        reader.reset_stats()
+
+        with xr.open_dataset(FILE, engine='CFA') as ds:
+            expected = ds['p'].isel(time=slice(0,6)).to_numpy()
+
+        with xr.open_dataset(FILE, engine='CFA', cfa_options={'processes': 2}) as ds:
+            data = ds['p'].isel(time=slice(0,6)).to_numpy()
+
+        reader.shutdown()
+
+        assert np.allclose(data, expected, equal_nan=True)
+
+        # One read per fragment, all returned through shared memory.
+        stats = reader.stats()
+        assert stats['reads'] == 3
+        assert stats['nbytes'] == expected.nbytes
+
+    def test_shared_memory_ownership(self, monkeypatch, testdir=TESTDIR):
+
+        unregistered = []
+        unregister   = resource_tracker.unregister
+        def recorded(name, rtype):
+            unregistered.append(name)
+            return unregister(name, rtype)
+        monkeypatch.setattr(resource_tracker, 'unregister', recorded)
+
+        extent = [slice(0,1), slice(10,20), slice(0,360)]
+        partition = CFAPartition(
+            f'{testdir}/rain/example0.nc', 'p', shape=(2,180,360), extent=extent,
+            format='nc', pool_handles=False
+        )
+
+        # The worker gives up the block it creates, and the reader then owns it.
+        name, shape, dtype = _read_shared(partition)
+        assert len(unregistered) == 1
+
+        shm = SharedMemory(name=name)
+        data = np.array(np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+        shm.close()
+        shm.unlink()
+
+        assert np.array_equal(data, np.array(partition))
+        assert len(unregistered) == 2
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=name)
@@ -1,8 +1,25 @@
 # All routines for testing CFA general methods.
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import xarray as xr
+from dask.blockwise import Blockwise
+from dask.core import flatten
+
+from cfapyx.datastore import CFADataStore
+from cfapyx.wrappers import FragmentArrayWrapper
 
 TESTDIR = 'cfapyx/tests/test_space'
 
+def fragment_wrapper(data):
+    """
+    The FragmentArrayWrapper beneath the layers of lazy indexing that xarray adds 
+    around the ``data`` of a variable.
+    """
+    while not isinstance(data, FragmentArrayWrapper):
+        data = data.array
+    return data
+
 class TestCFARead:
 
     def test_cfa_pure(self, testdir=TESTDIR):
@@ -43,6 +60,205 @@ class TestCFARead:
 
         print('Integration tests: Read(pure) - complete')
 
+    def test_cfa_pruned_selection(self, testdir=TESTDIR):
+
+        FILE = f'{testdir}/testrain.nca'
+
+        ds = xr.open_dataset(FILE, engine='CFA')
+
+        # Only the fragments covering time 2-5 should be in the graph.
+        wrapper = fragment_wrapper(ds['p'].variable._data)
+
+        darr = wrapper[(slice(2,5), slice(None), slice(None))]
+        assert darr.numblocks == (2, 1, 1)
+
+        p_sel = ds['p'].isel(time=slice(2,5))
+        p_all = ds['p'].to_numpy()
+
+        assert p_sel.shape == (3, 180, 360)
+        assert abs(p_sel.mean().to_numpy() - p_all[2:5].mean()) < 1e-6
+
+    def test_cfa_empty_selection(self, testdir=TESTDIR):
+
+        FILE = f'{testdir}/testrain.nca'
+
+        ds = xr.open_dataset(FILE, engine='CFA')
+
+        wrapper = fragment_wrapper(ds['p'].variable._data)
+
+        # No fragments are read for a selection with no elements.
+        darr = wrapper[(slice(3,3), slice(None), slice(None))]
+        assert darr.shape == (0, 180, 360)
+        assert len(darr.__dask_graph__()) == 1
+
+        assert ds['p'][3:3].values.shape == (0, 180, 360)
+        assert ds['p'][3:3, 5].values.shape == (0, 360)
+        assert ds['p'][5:2].values.shape == (0, 180, 360)
+        assert ds['p'][:, []].values.shape == (20, 0, 360)
+        assert ds['p'][3:3].values.dtype == ds['p'].dtype
+
+        # Stepped selections match the same selection of the whole array.
+        darr = wrapper[(slice(1,19,3), slice(None), slice(None))]
+        assert darr.shape == (6, 180, 360)
+
+        p = ds['p'].values
+        for selection in [
+                np.s_[1:19:3], 
+                np.s_[::-1], 
+                np.s_[2, 1:170:4, 3], 
+                np.s_[:, [1,5,7]]
+            ]:
+            assert ds['p'][selection].shape == p[selection].shape
+            assert np.array_equal(ds['p'][selection].values, p[selection], equal_nan=True)
+
+    def test_cfa_cached_array(self, testdir=TESTDIR):
+
+        FILE = f'{testdir}/testrain.nca'
+
+        ds = xr.open_dataset(FILE, engine='CFA')
+
+        wrapper = fragment_wrapper(ds['p'].variable._data)
+
+        first = wrapper.__array__()
+        assert wrapper.__array__() is first
+
+        # Changing the options invalidates the assembled array.
+        wrapper.cfa_options = wrapper.cfa_options | {'chunks': {'time': 1}}
+        rechunked = wrapper.__array__()
+
+        assert rechunked is not first
+        assert rechunked.numblocks[0] == 20
+
+    def test_cfa_substitutions(self, testdir=TESTDIR):
+
+        FILE = f'{testdir}/testrain.nca'
+
+        options = {'substitutions': 'rain/:rain/mirror/'}
+        with xr.open_dataset(FILE, engine='CFA', cfa_options=options) as ds:
+
+            wrapper = fragment_wrapper(ds['p'].variable._data)
+
+            location = wrapper.fragment_info.location((0, 0, 0))
+            assert '/rain/mirror/example' in location
+
+            # Assigning the options again does not substitute the locations again.
+            wrapper.cfa_options = wrapper.cfa_options
+            wrapper.cfa_options = wrapper.cfa_options | {'chunks': {'time': 1}}
+            assert wrapper.fragment_info.location((0, 0, 0)) == location
+
+            wrapper.cfa_options = wrapper.cfa_options | {'substitutions': None}
+            assert wrapper.fragment_info.location((0, 0, 0)) == location.replace('mirror/', '')
+
+    def test_cfa_culled_graph(self, testdir=TESTDIR):
+
+        FILE = f'{testdir}/testrain.nca'
+
+        ds = xr.open_dataset(FILE, engine='CFA', cfa_options={'chunks': {'time': 1}})
+
+        wrapper = fragment_wrapper(ds['p'].variable._data)
+
+        darr = wrapper.__array__()
+        assert isinstance(darr.dask.layers[darr.name], Blockwise)
+
+        # Partition tasks are only generated for the selected blocks.
+        sub   = darr[0:2]
+        graph = sub.__dask_graph__().cull(set(flatten(sub.__dask_keys__())))
+        ntasks = sum(
+            len(layer) for name, layer in graph.layers.items() if name.startswith(darr.name)
+        )
+        assert ntasks == 2
+
+    def test_cfa_lazy_decode(self, testdir=TESTDIR):
+
+        FILE = f'{testdir}/testrain.nca'
+
+        with xr.open_dataset(FILE, engine='CFA', cfa_options={'lazy_decode': True}) as ds:
+
+            wrapper = fragment_wrapper(ds['p'].variable._data)
+
+            # Only the header has been read so far.
+            assert not wrapper.decoded
+            assert ds['p'].shape == (20, 180, 360)
+
+            p_lazy = ds['p'].isel(time=slice(0,3)).mean().to_numpy()
+            assert wrapper.decoded
+
+        with xr.open_dataset(FILE, engine='CFA') as eager:
+            p_eager = eager['p'].isel(time=slice(0,3)).mean().to_numpy()
+
+        assert abs(p_lazy - p_eager) < 1e-6
+
+    def test_cfa_shared_decoding(self, testdir=TESTDIR):
+
+        FILE = f'{testdir}/testrain.nca'
+
+        store = CFADataStore.open(FILE)
+        store.cfa_options = {}
+
+        var = store.ds.variables['p']
+        wrappers = []
+        for v in [store.open_cfa_variable('p', var), store.open_cfa_variable('p', var)]:
+            wrapper = fragment_wrapper(v._data)
+            wrappers.append(wrapper)
+
+        # Shape, location and address are each decoded once.
+        assert len(store.decoded_fragment_arrays) == 3
+
+        first, second = (w.fragment_info for w in wrappers)
+        assert first is not second
+        assert first.location_index is second.location_index
+        assert first.starts[0] is second.starts[0]
+
+        store.close()
+
+    def test_cfa_threaded_lazy_decode(self, testdir=TESTDIR):
+
+        FILE = f'{testdir}/testrain.nca'
+
+        store = CFADataStore.open(FILE)
+        store.cfa_options = {'lazy_decode': True}
+
+        # Fragment array variables are only read under the store lock.
+        perform_decoding = store.perform_decoding
+        def locked_decoding(*args, **kwargs):
+            assert store.lock.locked()
+            return perform_decoding(*args, **kwargs)
+        store.perform_decoding = locked_decoding
+
+        var = store.ds.variables['p']
+        wrappers = []
+        for _ in range(8):
+            wrapper = fragment_wrapper(store.open_cfa_variable('p', var)._data)
+            wrappers.append(wrapper)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            tables = list(pool.map(lambda w: w.fragment_info, wrappers))
+
+        assert len(store.decoded_fragment_arrays) == 3
+        assert all(t.location_index is tables[0].location_index for t in tables)
+
+        store.close()
+
+    def test_cfa_selected_variables(self, testdir=TESTDIR):
+
+        FILE = f'{testdir}/testrain.nca'
+
+        with xr.open_dataset(FILE, engine='CFA', drop_variables='p') as ds:
+            assert 'p' not in ds
+            assert 'time' in ds
+
+        with xr.open_dataset(FILE, engine='CFA', cfa_options={'keep_variables': ['p']}) as ds:
+            assert set(ds.variables) == {'p', 'time', 'latitude', 'longitude'}
+
+        # Skipped aggregated variables never read their fragment array variables.
+        store = CFADataStore.open(FILE)
+        store.cfa_options = {'keep_variables': ['latitude']}
+
+        assert set(store.get_variables()) == {'latitude'}
+        assert not store.decoded_fragment_arrays
+
+        store.close()
+
 if __name__ == '__main__':
 
     #import os
@@ -50,4 +266,4 @@ if __name__ == '__main__':
 
     TestCFARead().test_cfa_pure()
 
-    print('Run with poetry run pytest -v -s')
\ No newline at end of file
+    print('Run with poetry run pytest -v -s')
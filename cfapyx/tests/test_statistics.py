@@ -0,0 +1,118 @@
+import netCDF4
+import numpy as np
+import pytest
+import xarray as xr
+
+from cfapyx import CFANetCDF, get_lock_manager
+from cfapyx.statistics import FragmentStatistics, fragment_statistics
+
+TESTDIR = 'cfapyx/tests/test_space'
+
+def write_fragment(directory, t, units):
+    """
+    Write the fragment at position ``t`` along time, of two time steps with ``p`` in 
+    ``units``.
+    """
+    file = str(directory / f'frag_{t}.nc')
+    with netCDF4.Dataset(file, 'w') as ds:
+        ds.createDimension('time', 2)
+        time = ds.createVariable('time', 'f8', ('time',))
+        time.units = 'days since 2000-01-01'
+        time[:] = [2*t, 2*t + 1]
+        p = ds.createVariable('p', 'f8', ('time',))
+        p.units = units
+        p[:] = [10.0*t, 10.0*t + 1]
+    return file
+
+class TestFragmentStatistics:
+
+    def test_fragment_statistics(self):
+
+        data = np.ma.array([[1.0, np.nan], [4.0, 9.0]], mask=[[False, False], [False, True]])
+        assert fragment_statistics(data) == (1.0, 4.0, 5.0, 2, 1)
+
+        stats = FragmentStatistics(
+            min=[1.0, np.nan, 5.0], max=[4.0, np.nan, 8.0], sum=[5.0, np.nan, 13.0],
+            count=[2, 0, 2]
+        )
+        assert stats.min() == 1.0
+        assert stats.max() == 8.0
+        assert stats.mean() == 4.5
+        assert stats.keep('>', 4.0).tolist() == [False, False, True]
+        assert stats.keep('<=', 4.0).tolist() == [True, False, False]
+
+    def test_statistics_pushdown(self, tmp_path, testdir=TESTDIR):
+
+        FILE = str(tmp_path / 'stats.nca')
+
+        cfa = CFANetCDF(f'{testdir}/rain/example*.nc')
+        cfa.create(statistics=True)
+        cfa.write(FILE)
+
+        manager = get_lock_manager()
+
+        with xr.open_dataset(FILE, engine='CFA', cache=False) as ds:
+            assert 'fragment_max_p' not in ds
+
+            # Reductions are answered without opening any fragment.
+            manager.reset_stats()
+            p = ds['p']
+            results = {name: getattr(p.cfa, name)() for name in ['min', 'max', 'mean', 'count']}
+            assert manager.stats()['acquisitions'] == 0
+
+            for name, value in results.items():
+                assert np.isclose(value, getattr(p, name)())
+
+            # Only fragments with a maximum above the threshold are read.
+            threshold = float(np.sort(p.cfa._find_wrapper().statistics.max_values.ravel())[-3])
+            manager.reset_stats()
+            pruned = p.cfa.where('>=', threshold).compute()
+            assert manager.stats()['acquisitions'] == 3
+
+            assert np.allclose(pruned, p.where(p >= threshold), equal_nan=True)
+
+    def test_statistics_units(self, tmp_path):
+
+        # Statistics are recorded in the units shared by every fragment.
+        FILE  = str(tmp_path / 'kelvin.nca')
+        files = [write_fragment(tmp_path, t, 'K') for t in range(3)]
+        cfa = CFANetCDF(files)
+        cfa.create(statistics=True)
+        cfa.write(FILE)
+
+        with netCDF4.Dataset(FILE) as ds:
+            assert ds.variables['fragment_max_p'].units == 'K'
+
+        manager = get_lock_manager()
+        with xr.open_dataset(FILE, engine='CFA', cache=False) as ds:
+            manager.reset_stats()
+            assert ds['p'].cfa.max() == 21.0
+            assert manager.stats()['acquisitions'] == 0
+
+        # No statistics are recorded for fragments in different units.
+        (tmp_path / 'mixed').mkdir()
+        files = [
+            write_fragment(tmp_path / 'mixed', t, u) for t, u in enumerate(['K', 'degC', 'K'])
+        ]
+        cfa = CFANetCDF(files)
+        cfa.create(statistics=True)
+        cfa.write(str(tmp_path / 'mixed.nca'))
+
+        with netCDF4.Dataset(str(tmp_path / 'mixed.nca')) as ds:
+            assert 'aggregated_statistics' not in ds.variables['p'].ncattrs()
+            assert 'fragment_max_p' not in ds.variables
+
+        # Statistics in other units than the aggregated variable are not used.
+        with netCDF4.Dataset(FILE, 'a') as ds:
+            ds.variables['p'].aggregated_units = 'degC'
+
+        with xr.open_dataset(FILE, engine='CFA', cache=False) as ds:
+            wrapper = ds['p'].cfa._find_wrapper()
+            assert wrapper.statistics.units == 'K'
+            assert ds['p'].cfa._pruned('>', 0.0) is None
+
+            # The reductions then match the data converted on reading.
+            pytest.importorskip('cfunits')
+            for name in ['min', 'max', 'mean']:
+                assert np.isclose(getattr(ds['p'].cfa, name)(), getattr(ds['p'], name)())
+            assert np.isclose(ds['p'].cfa.max(), 21.0 - 273.15)
@@ -0,0 +1,53 @@
+import numpy as np
+
+from cfapyx.decoder import FragmentTable, get_fragment_bounds
+from cfapyx.wrappers import FragmentArrayWrapper
+
+def constant_wrapper(values, fragment_size=4, cfa_options=None):
+    """
+    Wrapper over a 1D time-aggregated array where each fragment is a single constant value.
+    """
+    fragment_size_per_dim = [[fragment_size]*len(values), [3]]
+    array_shape = (fragment_size*len(values), 3)
+
+    starts, stops = get_fragment_bounds(fragment_size_per_dim)
+
+    fragment_info = FragmentTable(
+        starts, stops,
+        fill_values=np.array(values).reshape((len(values), 1))
+    )
+
+    return FragmentArrayWrapper(
+        fragment_info,
+        (len(values), 1),
+        shape=array_shape,
+        units='',
+        dtype=np.dtype('float64'),
+        cfa_options=cfa_options or {},
+        named_dims=('time', 'x'),
+    )
+
+class TestFragmentArrayWrapper:
+
+    def test_constant_fragments(self):
+
+        wrapper = constant_wrapper([1.0, 2.0, 3.0])
+
+        data = wrapper.__array__().compute()
+        assert data.shape == (12, 3)
+        assert np.array_equal(data[:, 0], np.repeat([1.0, 2.0, 3.0], 4))
+
+        # Selection across a fragment boundary
+        sel = wrapper[(slice(2, 6), slice(None))].compute()
+        assert np.array_equal(sel[:, 1], [1.0, 1.0, 2.0, 2.0])
+
+    def test_constant_fragments_chunked(self):
+
+        wrapper = constant_wrapper([5.0, 7.0], cfa_options={'chunks': {'time': 2}})
+
+        darr = wrapper.__array__()
+        assert darr.numblocks == (4, 1)
+
+        block = darr.blocks[3].compute()
+        assert block.shape == (2, 3)
+        assert np.all(block == 7.0)
@@ -1,6 +1,10 @@
 import logging
 
+import netCDF4
+import numpy as np
+
 from cfapyx import CFANetCDF
+import cfapyx.creator
 import xarray as xr
 
 TESTDIR = 'cfapyx/tests/test_space'
@@ -64,5 +68,102 @@ class TestCFAWrite:
 
         print('Integration tests: Write-Read(pure) - complete')
 
+    def test_parallel_write(self, tmp_path, testdir=TESTDIR):
+
+        filepattern = f'{testdir}/rain/example*.nc'
+
+        serial = CFANetCDF(filepattern)
+        serial.create(statistics=True)
+        serial.write(str(tmp_path / 'serial.nca'))
+
+        # Files are scanned by worker processes, then merged in file order.
+        parallel = CFANetCDF(filepattern)
+        parallel.create(statistics=True, workers=2)
+        parallel.write(str(tmp_path / 'parallel.nca'))
+
+        assert parallel.agg_dims == serial.agg_dims
+        assert parallel.fragment_stats == serial.fragment_stats
+
+        with xr.open_dataset(tmp_path / 'serial.nca', engine='CFA') as s, \
+             xr.open_dataset(tmp_path / 'parallel.nca', engine='CFA') as p:
+            assert s.identical(p)
+
+    def test_single_open(self, tmp_path, monkeypatch):
+
+        files = []
+        for x in range(3):
+            file = str(tmp_path / f'fragment_{x}.nc')
+            with netCDF4.Dataset(file, 'w') as ds:
+                ds.createDimension('time', 2)
+                ds.createDimension('latitude', 3)
+                ds.createVariable('time', 'f8', ('time',))[:] = [2*x, 2*x + 1]
+                ds.createVariable('latitude', 'f8', ('latitude',))[:] = [0, 1, 2]
+                ds.createVariable('mask', 'i4', ('latitude',))[:] = [1, 0, 1]
+                ds.createVariable('p', 'f4', ('time', 'latitude'))[:] = np.full((2, 3), x)
+            files.append(file)
+
+        opened = []
+        open_dataset = netCDF4.Dataset
+        def Dataset(*args, **kwargs):
+            opened.append(open_dataset(*args, **kwargs))
+            return opened[-1]
+        monkeypatch.setattr(cfapyx.creator.netCDF4, 'Dataset', Dataset)
+
+        cfa = CFANetCDF(files)
+        cfa.create(agg_dims=['time'])
+
+        assert cfa.identical_vars == ('mask',)
+        assert cfa.var_info['mask']['data'].tolist() == [1, 0, 1]
+
+        # Every file is opened once and closed, with mask kept from the first pass.
+        assert len(opened) == 3
+        assert not any(ds.isopen() for ds in opened)
+
+        # Without a sample budget the first two files are opened again.
+        opened.clear()
+        cfa = CFANetCDF(files)
+        cfa.create(agg_dims=['time'], sample_budget=0)
+
+        assert cfa.var_info['mask']['data'].tolist() == [1, 0, 1]
+        assert len(opened) == 5
+        assert not any(ds.isopen() for ds in opened)
+
+    def test_streaming_scan(self, tmp_path, monkeypatch):
+
+        # Fragments of differing lengths along time, given out of order.
+        files, stop = [], 0
+        for x in range(40):
+            size = 1 + (x % 3)
+            file = str(tmp_path / f'frag{x}.nc')
+            with netCDF4.Dataset(file, 'w') as ds:
+                ds.createDimension('time', size)
+                ds.createDimension('latitude', 2)
+                ds.createVariable('time', 'f8', ('time',))[:] = np.arange(stop, stop + size)
+                ds.createVariable('latitude', 'f8', ('latitude',))[:] = [0, 1]
+                ds.createVariable('p', 'f4', ('time', 'latitude'))[:] = x
+            files.append(file)
+            stop += size
+        files = files[1::2] + files[::2]
+
+        opened, most_open = [], []
+        open_dataset = netCDF4.Dataset
+        def Dataset(*args, **kwargs):
+            opened.append(open_dataset(*args, **kwargs))
+            most_open.append(sum(ds.isopen() for ds in opened))
+            return opened[-1]
+        monkeypatch.setattr(cfapyx.creator.netCDF4, 'Dataset', Dataset)
+
+        cfa = CFANetCDF(files)
+        cfa.create(agg_dims=['time'])
+
+        # Only one file is open at a time during the scan.
+        assert max(most_open) == 1
+        assert not any(ds.isopen() for ds in opened)
+
+        assert cfa.agg_dims == ('time',)
+        assert cfa.dim_info['time']['array'].tolist() == list(range(stop))
+        assert cfa.dim_info['time']['sizes'] == tuple(1 + (x % 3) for x in range(40))
+        assert cfa.location.tolist() == sorted(files, key=lambda f: int(f[:-3].split('frag')[-1]))
+
 if __name__ == '__main__':
     TestCFAWrite().test_cfa_write()
\ No newline at end of file
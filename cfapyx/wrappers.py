@@ -2,26 +2,80 @@ __author__    = "Daniel Westwood"
 __contact__   = "daniel.westwood@stfc.ac.uk"
 __copyright__ = "Copyright 2024 United Kingdom Research and Innovation"
 
+import copy
 import logging
 import math
+import os
+from collections import OrderedDict
+from functools import partial
 from itertools import product
 
 import dask.array as da
+import netCDF4
 import numpy as np
 from arraypartition import ArrayLike, ArrayPartition
-from arraypartition.partition import (combine_slices, get_chunk_extent,
-                                      get_chunk_positions, get_chunk_shape,
+from arraypartition.partition import (get_chunk_extent, get_chunk_positions, get_chunk_shape,
                                       get_chunk_space, get_dask_chunks,
                                       normalize_partition_chunks)
 from dask.array.core import getter
 from dask.array.reductions import numel
 from dask.base import tokenize
+from dask.blockwise import blockwise as core_blockwise
+from dask.highlevelgraph import HighLevelGraph
+from dask.layers import ArrayBlockwiseDep
 from dask.utils import SerializableLock, is_arraylike
 
-from cfapyx.utils import slice_to_shape
+from cfapyx.cache import (get_fragment_cache, is_cached_location,
+                          is_http_location)
+from cfapyx.decoder import FragmentTable
+from cfapyx.instrument import is_recording, timed
+from cfapyx.locks import get_lock_manager
+from cfapyx.pool import get_handle_pool
+from cfapyx.prefetch import get_prefetcher
+from cfapyx.processes import get_process_reader
 
 logger = logging.getLogger(__name__)
 
+# Number of assembled dask arrays (whole or pruned) kept by each FragmentArrayWrapper.
+ARRAY_CACHE_SIZE = 32
+
+# Leading bytes of the netCDF classic, 64-bit offset, CDF-5 and netCDF4/HDF5 formats.
+NETCDF_SIGNATURES = (b'CDF\x01', b'CDF\x02', b'CDF\x05', b'\x89HDF\r\n\x1a\n')
+
+def _check_netcdf(path):
+    """
+    Raise an ``OSError`` if the file at ``path`` does not start with a netCDF signature.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(8)
+    if not head.startswith(NETCDF_SIGNATURES):
+        raise OSError(f'{path} is not a netCDF file')
+
+def combine_extent(extent, selection):
+    """
+    Combine the slices of an existing ``extent`` with a ``selection`` made relative 
+    to that extent, accounting for the step of both. Integer indices are kept as
+    slices of length one.
+
+    :param extent:      (list) The slices in each dimension with explicit start and 
+        stop, and a positive step.
+
+    :param selection:   (tuple) The slices or integer indices to apply within the 
+        ``extent``, with a positive step.
+
+    :returns:   The combined list of slices.
+    """
+    combined = []
+    for ext, sel in zip(extent, selection):
+        indices = range(ext.start or 0, ext.stop, ext.step or 1)
+        if isinstance(sel, slice):
+            indices = indices[sel]
+        else:
+            indices = indices[sel:(sel+1) or None]
+
+        stop = indices[-1] + 1 if len(indices) else indices.start
+        combined.append(slice(indices.start, stop, indices.step))
+    return combined
 
 class CFAPartition(ArrayPartition):
     """
@@ -38,6 +92,12 @@ class CFAPartition(ArrayPartition):
                  aggregated_units=None,
                  aggregated_calendar=None,
                  global_extent=None,
+                 pool_handles=True,
+                 prefetch=None,
+                 cache_dir=None,
+                 global_lock=None,
+                 processes=None,
+                 instrument=False,
                  **kwargs
             ):
         
@@ -58,17 +118,241 @@ class CFAPartition(ArrayPartition):
             then the data is 'post-processed' using the cfunits ``conform`` function.
 
         :param aggregated_calendar:     None
+
+        :param pool_handles:    (bool) Reuse open fragment file handles from the 
+            process-wide ``FragmentHandlePool`` rather than opening the fragment file
+            on every read.
+
+        :param prefetch:        (list) The partitions to read ahead into the prefetch buffer
+            whenever this partition is read. If None, the prefetch buffer is not used.
+
+        :param cache_dir:       (str) Directory of the on-disk ``FragmentCache`` used to 
+            hold the data for this partition between reads. Fragment files served over
+            plain HTTP(S) are also downloaded into this directory to be read. If None, 
+            the data is always read from the fragment file.
+
+        :param global_lock:     (bool) Hold the global library lock while reading the
+            fragment file, in addition to the lock for this file. If None, the global 
+            lock is only taken where the library build is not thread-safe.
+
+        :param processes:       (int) Read the fragment data in one of this many worker
+            processes of the process-wide ``FragmentProcessReader``. If None, the data
+            is read in the calling thread.
+
+        :param instrument:      (bool) Record the open, read and unit conversion times for
+            this partition in the process-wide ``ReadRecorder``. Times are also recorded
+            within any ``instrument`` context.
         """
 
+        self.pool_handles   = pool_handles
+        self.prefetch       = prefetch
+        self.cache_dir      = cache_dir
+        self.global_lock    = global_lock
+        self.processes      = processes
+        self.instrument     = instrument
+        self._pooled_handle = None
+
         super().__init__(filename, address, units=aggregated_units, **kwargs)
         self.aggregated_units    = aggregated_units
         self.aggregated_calendar = aggregated_calendar
         self.global_extent = global_extent
 
+    def __array__(self, *args, **kwargs):
+        """
+        Retrieve the data for this partition, from the prefetch buffer if prefetching
+        is enabled and this region has already been read ahead.
+        """
+        if self.prefetch is None:
+            return self._read(*args, **kwargs)
+
+        data = get_prefetcher().fetch(self)
+
+        dtype = args[0] if args else kwargs.get('dtype')
+        return np.asarray(data, dtype=dtype)
+
+    def _read(self, *args, **kwargs):
+        """
+        Read the data for this partition, from the on-disk fragment cache if enabled
+        for this partition and the data has been read before.
+        """
+        if self.cache_dir is None:
+            return self._read_fragment(*args, **kwargs)
+
+        cache = get_fragment_cache(self.cache_dir)
+        key   = self._cache_key()
+
+        data = cache.get(key)
+        if data is None:
+            data = self._read_fragment()
+            cache.put(key, data)
+
+        dtype = args[0] if args else kwargs.get('dtype')
+        return np.asarray(data, dtype=dtype)
+
+    def _read_fragment(self, *args, **kwargs):
+        """
+        Read the data for this partition, checking out the fragment file handle 
+        from the handle pool for the duration of the read if pooling is enabled. The
+        lock for the fragment file is held throughout, so reads of different files
+        may proceed concurrently. Reads are dispatched to a worker process instead if
+        a number of ``processes`` is set.
+        """
+        if self.processes:
+            with self._timed('read') as record:
+                data = get_process_reader(self.processes).read(self)
+                record['nbytes'] = data.nbytes
+
+            dtype = args[0] if args else kwargs.get('dtype')
+            return np.asarray(data, dtype=dtype)
+
+        locks = get_lock_manager()
+        with locks.lock(self._pool_key()[0], self.format, self.global_lock):
+            with self._timed('read') as record:
+                if not self.pool_handles:
+                    data = super().__array__(*args, **kwargs)
+                else:
+                    pool = get_handle_pool()
+                    with pool.checkout(self._pool_key(), self._open_fragment) as ds:
+                        self._pooled_handle = ds
+                        try:
+                            data = super().__array__(*args, **kwargs)
+                        finally:
+                            self._pooled_handle = None
+                record['nbytes'] = data.nbytes
+        return data
+
+    def open(self):
+        """
+        Return the handle checked out from the pool if there is one, otherwise open
+        the fragment file directly.
+        """
+        if self._pooled_handle is not None:
+            return self._pooled_handle
+        return self._open_fragment()
+
+    def _open_fragment(self):
+        """
+        Open the fragment file, timing the open if recording.
+        """
+        with self._timed('open'):
+            return super().open()
+
+    def _timed(self, stage):
+        """
+        Context timing ``stage`` of the read path for this partition, see ``timed``.
+        """
+        return timed(
+            stage,
+            self.instrument,
+            location=self._pool_key()[0],
+            address=str(self.address),
+            position=self.position,
+        )
+
+    def _pool_key(self):
+        """
+        The ``(location, address)`` key identifying this fragment in the handle pool.
+        """
+        filename = self.filename
+        if not isinstance(filename, str):
+            filename = tuple(filename)
+        return (filename, str(self.address))
+
+    def _cache_key(self):
+        """
+        The ``(location, address, extent)`` key identifying the data for this partition
+        in the fragment cache. The units are included as the data is cached after any
+        unit conversion, and the modification time and size of local fragment files so
+        rewritten files are read again.
+        """
+        extent = tuple((e.start, e.stop, e.step) for e in self.get_extent())
+        return self._pool_key() + (extent, str(self.aggregated_units), self._file_stamp())
+
+    def _file_stamp(self):
+        """
+        The ``(mtime, size)`` of each local fragment file for this partition, or None
+        for remote locations.
+        """
+        filenames = self.filename
+        if isinstance(filenames, str):
+            filenames = [filenames]
+
+        stamp = []
+        for filename in filenames:
+            try:
+                stat = os.stat(filename)
+            except (OSError, TypeError, ValueError):
+                stamp.append(None)
+            else:
+                stamp.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(stamp)
+
+    def _open_netcdf(self, filename):
+        """
+        Open a NetCDF fragment file. Files served over plain HTTP(S) are streamed into
+        the fragment cache directory and opened from there, as netCDF-C only opens such
+        URLs through OPeNDAP. If the download is not a netCDF file, or no ``cache_dir``
+        is set, the URL is opened directly.
+        """
+        if self.cache_dir is not None and is_http_location(filename):
+            cache = get_fragment_cache(self.cache_dir)
+            try:
+                path = cache.fetch(filename, check=_check_netcdf)
+            except OSError as err:
+                logger.debug(f'Unable to fetch {filename} into the cache: {err}')
+            else:
+                return super()._open_netcdf(path)
+        return super()._open_netcdf(filename)
+
     def reshape(self, shape, **kwargs):
         nparr = np.reshape(self.__array__(), shape)
         return nparr
 
+    @property
+    def shape(self):
+        """
+        The shape of the current ``extent`` of this partition, for any step.
+        """
+        if not self._extent:
+            return self._shape
+        return tuple(len(range(e.start or 0, e.stop, e.step or 1)) for e in self._extent)
+
+    @shape.setter
+    def shape(self, value):
+        self._shape = value
+
+    @property
+    def size(self):
+        return math.prod(self.shape)
+
+    def __getitem__(self, selection):
+        """
+        Combine ``selection`` with the current extent where possible, so the data is
+        only read when required. Negative steps and index arrays cannot be combined, 
+        so are applied to the data read for the combined extent instead, as are 
+        integer indices which drop their dimension.
+        """
+        if not isinstance(selection, tuple):
+            selection = (selection,)
+        selection = selection + (slice(None),) * (self.ndim - len(selection))
+
+        extent, remainder = [], []
+        for sdim in selection:
+            if isinstance(sdim, (int, np.integer)):
+                extent.append(int(sdim))
+                remainder.append(0)
+            elif isinstance(sdim, slice) and (sdim.step or 1) > 0:
+                extent.append(sdim)
+                remainder.append(slice(None))
+            else:
+                extent.append(slice(None))
+                remainder.append(sdim)
+
+        partition = self.copy(extent=tuple(extent))
+        if all(isinstance(r, slice) for r in remainder):
+            return partition
+        return np.asarray(partition)[tuple(remainder)]
+
     def copy(self, extent=None):
         """
         Create a new instance of this class from its own methods and attributes, and 
@@ -83,8 +367,9 @@ class CFAPartition(ArrayPartition):
             kwargs.pop('units')
 
         if extent:
-            kwargs['extent'] = combine_slices(self.shape, list(self.get_extent()), extent)
-            kwargs['global_extent'] = combine_slices(self.shape, list(self.global_extent), extent)
+            kwargs['extent'] = combine_extent(self.get_extent(), extent)
+            if self.global_extent is not None:
+                kwargs['global_extent'] = combine_extent(self.global_extent, extent)
 
         new = CFAPartition(
             self.filename,
@@ -107,13 +392,20 @@ class CFAPartition(ArrayPartition):
                     '`conda install -c conda-forge udunits2`'
                 )
 
-            data = Units.conform(data, self.units, self.aggregated_units)
+            with self._timed('units'):
+                data = Units.conform(data, self.units, self.aggregated_units)
         return data
 
     def get_kwargs(self):
         return {
             'aggregated_units': self.aggregated_units,
-            'aggregated_calendar': self.aggregated_calendar
+            'aggregated_calendar': self.aggregated_calendar,
+            'pool_handles': self.pool_handles,
+            'prefetch': self.prefetch,
+            'cache_dir': self.cache_dir,
+            'global_lock': self.global_lock,
+            'processes': self.processes,
+            'instrument': self.instrument,
         } | super().get_kwargs()
 
 class FragmentArrayWrapper(ArrayLike):
@@ -135,12 +427,14 @@ class FragmentArrayWrapper(ArrayLike):
             units, 
             dtype, 
             cfa_options={}, 
-            named_dims=None
+            named_dims=None,
+            decoder=None,
         ):
         """
         Initialisation method for the FragmentArrayWrapper class
 
-        :param fragment_info:   (dict) The information relating to each fragment with the 
+        :param fragment_info:   (obj) The ``FragmentTable`` describing every fragment, or 
+            a dict of the information relating to each fragment with the 
             fragment coordinates in ``fragment space`` as the key. Each 
             fragment is described by the following:
             - ``shape`` - The shape of the fragment in ``array space``.
@@ -165,11 +459,24 @@ class FragmentArrayWrapper(ArrayLike):
 
         :param named_dims:  (list) The set of dimension names that apply to this Array object.
 
+        :param decoder:     (callable) Function with no arguments returning the ``fragment_info``
+            and ``fragment_space``, used to decode the fragments on first access if 
+            ``fragment_info`` is not given.
+
         :returns: None
         """
 
-        self.fragment_info    = fragment_info
-        self.fragment_space   = fragment_space
+        self._decoder       = decoder
+        self._decode_lock   = SerializableLock()
+        self._fragment_info = None
+
+        if fragment_info is not None:
+            self._set_fragments(fragment_info, fragment_space)
+        elif decoder is None:
+            raise ValueError(
+                'FragmentArrayWrapper requires either the fragment_info or a decoder.'
+            )
+
         self.named_dims       = named_dims
 
         super().__init__(shape, dtype=dtype, units=units)
@@ -177,68 +484,338 @@ class FragmentArrayWrapper(ArrayLike):
         # Set internal private variables
         self.cfa_options    = cfa_options
 
-        self._apply_substitutions()
-
         self.__array_function__ = self.__array__
 
     def __getitem__(self, selection):
         """
-        Non-lazy retrieval of the dask array when this object is indexed.
+        Non-lazy retrieval of the dask array when this object is indexed. Only the 
+        fragments that intersect the selection are included in the dask graph.
         """
-        arr = self.__array__()
+        if not isinstance(selection, tuple):
+            selection = (selection,)
+
+        # Expand any Ellipsis so there is one index per dimension.
+        ellipsis = [x for x, s in enumerate(selection) if s is Ellipsis]
+        if ellipsis:
+            ix = ellipsis[0]
+            fill = (slice(None),) * (self.ndim - len(selection) + 1)
+            selection = selection[:ix] + fill + selection[ix+1:]
+
+        selection = selection + (slice(None),) * (self.ndim - len(selection))
+
+        shape = self._selection_shape(selection)
+
+        # No fragments are needed for a selection with no elements.
+        if 0 in shape:
+            return da.empty(shape, dtype=self.dtype, chunks=shape)
+
+        fragment_ranges, local_selection = self._prune_selection(selection)
+        arr = self._build_array(fragment_ranges)
 
         # Enforce correct reshaping - dask array here can sometimes not
         # auto-drop dimensions so reshaping is enforced.
-        new_shape=[]
-        for aix in range(len(arr.shape)):
-            sdim = selection[aix]
+        return da.reshape(arr[local_selection], shape)
+
+    def _selection_shape(self, selection):
+        """
+        The shape of the result of ``selection``, with each dimension indexed 
+        independently. Integer indices drop their dimension.
+        """
+        shape = []
+        for dim, sdim in enumerate(selection):
             if isinstance(sdim, slice):
-                ns = slice_to_shape(sdim, arr.shape[aix])
-                if ns is not None:
-                    new_shape.append(ns)
-        new_shape = tuple(new_shape)
-        d = da.reshape(arr[tuple(selection)], new_shape)
-        return d
+                shape.append(len(range(*sdim.indices(self.shape[dim]))))
+                continue
+            if isinstance(sdim, (int, np.integer)):
+                continue
+
+            indices = np.asarray(sdim)
+            if indices.ndim == 0:
+                continue
+            if indices.dtype.kind == 'b':
+                shape.append(int(np.count_nonzero(indices)))
+            else:
+                shape.append(indices.size)
+        return tuple(shape)
 
-    
     def __array__(self):
         """
         Non-lazy array construction, this will occur as soon as the instance is ``indexed`` 
         or any other ``array`` behaviour is attempted. Construction of a Dask-like array 
         occurs here based on the decoded fragment info and any other specified settings.
         """
+        return self._build_array()
 
-        array_name = (f"{self.__class__.__name__}-{tokenize(self)}",)
+    def _build_array(self, fragment_ranges=None):
+        """
+        Construct the Dask-like array from the fragments within ``fragment_ranges``.
 
-        # Fragment info dict at this point
-        fragment_info = self.fragment_info
+        :param fragment_ranges:     (list) The ``(start, stop)`` range of fragment indices
+            to include along each dimension in ``fragment space``. Defaults to all
+            fragments.
 
-        # dict of array-like objects to pass to the dask Array constructor.
-        fragments = self._get_fragments()
-        
-        if not self.chunks:
-            dsk = self._assemble_dsk_dict(fragments, array_name)
+        :returns:   A dask array covering only the region of ``array space`` spanned by the
+            selected fragments.
+        """
 
-            global_extent = {
-                k: fragment_info[k]["global_extent"] for k in fragment_info.keys()
-            }
+        if fragment_ranges is None:
+            fragment_ranges = [(0, n) for n in self.fragment_space]
 
-            dask_chunks = get_dask_chunks(
-                self.shape,
-                self.fragment_space,
-                extent=global_extent,
-                dtype=self.dtype,
-                explicit_shapes=None
-            )
+        cache_key = tuple(tuple(r) for r in fragment_ranges)
+        if cache_key in self._array_cache:
+            self._array_cache.move_to_end(cache_key)
+            return self._array_cache[cache_key]
+
+        array_name = f"{self.__class__.__name__}-{tokenize(self._get_token(), cache_key)}"
+
+        with timed('graph', self._instrument, address=array_name) as record:
+            darr = self._build_dask_array(array_name, fragment_ranges)
+        self._annotate_graph(darr, record)
+
+        self._array_cache[cache_key] = darr
+        if len(self._array_cache) > ARRAY_CACHE_SIZE:
+            self._array_cache.popitem(last=False)
+
+        return darr
 
+    def _build_dask_array(self, array_name, fragment_ranges):
+        """
+        Assemble the dask array named ``array_name`` from the fragments within 
+        ``fragment_ranges``, see ``_build_array``.
+        """
+
+        fragment_space = tuple(stop - start for start, stop in fragment_ranges)
+        bounds         = self._fragment_bounds()
+        shape          = tuple(
+            int(b[stop] - b[start]) for b, (start, stop) in zip(bounds, fragment_ranges)
+        )
+
+        origin = tuple(start for start, stop in fragment_ranges)
+
+        if not self.chunks:
+            # One dask chunk per fragment.
+            dask_chunks = tuple(
+                tuple(np.diff(b[start:stop+1]).tolist()) for b, (start, stop) in zip(bounds, fragment_ranges)
+            )
+            partitions = FragmentBlockDep(
+                dask_chunks,
+                self._get_fragment,
+                origin,
+                [list(range(n)) for n in fragment_space],
+                prefetch=self._get_prefetch_factory(),
+            )
         else:
-            dask_chunks, partitions = self._create_partitions(fragments)
-                
-            dsk = self._assemble_dsk_dict(partitions, array_name)
+            dask_chunks, partitions = self._create_partitions(fragment_ranges)
+
+        return self._assemble_array(partitions, array_name, dask_chunks, shape=shape)
+
+    def prune(self, keep, fill_value):
+        """
+        Construct the Dask-like array in which only the fragments marked in ``keep`` are
+        read from their fragment files, with one dask chunk per fragment. Every other 
+        fragment is served as a constant ``fill_value`` without any file access.
+
+        :param keep:        (obj) Boolean array with shape ``fragment_space``.
 
-        darr = self._assemble_array(dsk, array_name[0], dask_chunks)
+        :param fill_value:  (obj) The value of every element of the pruned fragments.
+        """
+        keep = np.asarray(keep, dtype=bool)
+
+        array_name = f"{self.__class__.__name__}-pruned-{tokenize(self._get_token(), keep, fill_value)}"
+
+        with timed('graph', self._instrument, address=array_name) as record:
+            dask_chunks = tuple(tuple(np.diff(b).tolist()) for b in self._fragment_bounds())
+            partitions  = FragmentBlockDep(
+                dask_chunks,
+                partial(self._get_pruned_fragment, keep, fill_value),
+                (0,) * self.ndim,
+                [list(range(n)) for n in self.fragment_space],
+            )
+            darr = self._assemble_array(partitions, array_name, dask_chunks)
+        self._annotate_graph(darr, record)
         return darr
+
+    def _annotate_graph(self, darr, record):
+        """
+        Add the graph build time from ``record`` to the annotations of the layer that
+        reads the fragments for ``darr``, if recording.
+        """
+        if record['seconds'] is None:
+            return
+        layer = darr.dask.layers[darr.name]
+        layer.annotations = (layer.annotations or {}) | {
+            'cfapyx_graph_seconds': record['seconds']
+        }
+
+    def _get_pruned_fragment(self, keep, fill_value, pos):
+        """
+        Create the fragment object at ``pos``, or a constant partition if this fragment
+        is not marked in ``keep``.
+        """
+        if keep[pos]:
+            return self._get_fragment(pos)
+
+        return ConstantPartition(
+            fill_value,
+            self.fragment_info.shape(pos),
+            dtype=self.dtype,
+            position=pos,
+            global_extent=self.fragment_info.global_extent(pos),
+        )
+
+    def _get_token(self):
+        """
+        Deterministic token for this array, computed once from the fragment info and
+        options rather than on every array construction.
+        """
+        if self._token is None:
+            self._token = tokenize(
+                self.fragment_info, 
+                self.shape, 
+                self.dtype, 
+                self.units,
+                self.chunks,
+            )
+        return self._token
+
+    def _fragment_bounds(self):
+        """
+        The boundaries of the fragments in ``array space`` along each dimension, as
+        an array of length ``n_fragments + 1`` per dimension.
+        """
+        if getattr(self, '_bounds', None) is not None:
+            return self._bounds
+
+        self._bounds = [self.fragment_info.bounds(dim) for dim in range(self.ndim)]
+        return self._bounds
+
+    def _prune_selection(self, selection):
+        """
+        Determine the fragments along each dimension that intersect the ``selection``, 
+        and convert the selection to apply to the array built from only those fragments.
+
+        :param selection:   (tuple) The index applied to this array, one element per 
+            dimension.
+
+        :returns:   The ``(start, stop)`` range of fragments per dimension, and the 
+            selection relative to the start of those fragments.
+        """
+
+        bounds = self._fragment_bounds()
+
+        def fragment_of(index, dim):
+            return int(np.searchsorted(bounds[dim], index, side='right') - 1)
+
+        fragment_ranges, local_selection = [], []
+        for dim, sdim in enumerate(selection):
+            size  = self.shape[dim]
+            total = (0, self.fragment_space[dim])
+
+            if isinstance(sdim, slice):
+                start, stop, step = sdim.indices(size)
+                if step < 0:
+                    # No pruning for reversed selections.
+                    fragment_ranges.append(total)
+                    local_selection.append(sdim)
+                    continue
+
+                last  = start + step * ((stop - 1 - start) // step)
+                first_frag = fragment_of(start, dim)
+                last_frag  = fragment_of(last, dim)
+                offset = int(bounds[dim][first_frag])
+
+                fragment_ranges.append((first_frag, last_frag + 1))
+                local_selection.append(slice(start - offset, last - offset + 1, step))
+
+            elif isinstance(sdim, (int, np.integer)):
+                index = int(sdim) + size if sdim < 0 else int(sdim)
+                frag  = fragment_of(index, dim)
+
+                fragment_ranges.append((frag, frag + 1))
+                local_selection.append(index - int(bounds[dim][frag]))
+
+            else:
+                try:
+                    indices = np.asarray(sdim)
+                except Exception:
+                    indices = None
+
+                if indices is None or indices.dtype.kind not in 'iub' or indices.size == 0:
+                    fragment_ranges.append(total)
+                    local_selection.append(sdim)
+                    continue
+
+                if indices.dtype.kind == 'b':
+                    indices = np.nonzero(indices)[0]
+                    if indices.size == 0:
+                        fragment_ranges.append(total)
+                        local_selection.append(sdim)
+                        continue
+                indices = np.where(indices < 0, indices + size, indices)
+
+                first_frag = fragment_of(indices.min(), dim)
+                last_frag  = fragment_of(indices.max(), dim)
+
+                fragment_ranges.append((first_frag, last_frag + 1))
+                local_selection.append(indices - int(bounds[dim][first_frag]))
+
+        return fragment_ranges, tuple(local_selection)
     
+    @property
+    def fragment_info(self):
+        """
+        The ``FragmentTable`` for this array, decoded on first access if deferred.
+        """
+        if self._fragment_info is None:
+            self._decode()
+        if self._substituted != self._substitutions:
+            self._apply_substitutions()
+        return self._fragment_info
+
+    @property
+    def fragment_space(self):
+        if self._fragment_info is None:
+            self._decode()
+        return self._fragment_space
+
+    @property
+    def statistics(self):
+        """
+        The ``FragmentStatistics`` recorded in the CFA file for this array, or None if
+        the file has no per-fragment statistics.
+        """
+        return self.fragment_info.statistics
+
+    @property
+    def decoded(self) -> bool:
+        """
+        True if the fragments for this array have been decoded.
+        """
+        return self._fragment_info is not None
+
+    def _set_fragments(self, fragment_info, fragment_space):
+        if isinstance(fragment_info, dict):
+            fragment_info = FragmentTable.from_dict(fragment_info, fragment_space)
+
+        self._decoded_info   = fragment_info
+        self._fragment_info  = fragment_info
+        self._fragment_space = tuple(fragment_space)
+
+        # The substitutions applied to the locations in ``_fragment_info``.
+        self._substituted = None
+
+    def _decode(self):
+        """
+        Decode the fragments for this array using the deferred ``decoder``.
+        """
+        with self._decode_lock:
+            if self._fragment_info is not None:
+                return
+
+            logger.debug(f'Decoding deferred fragment array for {self.named_dims}')
+            fragment_info, fragment_space = self._decoder()
+            self._set_fragments(fragment_info, fragment_space)
+
     @property
     def cfa_options(self):
         """
@@ -249,7 +826,15 @@ class FragmentArrayWrapper(ArrayLike):
             'substitutions': self._substitutions,
             'decode_cfa': self._decode_cfa,
             'chunks': self.chunks,
-            'chunk_limits':self._chunk_limits
+            'chunk_limits':self._chunk_limits,
+            'max_open_files': self._max_open_files,
+            'prefetch': self._prefetch,
+            'cache_dir': self._cache_dir,
+            'cache_size': self._cache_size,
+            'cache_locations': self._cache_locations,
+            'global_lock': self._global_lock,
+            'processes': self._processes,
+            'instrument': self._instrument,
         }
 
     @cfa_options.setter
@@ -262,6 +847,14 @@ class FragmentArrayWrapper(ArrayLike):
             decode_cfa=None,
             chunks={},
             chunk_limits=None,
+            max_open_files=None,
+            prefetch=None,
+            cache_dir=None,
+            cache_size=None,
+            cache_locations=None,
+            global_lock=None,
+            processes=None,
+            instrument=False,
             **kwargs):
         """
         Sets the private variables referred by the ``cfa_options`` parameter to the backend. 
@@ -273,54 +866,151 @@ class FragmentArrayWrapper(ArrayLike):
         self._chunk_limits  = chunk_limits
         self.chunks         = chunks
 
-    def _get_fragments(self) -> dict:
+        self._max_open_files = max_open_files
+        if max_open_files:
+            get_handle_pool().resize(max_open_files)
+
+        self._prefetch = prefetch
+        if prefetch:
+            prefetcher = get_prefetcher()
+            if prefetcher.buffer_size < 2 * prefetch:
+                prefetcher.resize(buffer_size=2 * prefetch)
+
+        self._cache_dir       = cache_dir
+        self._cache_size      = cache_size
+        self._cache_locations = cache_locations
+        if cache_dir and cache_size:
+            get_fragment_cache(cache_dir).resize(cache_size)
+
+        self._global_lock = global_lock
+        self._processes   = processes
+        self._instrument  = instrument
+
+        # Any previously assembled arrays no longer reflect these options.
+        self._array_cache = OrderedDict()
+        self._token       = None
+
+    def _get_fragments(self, fragment_ranges=None) -> dict:
         """
-        Get the set of fragment objects to pass to dask."""
+        Get the set of fragment objects to pass to dask.
 
-        dtype = self.dtype
-        units = self.units
+        :param fragment_ranges:     (list) The ``(start, stop)`` range of fragment indices
+            to include along each dimension. Fragments are keyed by their position
+            relative to the start of these ranges. Defaults to all fragments.
+        """
+
+        if fragment_ranges is None:
+            fragment_ranges = [(0, n) for n in self.fragment_space]
 
-        calendar = None # Fix later
+        origin    = tuple(start for start, stop in fragment_ranges)
+        positions = product(*(range(start, stop) for start, stop in fragment_ranges))
 
         fragments = {}
+        for pos in positions:
+            fragments[tuple(p - o for p, o in zip(pos, origin))] = self._get_fragment(pos)
+        
+        return fragments
 
-        for pos in self.fragment_info.keys():
+    def _get_fragment(self, pos):
+        """
+        Create the fragment object (CFAPartition) at position ``pos`` in ``fragment space``.
+        """
 
-            fragment_shape    = self.fragment_info[pos]['shape']
-            fragment_position = pos
-            global_extent     = self.fragment_info[pos]['global_extent']
-            extent            = self.fragment_info[pos]['extent']
+        dtype = self.dtype
+        units = self.units
 
-            fragment_format   = 'nc'
+        calendar = None # Fix later
 
-            if 'fill_value' in self.fragment_info[pos]:
-                filename = None
-                address = None
-                # Extra handling required for this condition.
-            else:
-                filename   = self.fragment_info[pos]['location']
-                address    = self.fragment_info[pos]['address']
-                
-                # Wrong extent type for both scenarios but keep as a different label for 
-                # dask chunking.
+        fragment_shape    = self.fragment_info.shape(pos)
+        fragment_position = pos
+        global_extent     = self.fragment_info.global_extent(pos)
+        extent            = self.fragment_info.extent(pos)
+
+        fragment_format   = 'nc'
 
-            fragment = self.partition(
-                filename,
-                address,
+        if self.fragment_info.is_constant:
+            # Constant-valued fragment, no file access required.
+            return ConstantPartition(
+                self.fragment_info.fill_value(pos),
+                fragment_shape,
                 dtype=dtype,
-                extent=extent,
-                shape=fragment_shape,
                 position=fragment_position,
-                aggregated_units=units,
-                aggregated_calendar=calendar,
-                format=fragment_format,
-                named_dims=self.named_dims,
-                global_extent=global_extent
+                global_extent=global_extent,
             )
 
-            fragments[pos] = fragment
+        filename   = self.fragment_info.location(pos)
+        address    = self.fragment_info.address(pos)
+
+        return self.partition(
+            filename,
+            address,
+            dtype=dtype,
+            extent=extent,
+            shape=fragment_shape,
+            position=fragment_position,
+            aggregated_units=units,
+            aggregated_calendar=calendar,
+            format=fragment_format,
+            named_dims=self.named_dims,
+            global_extent=global_extent,
+            pool_handles=(self._max_open_files != 0),
+            cache_dir=self._get_cache_dir(filename),
+            global_lock=self._global_lock,
+            processes=self._processes,
+            instrument=self._instrument,
+        )
+
+    def _get_cache_dir(self, location):
+        """
+        The fragment cache directory for fragments from ``location``, or None if
+        fragments from this location are not cached.
+        """
+        if not self._cache_dir:
+            return None
+        if not is_cached_location(location, self._cache_locations):
+            return None
+        return self._cache_dir
+
+    def _get_prefetch_factory(self):
+        """
+        Return the function giving the partitions to read ahead for each partition, or
+        None if prefetching is disabled. Fragments are read ahead along the leading 
+        dimension that is split into more than one fragment.
+        """
+        if not self._prefetch:
+            return None
+
+        leading = [dim for dim, n in enumerate(self.fragment_space) if n > 1]
+        if not leading:
+            return None
         
-        return fragments
+        return self._get_prefetch_partitions
+
+    def _get_prefetch_partitions(self, position, partition):
+        """
+        Create the partitions for the ``prefetch`` fragments following ``position`` along
+        the leading aggregated dimension. Each covers the whole following fragment along 
+        that dimension, and the same extent as ``partition`` in all other dimensions.
+        """
+        dim = [d for d, n in enumerate(self.fragment_space) if n > 1][0]
+        extent = list(partition.get_extent())
+
+        neighbours = []
+        for step in range(1, self._prefetch + 1):
+            next_pos = list(position)
+            next_pos[dim] += step
+            if next_pos[dim] >= self.fragment_space[dim]:
+                break
+
+            fragment = self._get_fragment(tuple(next_pos))
+            if isinstance(fragment, ConstantPartition):
+                continue
+
+            next_extent = [
+                slice(None) if d == dim else extent[d] for d in range(len(extent))
+            ]
+            neighbours.append(fragment.copy(extent=next_extent))
+        return neighbours
 
     def _optimise_chunks(self):
         """
@@ -358,146 +1048,309 @@ class FragmentArrayWrapper(ArrayLike):
 
                 self.chunks[nd] = opsize
 
-    def _create_partitions(self, fragments):
+    def _create_partitions(self, fragment_ranges=None):
         """
         Creates a partition structure that falls along the existing fragment boundaries.
         This is done by simply chunking each fragment given the user provided chunks, rather 
         than the whole array, because user provided chunk sizes apply to each fragment equally.
 
-        :param fragments:       (dict) The set of fragment objects (CFAPartitions) in ``fragment space``
-            before any chunking is applied.
+        :param fragment_ranges:     (list) The ``(start, stop)`` range of fragment indices
+            to partition along each dimension, defaults to the whole ``fragment space``.
 
-        :returns:   The set of dask chunks to provide to dask when building the array and the corresponding
-            set of copied fragment objects for each partition.
+        :returns:   The set of dask chunks to provide to dask when building the array and the 
+            ``FragmentBlockDep`` which produces the partition object for each dask chunk.
         """
         if 'optimised' in self.chunks.items():
-            # Running on standard dask chunking mode.
+            # Running on standard dask chunking mode.
             self._optimise_chunks()
+
+        if fragment_ranges is None:
+            fragment_ranges = [(0, n) for n in self.fragment_space]
+
+        origin = tuple(start for start, stop in fragment_ranges)
             
         dask_chunks       = [[] for i in range(self.ndim)]
         fragment_coverage = [[] for i in range(self.ndim)]
-        for dim in range(self.ndim):
-            for x in range(self.fragment_space[dim]):
+        fragment_starts   = [[] for i in range(self.ndim)]
+        for dim, (start, stop) in enumerate(fragment_ranges):
+            for x in range(start, stop):
                 # Position eg. 0, 0, X
-                position = [0 for i in range(self.ndim)]
+                position = list(origin)
                 position[dim] = x 
 
-                fragment = fragments[tuple(position)]
-
                 dchunks = normalize_partition_chunks( # Needs the chunks
                     self.chunks,
-                    fragment.shape,
+                    self.fragment_info.shape(position),
                     dtype=self.dtype,
                     named_dims=self.named_dims
                 )
 
                 dask_chunks[dim] += dchunks[dim]
                 fragment_coverage[dim].append(len(dchunks[dim]))
+                fragment_starts[dim].append(int(self.fragment_info.starts[dim][x]))
+
+            # Partition offsets are relative to the first fragment in this set.
+            fragment_starts[dim] = [f - fragment_starts[dim][0] for f in fragment_starts[dim]]
+
+        fragment_index, local_start, local_stop = self._map_partitions(
+            dask_chunks, 
+            fragment_coverage, 
+            fragment_starts
+        )
+
+        dask_chunks = tuple(tuple(c) for c in dask_chunks)
+        partitions  = FragmentBlockDep(
+            dask_chunks,
+            self._get_fragment,
+            origin,
+            fragment_index,
+            local_start=local_start,
+            local_stop=local_stop,
+            prefetch=self._get_prefetch_factory(),
+        )
+
+        return dask_chunks, partitions
+
+    def _map_partitions(self, dask_chunks, fragment_coverage, fragment_starts):
+        """
+        Map every partition index to its source fragment and the extent of the 
+        partition local to that fragment, one dimension at a time. Each partition 
+        then only needs a lookup in each dimension rather than a search over all 
+        fragments.
+
+        :param dask_chunks:         (list) The partition sizes along each dimension.
+
+        :param fragment_coverage:   (list) The number of partitions covering each 
+            fragment along each dimension.
+
+        :param fragment_starts:     (list) The start index in ``array space`` of each 
+            fragment along each dimension.
+
+        :returns:   The fragment index, local start and local stop of every partition
+            per dimension, as lists of integers.
+        """
 
         def outer_cumsum(array):
-            cumsum = np.cumsum(array)
-            cumsum = np.append(cumsum, 0)
-            return np.roll(cumsum,1)
-        
-        def global_combine(internal, external):
-            local = []
-            for dim in range(len(internal)):
-                start = internal[dim].start - external[dim].start
-                stop  = internal[dim].stop  - external[dim].start
-                local.append(slice(start,stop))
-            return local
-
-        fragment_cumul  = [outer_cumsum(d) for d in fragment_coverage]
-        partition_cumul = [outer_cumsum(p) for p in dask_chunks]
-        partition_space = [len(d) for d in dask_chunks]
-
-        partitions = {}
-        partition_coords = get_chunk_positions(partition_space)
-        for coord in partition_coords:
-            fragment_coord = []
-            internal = []
-            for dim, c in enumerate(coord):
-                cumulative = fragment_cumul[dim]
-
-                if c < cumulative[0]:
-                    cumul = cumulative[0]
-                else:
-                    cumul = max(filter(lambda l: l <= c, cumulative))
+            cumsum = np.cumsum(array, dtype=np.int64)
+            return np.concatenate(([0], cumsum))
 
-                fc = np.where(cumulative == cumul)[0]
-                fragment_coord.append(int(fc.squeeze()))
+        fragment_index, local_start, local_stop = [], [], []
+        for dim in range(len(dask_chunks)):
+            fragment_cumul  = outer_cumsum(fragment_coverage[dim])
+            partition_cumul = outer_cumsum(dask_chunks[dim])
 
-                ext = slice(
-                    partition_cumul[dim][c],
-                    partition_cumul[dim][c+1]
-                )
-                internal.append(ext)
-            
-            # Currently applying GLOBAl extent not internal extent to each fragment.
+            findex = np.searchsorted(
+                fragment_cumul, 
+                np.arange(len(dask_chunks[dim])), 
+                side='right'
+            ) - 1
 
-            source   = fragments[tuple(fragment_coord)]
-            external = source.global_extent
-            extent   = global_combine(internal, external)
+            offset = np.asarray(fragment_starts[dim], dtype=np.int64)[findex]
 
-            partitions[coord] = source.copy(extent=extent)
+            fragment_index.append(findex.tolist())
+            local_start.append((partition_cumul[:-1] - offset).tolist())
+            local_stop.append((partition_cumul[1:] - offset).tolist())
 
-        return dask_chunks, partitions
+        return fragment_index, local_start, local_stop
 
-    def _assemble_dsk_dict(self, partitions, array_name):
+    def _apply_substitutions(self):
+        """
+        Perform substitutions for this fragment array. Substitutions are applied to a
+        copy of the decoded fragments, so the decoded locations are never substituted 
+        more than once and may be shared with other arrays.
+        """
+        substitutions = self._substitutions or []
+        if not isinstance(substitutions, list):
+            substitutions = [substitutions]
+
+        fragment_info = self._decoded_info
+        if substitutions:
+            fragment_info = copy.copy(fragment_info)
+            for s in substitutions:
+                base, substitution = s.split(':')
+                fragment_info.substitute(base, substitution)
+
+        self._fragment_info = fragment_info
+        self._substituted   = self._substitutions
+                
+    def _assemble_array(self, partitions, array_name, dask_chunks, shape=None):
+
+        """
+        Assemble the dask/dask-like array for this FragmentArrayWrapper from a Blockwise
+        graph layer over the ``partitions`` and the set of dask chunks. Partition tasks
+        are only generated for the blocks that remain after the graph is culled. Also 
+        provides an array name for the dask tree to register.
         """
-        Assemble the base ``dsk`` task dependency graph which includes the fragment objects 
-        plus the method to index each object (with locking).
 
-        :param partitions:   (dict) The set of partition objects (CFAPartition) with 
-            their positions in the relevant ``space``.
+        out_ind = tuple(range(len(dask_chunks)))
+        layer = core_blockwise(
+            _get_partition,
+            array_name,
+            out_ind,
+            partitions,
+            out_ind,
+            numblocks={},
+            _data_producer=True,
+        )
+        if is_recording(self._instrument):
+            # Identify the fragment read by each task, e.g. in the distributed task stream.
+            layer.annotations = (layer.annotations or {}) | {
+                'cfapyx_array': array_name,
+                'cfapyx_fragment': partial(_fragment_annotation, partitions),
+            }
+        graph = HighLevelGraph.from_collections(array_name, layer, dependencies=())
+
+        meta = da.empty(shape or self.shape, dtype=self.dtype)
+        darr = da.Array(graph, array_name, chunks=dask_chunks, dtype=self.dtype, meta=meta)
+        return darr
+
+class ConstantPartition:
+    """
+    Partition of the aggregated array where every value is the same, as for fragments
+    defined by a ``value`` rather than a fragment file. No file is opened and no memory
+    is allocated for the data, which is served as a read-only broadcast of the value.
+    """
+
+    description = 'Constant-valued partition with no file access'
 
-        :returns:       A task dependency graph with all the partitions included to use 
-            when constructing the dask array.
+    def __init__(self, value, shape, dtype=None, position=None, global_extent=None):
         """
+        :param value:           (obj) The single value of every element in this partition.
 
-        dsk = {}
-        for part_position in partitions.keys():
-            part = partitions[part_position]
+        :param shape:           (tuple) The shape of the partition in ``array space``.
 
-            p_identifier = f"{part.__class__.__name__}-{tokenize(part)}"
-            dsk[p_identifier] = part
-            dsk[array_name + part_position] = (
-                getter, 
-                p_identifier,
-                part.get_extent(),
-                False,
-                getattr(part, "_lock", False) # Check version cf-python
-            )
-        return dsk
+        :param dtype:           (obj) The datatype of the aggregated array.
 
-    def _apply_substitutions(self):
+        :param position:        (tuple) The position of the source fragment in ``fragment space``.
+
+        :param global_extent:   (list) The slice objects locating this partition in the 
+            whole array.
         """
-        Perform substitutions for this fragment array.
+        self.value    = value
+        self.shape    = tuple(int(s) for s in shape)
+        self.dtype    = dtype
+        self.position = position
+        self.global_extent = global_extent
+
+    def __array__(self, dtype=None, copy=None):
+        value = np.array(self.value, dtype=dtype or self.dtype)
+        return np.broadcast_to(value, self.shape)
+
+    def copy(self, extent=None):
         """
-        if not self._substitutions:
-            return
+        Create a new constant partition covering ``extent`` of this one.
+        """
+        if not extent:
+            return ConstantPartition(
+                self.value, self.shape, dtype=self.dtype, 
+                position=self.position, global_extent=self.global_extent
+            )
 
-        if not isinstance(self._substitutions, list):
-            self._substitutions = [self._substitutions]
+        shape = tuple(
+            len(range(*e.indices(s))) for e, s in zip(extent, self.shape)
+        )
+        global_extent = self.global_extent
+        if global_extent is not None:
+            global_extent = combine_extent(global_extent, extent)
 
-        for s in self._substitutions:
-            base, substitution = s.split(':')
-            for f in self.fragment_info.keys():
+        return ConstantPartition(
+            self.value, shape, dtype=self.dtype, 
+            position=self.position, global_extent=global_extent
+        )
 
-                if isinstance(self.fragment_info[f]['location'], str):
-                    self.fragment_info[f]['location'] = self.fragment_info[f]['location'].replace(base, substitution)
-                else:
-                    for finfo in self.fragment_info[f]['location']:
-                        finfo = finfo.replace(base, substitution)
-                
-    def _assemble_array(self, dsk, array_name, dask_chunks):
+class FragmentBlockDep(ArrayBlockwiseDep):
+    """
+    Blockwise-IO argument that produces the partition object (CFAPartition) for each 
+    dask block on demand, from the per-dimension mapping of blocks to fragments. 
+    Partitions are only created for blocks that remain once the graph is culled.
+    """
 
+    def __init__(
+            self,
+            chunks,
+            fragment_factory,
+            origin,
+            fragment_index,
+            local_start=None,
+            local_stop=None,
+            prefetch=None,
+        ):
         """
-        Assemble the dask/dask-like array for this FragmentArrayWrapper from the 
-        assembled ``dsk`` dict and set of dask chunks. Also provides an array name
-        for the dask tree to register.
+        :param chunks:              (tuple) The dask chunks for the array.
+
+        :param fragment_factory:    (callable) Creates the fragment object for a position 
+            in ``fragment space``.
+
+        :param origin:              (tuple) The position of the first fragment included in 
+            this array, in ``fragment space``.
+
+        :param fragment_index:      (list) The fragment index relative to ``origin`` for each
+            block index, per dimension.
+
+        :param local_start:         (list) The start of each block within its fragment, per 
+            dimension. If not given, each block is a whole fragment.
+
+        :param local_stop:          (list) The stop of each block within its fragment, per 
+            dimension.
+
+        :param prefetch:            (callable) Creates the partitions to read ahead for a 
+            partition, given its position in ``fragment space``. If None, partitions are 
+            read without the prefetch buffer.
         """
+        super().__init__(chunks)
+
+        self.fragment_factory = fragment_factory
+        self.origin           = origin
+        self.fragment_index   = fragment_index
+        self.local_start      = local_start
+        self.local_stop       = local_stop
+        self.prefetch         = prefetch
+
+    def __getitem__(self, idx):
+        position = tuple(
+            o + self.fragment_index[dim][i] for dim, (o, i) in enumerate(zip(self.origin, idx))
+        )
+        fragment = self.fragment_factory(position)
 
-        meta = da.empty(self.shape, dtype=self.dtype)
-        darr = da.Array(dsk, array_name, chunks=dask_chunks, dtype=self.dtype, meta=meta)
-        return darr
\ No newline at end of file
+        if self.local_start is not None:
+            extent = [
+                slice(self.local_start[dim][i], self.local_stop[dim][i]) for dim, i in enumerate(idx)
+            ]
+            fragment = fragment.copy(extent=extent)
+
+        if self.prefetch is not None and not isinstance(fragment, ConstantPartition):
+            fragment.prefetch = self.prefetch(position, fragment)
+
+        return fragment
+
+    def keys(self):
+        return product(*(range(n) for n in self.numblocks))
+
+def _fragment_annotation(partitions, key) -> dict:
+    """
+    Dask task annotation identifying the fragment read by the task ``key``, from the
+    ``FragmentBlockDep`` of the array.
+    """
+    partition = partitions[tuple(key[1:])]
+    return {
+        'location': getattr(partition, 'filename', None),
+        'address': str(getattr(partition, 'address', None)),
+        'position': partition.position,
+    }
+
+def _get_partition(partition):
+    """
+    Task function applied to each partition object in the dask graph, selecting the 
+    whole of the current extent of the partition. Locking is handled by the partition for the file
+    it reads, see ``FragmentLockManager``. Constant partitions are served without any
+    file access.
+    """
+    if isinstance(partition, ConstantPartition):
+        return np.asarray(partition)
+
+    return getter(
+        partition,
+        (slice(None),) * partition.ndim,
+        False,
+        False
+    )